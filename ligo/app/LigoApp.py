@@ -17,9 +17,10 @@ class SimError(Exception):
 
 class LigoApp:
 
-    def __init__(self, specification_path: Path, result_path: Path):
+    def __init__(self, specification_path: Path, result_path: Path, resume: bool = False):
         self._specification_path = Path(specification_path)
         self._result_path = Path(os.path.relpath(result_path))
+        self._resume = resume
 
         PathBuilder.build(self._result_path)
 
@@ -34,7 +35,8 @@ class LigoApp:
 
             instructions = symbol_table.get_by_type(SymbolType.INSTRUCTION)
             output = symbol_table.get("output")
-            model = SemanticModel([instruction.item for instruction in instructions], self._result_path, output)
+            model = SemanticModel([instruction.item for instruction in instructions], self._result_path, output,
+                                  resume=self._resume)
             result = model.run()
 
             print_log(f"LIgO: finished simulation.\n", include_datetime=True)
@@ -45,16 +47,17 @@ class LigoApp:
 
 
 def run_ligo(namespace: argparse.Namespace):
-    if os.path.isdir(namespace.result_path) and len(os.listdir(namespace.result_path)) != 0:
+    if os.path.isdir(namespace.result_path) and len(os.listdir(namespace.result_path)) != 0 and not namespace.resume:
         raise ValueError(
-            f"Directory {namespace.result_path} already exists. Please specify a new output directory for the analysis.")
+            f"Directory {namespace.result_path} already exists. Please specify a new output directory for the analysis "
+            f"or use --resume to continue the simulation stored there.")
     PathBuilder.build(namespace.result_path)
 
     logging.basicConfig(filename=Path(namespace.result_path) / "log.txt", level=logging.INFO,
                         format='%(asctime)s %(levelname)s: %(message)s')
     warnings.showwarning = lambda message, category, filename, lineno, file=None, line=None: logging.warning(message)
 
-    app = LigoApp(namespace.specification_path, namespace.result_path)
+    app = LigoApp(namespace.specification_path, namespace.result_path, resume=namespace.resume)
     app.run()
 
 
@@ -63,6 +66,8 @@ def main():
     parser.add_argument("specification_path",
                         help="Path to specification YAML file. Always used to define the simulation.")
     parser.add_argument("result_path", help="Output directory path.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted simulation from the last checkpoint stored in the output directory.")
 
     namespace = parser.parse_args()
     namespace.specification_path = Path(namespace.specification_path)
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import List
 from uuid import uuid4
 
 from ligo.data_model.dataset.Dataset import Dataset
@@ -26,6 +27,11 @@ class ElementDataset(Dataset):
         self.name = name
         self.element_class_name = element_class_name
 
+    @classmethod
+    def _make_file_names(cls, file_count: int, path: Path) -> List[Path]:
+        return [path / f"batch{''.join(['0' for i in range(1, len(str(file_count)) - len(str(index)) + 1)])}{index}.npy"
+                for index in range(1, file_count + 1)]
+
     def get_data(self, batch_size: int = 10000):
         self.element_generator.file_list = self.filenames
         return self.element_generator.build_element_generator()
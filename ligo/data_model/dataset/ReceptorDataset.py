@@ -2,7 +2,7 @@ import copy
 import logging
 import math
 from pathlib import Path
-from typing import List
+from typing import List, Dict, Type
 
 import numpy as np
 import pandas as pd
@@ -23,8 +23,7 @@ class ReceptorDataset(ElementDataset):
     def build_from_objects(cls, receptors: List[Receptor], file_size: int, path: Path, name: str = None, labels: dict = None):
 
         file_count = math.ceil(len(receptors) / file_size)
-        file_names = [path / f"batch{''.join(['0' for i in range(1, len(str(file_count)) - len(str(index)) + 1)])}{index}.npy"
-                      for index in range(1, file_count + 1)]
+        file_names = cls._make_file_names(file_count, path)
 
         for index in range(file_count):
             receptor_matrix = np.core.records.fromrecords(
@@ -35,6 +34,25 @@ class ReceptorDataset(ElementDataset):
         return ReceptorDataset(filenames=file_names, file_size=file_size, name=name, labels=labels,
                                element_class_name=type(receptors[0]).__name__ if len(receptors) > 0 else None)
 
+    @classmethod
+    def build_from_columns(cls, columns: Dict[str, np.ndarray], receptor_class: Type[Receptor], file_size: int, path: Path,
+                           name: str = None, labels: dict = None):
+        """Builds the dataset from arrays with one value per receptor for each of the record names of the receptor class, without creating
+        Receptor objects"""
+
+        receptor_count = len(columns['identifier'])
+        file_count = math.ceil(receptor_count / file_size)
+        file_names = cls._make_file_names(file_count, path)
+        record_names = receptor_class.get_record_names()
+
+        for index in range(file_count):
+            receptor_matrix = np.core.records.fromarrays([np.asarray(columns[key][index * file_size:(index + 1) * file_size])
+                                                          for key in record_names], names=record_names)
+            np.save(str(file_names[index]), receptor_matrix, allow_pickle=False)
+
+        return ReceptorDataset(filenames=file_names, file_size=file_size, name=name, labels=labels,
+                               element_class_name=receptor_class.__name__)
+
     def get_metadata(self, field_names: list, return_df: bool = False):
         """Returns a dict or an equivalent pandas DataFrame with metadata information from Receptor objects for provided field names"""
         result = {field: [] for field in field_names}
@@ -2,7 +2,7 @@ import copy
 import logging
 import math
 from pathlib import Path
-from typing import List
+from typing import List, Dict
 
 import numpy as np
 import pandas as pd
@@ -25,8 +25,7 @@ class SequenceDataset(ElementDataset):
     def build_from_objects(cls, sequences: List[ReceptorSequence], file_size: int, path: Path, name: str = None, labels: dict = None):
 
         file_count = math.ceil(len(sequences) / file_size)
-        file_names = [path / f"batch{''.join(['0' for i in range(1, len(str(file_count)) - len(str(index)) + 1)])}{index}.npy"
-                      for index in range(1, file_count + 1)]
+        file_names = cls._make_file_names(file_count, path)
 
         for index in range(file_count):
             sequence_matrix = np.core.records.fromrecords([seq.get_record() for seq in sequences[index * file_size:(index + 1) * file_size]],
@@ -35,6 +34,23 @@ class SequenceDataset(ElementDataset):
 
         return SequenceDataset(filenames=file_names, file_size=file_size, name=name, labels=labels)
 
+    @classmethod
+    def build_from_columns(cls, columns: Dict[str, np.ndarray], file_size: int, path: Path, name: str = None, labels: dict = None):
+        """Builds the dataset from arrays with one value per sequence for each of ReceptorSequence record names (e.g., metadata as JSON
+        strings), without creating ReceptorSequence objects"""
+
+        sequence_count = len(columns['identifier'])
+        file_count = math.ceil(sequence_count / file_size)
+        file_names = cls._make_file_names(file_count, path)
+        record_names = ReceptorSequence.get_record_names()
+
+        for index in range(file_count):
+            sequence_matrix = np.core.records.fromarrays([np.asarray(columns[key][index * file_size:(index + 1) * file_size])
+                                                          for key in record_names], names=record_names)
+            np.save(str(file_names[index]), sequence_matrix, allow_pickle=False)
+
+        return SequenceDataset(filenames=file_names, file_size=file_size, name=name, labels=labels)
+
     def __init__(self, **kwargs):
 
         super().__init__(**{**kwargs, **{'element_class_name': ReceptorSequence.__name__}})
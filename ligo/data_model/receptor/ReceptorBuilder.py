@@ -1,6 +1,6 @@
 import itertools
 import warnings
-from typing import List
+from typing import List, Type
 
 from ligo.data_model.receptor.BCKReceptor import BCKReceptor
 from ligo.data_model.receptor.BCReceptor import BCReceptor
@@ -28,6 +28,12 @@ class ReceptorBuilder:
             warnings.warn(f"ReceptorBuilder: attempt to build_from_objects receptor with chains {sequences.keys()}, returning None...")
             return None
 
+    @classmethod
+    def get_receptor_class(cls, chains: List[Chain]) -> Type[Receptor]:
+        """Given a list of 2 chain objects, returns the class of the receptor with these chains"""
+        return {ChainPair.TRA_TRB: TCABReceptor, ChainPair.TRG_TRD: TCGDReceptor, ChainPair.IGH_IGL: BCReceptor,
+                ChainPair.IGH_IGK: BCKReceptor}[ChainPair.get_chain_pair(chains)]
+
     @classmethod
     def build_objects(cls, sequences: List[ReceptorSequence]) -> List[Receptor]:
         receptors = []
@@ -74,12 +74,6 @@ class Repertoire(DatasetItem):
         if sequence_id is None or len(sequence_id) == 0 or any(identifier is None for identifier in sequence_id):
             sequence_id = np.arange(sequence_count).astype(str)
 
-        identifier = uuid4().hex if identifier is None else identifier
-
-        filename_base = filename_base if filename_base is not None else identifier
-
-        data_filename = path / f"{filename_base}.npy"
-
         field_list, values, dtype = Repertoire.process_custom_lists(custom_lists)
 
         for field in Repertoire.FIELDS:
@@ -89,11 +83,24 @@ class Repertoire(DatasetItem):
                 dtype.append((field, np.array(values[-1]).dtype))
 
         repertoire_matrix = np.array(list(map(tuple, zip(*values))), order='F', dtype=dtype)
+
+        return cls.build_from_array(repertoire_matrix, path, metadata, filename_base, identifier)
+
+    @classmethod
+    def build_from_array(cls, repertoire_matrix: np.ndarray, path: Path, metadata: dict = None, filename_base: str = None,
+                         identifier: str = None):
+        """Builds the repertoire from a structured array with one field per sequence attribute (as stored in repertoire files)"""
+
+        identifier = uuid4().hex if identifier is None else identifier
+
+        filename_base = filename_base if filename_base is not None else identifier
+
+        data_filename = path / f"{filename_base}.npy"
         np.save(str(data_filename), repertoire_matrix, allow_pickle=False)
 
         metadata_filename = path / f"{filename_base}_metadata.yaml"
         metadata = {} if metadata is None else metadata
-        metadata["field_list"] = field_list
+        metadata["field_list"] = list(repertoire_matrix.dtype.names)
         with metadata_filename.open("w") as file:
             yaml.dump(metadata, file)
 
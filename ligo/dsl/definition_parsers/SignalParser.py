@@ -1,8 +1,11 @@
 import importlib
 import sys
-from inspect import getmembers, isfunction
+import typing
+from inspect import getmembers, isfunction, signature
 from pathlib import Path
 
+from bionumpy.encoded_array import EncodedArray, EncodedRaggedArray
+
 from ligo.dsl.symbol_table.SymbolTable import SymbolTable
 from ligo.dsl.symbol_table.SymbolType import SymbolType
 from ligo.simulation.implants.Signal import Signal
@@ -13,6 +16,7 @@ from ligo.util.ParameterValidator import ParameterValidator
 class SignalParser:
     keyword = "signals"
     custom_func_keys = ['source_file', 'is_present_func']
+    custom_func_columns = ['sequence_aa', 'sequence', 'v_call', 'j_call']
 
     @staticmethod
     @log
@@ -47,7 +51,43 @@ def _parse_custom_func_signal(key: str, signal_spec: dict) -> Signal:
     assert len(is_present_func) == 1, \
         f"Signal {key}: no function named {signal_spec['is_present_func']}."
 
-    return Signal(id=key, is_present_custom_func=is_present_func[0][1])
+    return Signal(id=key, is_present_custom_func=is_present_func[0][1],
+                  custom_func_batch_columns=_get_custom_func_batch_columns(key, is_present_func[0][1]))
+
+
+def _get_custom_func_batch_columns(key: str, func) -> typing.Union[dict, None]:
+    """
+    Detects if the custom function is batched, i.e., if any of its parameters is annotated as a list (e.g., List[str]) or as a bionumpy
+    encoded array; returns None for per-sequence functions, and otherwise for each parameter, whether the column is passed as a list of
+    strings (True) or as an encoded array (False)
+    """
+    try:
+        annotations = typing.get_type_hints(func)
+    except Exception:
+        annotations = getattr(func, '__annotations__', {})
+
+    parameters = list(signature(func).parameters.keys())
+    as_list = {param: _is_list_annotation(annotations.get(param, None)) for param in parameters}
+    as_encoded_array = {param: _is_encoded_array_annotation(annotations.get(param, None)) for param in parameters}
+
+    if not any(as_list.values()) and not any(as_encoded_array.values()):
+        return None
+
+    assert all(as_list[param] or as_encoded_array[param] for param in parameters), \
+        f"Signal {key}: for batched custom functions, all parameters have to be annotated either as lists or as encoded arrays, got: " \
+        f"{annotations}."
+    ParameterValidator.assert_all_in_valid_list(parameters, SignalParser.custom_func_columns, SignalParser.__name__,
+                                                f'{key}:is_present_func parameters')
+
+    return as_list
+
+
+def _is_list_annotation(annotation) -> bool:
+    return annotation is list or typing.get_origin(annotation) is list
+
+
+def _is_encoded_array_annotation(annotation) -> bool:
+    return isinstance(annotation, type) and issubclass(annotation, (EncodedArray, EncodedRaggedArray))
 
 
 def _parse_signal_with_motifs(key: str, signal_spec: dict, symbol_table: SymbolTable) -> Signal:
@@ -12,12 +12,13 @@ class LigoSimParser:
 
         location = LigoSimParser.__name__
         keys = ["simulation", "type", 'sequence_batch_size', "max_iterations", "export_p_gens",
-                "number_of_processes"]
+                "number_of_processes", "adaptive_batch_size", "target_iterations", "max_sequence_batch_size"]
         ParameterValidator.assert_keys(instruction.keys(), keys, location, key)
 
-        for param_key in ['export_p_gens']:
+        for param_key in ['export_p_gens', 'adaptive_batch_size']:
             ParameterValidator.assert_type_and_value(instruction[param_key], bool, location, param_key)
-        for param_key in ['max_iterations', 'sequence_batch_size', 'number_of_processes']:
+        for param_key in ['max_iterations', 'sequence_batch_size', 'number_of_processes', 'target_iterations',
+                          'max_sequence_batch_size']:
             ParameterValidator.assert_type_and_value(instruction[param_key], int, location, param_key, 1)
 
         simulation = get_simulation_from_symbol_table(instruction['simulation'], symbol_table, location)
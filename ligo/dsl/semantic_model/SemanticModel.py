@@ -7,12 +7,13 @@ from ligo.workflows.instructions.Instruction import Instruction
 
 class SemanticModel:
 
-    def __init__(self, instructions: list, result_path: Path, output=None):
+    def __init__(self, instructions: list, result_path: Path, output=None, resume: bool = False):
         assert all(isinstance(instruction, Instruction) for instruction in instructions), \
             "SemanticModel: error occurred in parsing: check instruction definitions in the configuration file."
         self.instructions = instructions
         self.result_path = result_path
         self.output = output
+        self.resume = resume
 
     def run(self):
         instruction_states = self.run_instructions()
@@ -31,7 +32,7 @@ class SemanticModel:
         instruction_states = []
         for index, instruction in enumerate(self.instructions):
             print_log(f"Instruction {index+1}/{len(self.instructions)} has started.", include_datetime=True)
-            result = instruction.run(result_path=self.result_path)
+            result = instruction.run(result_path=self.result_path, resume=self.resume)
             instruction_states.append(result)
             print_log(f"Instruction {index+1}/{len(self.instructions)} has finished.", include_datetime=True)
         return instruction_states
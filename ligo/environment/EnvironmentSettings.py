@@ -19,18 +19,20 @@ class EnvironmentSettings:
     default_params_path = root_path / "ligo/config/default_params"
     tmp_test_path = root_path / "test/tmp"
     default_analysis_path = root_path / "analysis_runs"
-    cache_path = root_path / "cache"
+    default_cache_path = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "ligo"
+    cache_path = Path(os.environ[Constants.CACHE_PATH]) if Constants.CACHE_PATH in os.environ else default_cache_path
     tmp_cache_path = tmp_test_path / "cache"
     html_templates_path = root_path / "ligo/presentation/html/templates"
     specs_docs_path = root_path / "docs_source/specs"
     source_docs_path = root_path / "docs_source"
     max_sequence_length = 20
     low_memory = True
+    store_background_batches = False  # for debugging: keep batches of generated sequences in gen_model/ for each simulation item
 
     @staticmethod
     def reset_cache_path():
-        EnvironmentSettings.cache_path = EnvironmentSettings.root_path / "cache"
-        del os.environ[Constants.CACHE_PATH]
+        EnvironmentSettings.cache_path = EnvironmentSettings.default_cache_path
+        os.environ.pop(Constants.CACHE_PATH, None)
 
     @staticmethod
     def set_cache_path(path: Path):
@@ -57,7 +57,19 @@ class LIgOSimulationHTMLBuilder:
                         start=base_path)
                 } for format_name in state.formats
             ],
-            "simulation_items": [Util.to_dict_recursive(sim_item, base_path) for sim_item in state.simulation.sim_items]
+            "simulation_items": [Util.to_dict_recursive(sim_item, base_path) for sim_item in state.simulation.sim_items],
+            "metrics": LIgOSimulationHTMLBuilder.make_metrics_map(state, base_path)
         }
 
         return html_map
+
+    @staticmethod
+    def make_metrics_map(state: LigoSimState, base_path: Path) -> dict:
+        if state.metrics_paths is not None and len(state.metrics_paths) > 0:
+            return {
+                "stage_table": Util.get_table_string_from_csv(state.metrics_paths['stages']),
+                "signal_table": Util.get_table_string_from_csv(state.metrics_paths['signals']),
+                "iterations_download_link": os.path.relpath(path=state.metrics_paths['iterations'], start=base_path)
+            }
+        else:
+            return None
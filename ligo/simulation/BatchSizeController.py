@@ -0,0 +1,73 @@
+import math
+from typing import Dict
+
+
+class BatchSizeController:
+    """
+    Chooses the number of sequences to generate in the next iteration of the simulation for one simulation item based on the yield
+    observed so far.
+
+    After each iteration, the number of sequences that were kept per signal (and for sequences without signal) after rejection
+    sampling or implanting and filtering by p_gen is divided by the number of generated sequences to estimate the acceptance rate per
+    signal. The next batch is then sized so that the signal that needs the most sequences (relative to its acceptance rate) would be
+    filled by the end of iteration `target_iterations` (or in the next iteration once that iteration is reached). If no sequences
+    were kept for a signal yet, the batch size is doubled. The batch size is always between `min_batch_size` and `max_batch_size`,
+    where the latter limits the memory needed per batch.
+    """
+
+    SAFETY_FACTOR = 1.2  # generate slightly more than estimated to account for variance in acceptance
+    MIN_BATCH_SIZE = 10
+
+    def __init__(self, initial_batch_size: int, target_iterations: int, max_batch_size: int, min_batch_size: int = MIN_BATCH_SIZE):
+        self.batch_size = min(initial_batch_size, max_batch_size)
+        self._target_iterations = target_iterations
+        self._max_batch_size = max_batch_size
+        self._min_batch_size = min(min_batch_size, self.batch_size)
+        self._generated_count = 0
+        self._accepted_count = {}
+
+    def update(self, generated_count: int, seqs_per_signal_count_before: Dict[str, int], seqs_per_signal_count_after: Dict[str, int]):
+        """Records how many sequences per signal were kept from a batch of generated_count sequences"""
+        self._generated_count += generated_count
+        for key, count in seqs_per_signal_count_before.items():
+            if count > 0:
+                self._accepted_count[key] = self._accepted_count.get(key, 0) + count - seqs_per_signal_count_after[key]
+
+    def get_state(self) -> dict:
+        """Returns the current batch size and the counts the acceptance rates are estimated from, with basic types only, so that they
+        can be stored in a checkpoint; keys of the counts may be tuples, so the counts are stored as a list of [key, count] pairs"""
+        return {'batch_size': int(self.batch_size), 'generated_count': int(self._generated_count),
+                'accepted_count': [[list(key) if isinstance(key, tuple) else key, int(count)] for key, count in self._accepted_count.items()]}
+
+    def set_state(self, state: dict):
+        self.batch_size = state['batch_size']
+        self._generated_count = state['generated_count']
+        self._accepted_count = {tuple(key) if isinstance(key, list) else key: count for key, count in state['accepted_count']}
+
+    def acceptance_rates(self) -> Dict[str, float]:
+        return {key: count / self._generated_count for key, count in self._accepted_count.items()} \
+            if self._generated_count > 0 else {}
+
+    def predict_remaining_iterations(self, seqs_per_signal_count: Dict[str, int]) -> float:
+        """Returns the expected number of iterations with the current batch size to fill all quotas, or inf if it cannot be estimated"""
+        rates = self.acceptance_rates()
+        iterations = [math.ceil(count / (rates[key] * self.batch_size)) if rates.get(key, 0) > 0 else math.inf
+                      for key, count in seqs_per_signal_count.items() if count > 0]
+        return max(iterations) if len(iterations) > 0 else 0
+
+    def next_batch_size(self, seqs_per_signal_count: Dict[str, int], iteration: int) -> int:
+        """Returns the batch size for the given (upcoming) iteration"""
+        iterations_left = max(self._target_iterations - iteration + 1, 1)
+        rates = self.acceptance_rates()
+        remaining = {key: count for key, count in seqs_per_signal_count.items() if count > 0}
+
+        if len(remaining) > 0 and self._generated_count > 0:
+            if any(rates.get(key, 0) == 0 for key in remaining):
+                batch_size = self.batch_size * 2
+            else:
+                batch_size = max(math.ceil(count / rates[key] / iterations_left * BatchSizeController.SAFETY_FACTOR)
+                                 for key, count in remaining.items())
+
+            self.batch_size = int(min(max(batch_size, self._min_batch_size), self._max_batch_size))
+
+        return self.batch_size
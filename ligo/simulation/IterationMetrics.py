@@ -0,0 +1,145 @@
+import fcntl
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from ligo import Constants
+
+
+@dataclass
+class IterationMetrics:
+    """
+    Wall time per stage of the simulation loop (in seconds) and sequence counts for one iteration (one batch of generated sequences)
+    of a simulation item, or of a group of simulation items that share the generated sequences. One record per iteration is appended
+    to simulation_metrics.jsonl in the result directory of the instruction.
+
+    Stages are generation (including p_gens computed by the generative model), length_filtering, annotation, strategy (processing by
+    the simulation strategy or distribution of sequences between simulation items), p_gen (p_gen-based filtering) and writing (storing
+    the accepted sequences). When the batches are generated by worker processes, the times of the first three stages are measured in
+    the workers, while wall_time is the time the main process spent on the iteration, including waiting for the batch.
+
+    Sequence counts are given per simulation item and per signal ('no_signal' for sequences without signals): found is the number of
+    sequences in the annotated batch with the signal, accepted is the number of sequences stored for the simulation item and rejected
+    is the number of found sequences that were not stored (because the quota is already filled, or they were removed by the simulation
+    strategy or by p_gen-based filtering). With implanting, accepted sequences with signal can exceed the found ones.
+
+    If the generative model caches p_gens, p_gen_cache holds the numbers of cache hits and misses and the time spent computing p_gens
+    during the iteration (in whichever process the batch was generated or stored).
+    """
+    sim_items: List[str]
+    iteration: int
+    batch_size: int
+    generated: int = 0
+    wall_time: float = 0.
+    stage_times: Dict[str, float] = field(default_factory=dict)
+    found: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    accepted: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    rejected: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    bytes_written: int = 0
+    p_gen_cache: Dict[str, float] = field(default_factory=dict)
+
+    FILENAME = "simulation_metrics.jsonl"
+    STAGE_SUMMARY_FILENAME = "simulation_metrics_stages.csv"
+    SIGNAL_SUMMARY_FILENAME = "simulation_metrics_signals.csv"
+    STAGES = ('generation', 'length_filtering', 'annotation', 'strategy', 'p_gen', 'writing')
+    P_GEN_CACHE_STATS = ('hits', 'misses', 'time')
+
+    @contextmanager
+    def time(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_times[stage] = self.stage_times.get(stage, 0.) + time.perf_counter() - start
+
+    @contextmanager
+    def track_p_gens(self, generative_model):
+        before = generative_model.get_p_gen_stats()
+        try:
+            yield
+        finally:
+            for key, value in generative_model.get_p_gen_stats().items():
+                self.p_gen_cache[key] = self.p_gen_cache.get(key, 0) + value - before.get(key, 0)
+
+    def add_found(self, sim_item_name: str, sequences, counts: dict):
+        """Counts the sequences in the annotated batch with each signal from counts (and without signals for 'no_signal')"""
+        signal_matrix = sequences.get_signal_matrix()
+        signal_names = sequences.get_signal_names()
+        found = self.found.setdefault(sim_item_name, {})
+
+        for key in counts:
+            if signal_matrix is None:
+                mask = np.ones(len(sequences), dtype=bool) if key == 'no_signal' else np.zeros(len(sequences), dtype=bool)
+            elif key == 'no_signal':
+                mask = signal_matrix.sum(axis=1) == 0
+            else:
+                mask = signal_matrix[:, [signal_names.index(name) for name in key.split(Constants.SIGNAL_DELIMITER)]].all(axis=1)
+            found[key] = found.get(key, 0) + int(mask.sum())
+
+    def add_accepted(self, sim_item_name: str, counts_before: dict, counts_after: dict):
+        self.accepted[sim_item_name] = {key: int(counts_before[key] - counts_after[key]) for key in counts_before}
+        self.rejected[sim_item_name] = {key: max(self.found.get(sim_item_name, {}).get(key, 0) - count, 0)
+                                        for key, count in self.accepted[sim_item_name].items()}
+
+    def store(self, path: Path):
+        """Appends the record to the metrics file in the given directory; each record is written at once while holding a lock on the
+        file, so that simulation items running in parallel can share the file"""
+        with (path / IterationMetrics.FILENAME).open('a') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            file.write(json.dumps(asdict(self)) + "\n")
+
+    @classmethod
+    def remove_from_iteration(cls, path: Path, sim_items: List[str], iteration: int):
+        """Removes the records of the given (group of) simulation item(s) from the given iteration on; used when resuming from a
+        checkpoint, so that the iterations which are run again are not counted twice"""
+        if (path / cls.FILENAME).is_file():
+            with (path / cls.FILENAME).open('r+') as file:
+                fcntl.flock(file, fcntl.LOCK_EX)
+                records = [json.loads(line) for line in file if line.strip() != ""]
+                file.seek(0)
+                file.writelines(json.dumps(record) + "\n" for record in records
+                                if record['sim_items'] != sim_items or record['iteration'] < iteration)
+                file.truncate()
+
+    @classmethod
+    def load(cls, path: Path) -> List['IterationMetrics']:
+        if (path / cls.FILENAME).is_file():
+            with (path / cls.FILENAME).open('r') as file:
+                return [IterationMetrics(**json.loads(line)) for line in file if line.strip() != ""]
+        else:
+            return []
+
+    @classmethod
+    def summarise(cls, path: Path) -> Dict[str, Path]:
+        """
+        Summarises the metrics stored in the given directory into two tables: total time per stage, number of iterations, generated
+        sequences, written bytes and p_gen cache statistics per (group of) simulation item(s), and found, accepted and rejected sequence counts per simulation
+        item and signal; returns the paths to the metrics file and to the tables, or an empty dict if no metrics were stored
+        """
+        records = cls.load(path)
+        if len(records) == 0:
+            return {}
+
+        stages = pd.DataFrame([{'simulation_items': ", ".join(record.sim_items), 'iterations': 1, 'generated': record.generated,
+                                'bytes_written': record.bytes_written, 'wall_time': record.wall_time,
+                                **{stage: record.stage_times.get(stage, 0.) for stage in cls.STAGES},
+                                **{f"p_gen_cache_{key}": record.p_gen_cache.get(key, 0) for key in cls.P_GEN_CACHE_STATS}}
+                               for record in records])
+        stages = stages.groupby('simulation_items', sort=False).sum().reset_index().round(3)
+        stages.to_csv(path / cls.STAGE_SUMMARY_FILENAME, index=False)
+
+        signals = pd.DataFrame([{'simulation_item': sim_item, 'signal': key, 'found': record.found.get(sim_item, {}).get(key, 0),
+                                 'accepted': count, 'rejected': record.rejected.get(sim_item, {}).get(key, 0)}
+                                for record in records for sim_item, counts in record.accepted.items() for key, count in counts.items()],
+                               columns=['simulation_item', 'signal', 'found', 'accepted', 'rejected'])
+        signals = signals.groupby(['simulation_item', 'signal'], sort=False).sum().reset_index()
+        signals.to_csv(path / cls.SIGNAL_SUMMARY_FILENAME, index=False)
+
+        return {'iterations': path / cls.FILENAME, 'stages': path / cls.STAGE_SUMMARY_FILENAME,
+                'signals': path / cls.SIGNAL_SUMMARY_FILENAME}
@@ -0,0 +1,82 @@
+import os
+import random
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import yaml
+
+
+@dataclass
+class LigoSimCheckpoint:
+    """
+    Progress of sequence generation for one simulation item, stored after every iteration so that an interrupted simulation can
+    be resumed (see the --resume option of the ligo command).
+
+    It includes the iteration to continue from, the remaining number of sequences per signal, the size of each file in
+    processed_sequences/ at the time of the checkpoint (anything written after the checkpoint is discarded when resuming), the state
+    of random number generators, the state of the generative model if it keeps one (e.g., how many imported sequences were already
+    used), the batch size and acceptance counts of the adaptive batch size controller if it is used and, if importance sampling is used,
+    the target p_gen histogram of the simulation item.
+    """
+    iteration: int
+    seqs_per_signal_count: Dict[str, int]
+    file_sizes: Dict[str, int] = field(default_factory=dict)
+    finished: bool = False
+    numpy_random_state: list = None
+    random_state: list = None
+    target_p_gen_histogram: List[float] = None
+    p_gen_bins: List[float] = None
+    generative_model_state: dict = None
+    batch_size_controller_state: dict = None
+
+    FILENAME = "checkpoint.yaml"
+
+    @classmethod
+    def make(cls, iteration: int, seqs_per_signal_count: dict, sequence_paths: Dict[str, Path], finished: bool = False,
+             target_p_gen_histogram: np.ndarray = None, p_gen_bins: np.ndarray = None, generative_model_state: dict = None,
+             batch_size_controller_state: dict = None):
+        np_state = np.random.get_state()
+        py_state = random.getstate()
+
+        return LigoSimCheckpoint(iteration=iteration, seqs_per_signal_count={key: int(val) for key, val in seqs_per_signal_count.items()},
+                                 file_sizes={key: path.stat().st_size if path.is_file() else 0 for key, path in sequence_paths.items()},
+                                 finished=finished,
+                                 numpy_random_state=[np_state[0], np_state[1].tolist(), int(np_state[2]), int(np_state[3]), float(np_state[4])],
+                                 random_state=[py_state[0], list(py_state[1]), py_state[2]],
+                                 target_p_gen_histogram=target_p_gen_histogram.tolist() if target_p_gen_histogram is not None else None,
+                                 p_gen_bins=p_gen_bins.tolist() if p_gen_bins is not None else None,
+                                 generative_model_state=generative_model_state,
+                                 batch_size_controller_state=batch_size_controller_state)
+
+    @classmethod
+    def load(cls, path: Path):
+        """Returns the checkpoint stored in the given directory or None if there is no checkpoint"""
+        if (path / cls.FILENAME).is_file():
+            with (path / cls.FILENAME).open('r') as file:
+                return LigoSimCheckpoint(**yaml.safe_load(file))
+        else:
+            return None
+
+    def store(self, path: Path):
+        tmp_path = path / f"{LigoSimCheckpoint.FILENAME}.tmp"
+        with tmp_path.open('w') as file:
+            yaml.dump(asdict(self), file)
+        os.replace(tmp_path, path / LigoSimCheckpoint.FILENAME)
+
+    def restore_random_state(self):
+        if self.numpy_random_state is not None:
+            np.random.set_state((self.numpy_random_state[0], np.array(self.numpy_random_state[1], dtype=np.uint32),
+                                 *self.numpy_random_state[2:]))
+        if self.random_state is not None:
+            random.setstate((self.random_state[0], tuple(self.random_state[1]), self.random_state[2]))
+
+    def restore_files(self, sequence_paths: Dict[str, Path]):
+        """Truncates the files with processed sequences to their size at the time of the checkpoint"""
+        for key, path in sequence_paths.items():
+            size = self.file_sizes.get(key, 0)
+            if path.is_file() and size == 0:
+                os.remove(path)
+            elif path.is_file():
+                os.truncate(path, size)
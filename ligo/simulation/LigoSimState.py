@@ -21,3 +21,4 @@ class LigoSimState:
     p_gen_bins: Dict[str, Any] = field(default_factory=dict)
     resulting_dataset: Dataset = None
     result_path: Path = None
+    metrics_paths: Dict[str, Path] = field(default_factory=dict)
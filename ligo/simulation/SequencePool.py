@@ -0,0 +1,80 @@
+from pathlib import Path
+from typing import Dict
+
+import bionumpy as bnp
+import numpy as np
+from bionumpy.bnpdataclass import BNPDataClass
+from bionumpy.io import delimited_buffers
+
+
+class SequencePool:
+    """
+    Sequences simulated for one simulation item (stored in processed_sequences/ per signal and for sequences without signal), from which
+    repertoires are assembled.
+
+    Each file is parsed only once: it is read in chunks as the sequences are needed, and a read cursor is kept per file, so that taking
+    the sequences for one repertoire costs as much as the slice that is returned, regardless of the total size of the pool. Only the current
+    chunk and the leftover of the previous one are kept in memory.
+    """
+
+    CHUNK_SIZE = 5000000  # in bytes, passed to bionumpy as minimal chunk size
+
+    def __init__(self, sequence_paths: Dict[str, Path], bnp_data_class, chunk_size: int = CHUNK_SIZE):
+        self._sequence_paths = sequence_paths
+        self._bnp_data_class = bnp_data_class
+        self._chunk_size = chunk_size
+        self._files = {}
+        self._streams = {}
+        self._buffers = {}
+        self.used_seq_count = {key: 0 for key in sequence_paths.keys()}
+
+    def has_sequences(self, key: str) -> bool:
+        return key in self._sequence_paths and self._sequence_paths[key].is_file()
+
+    def take(self, key: str, count: int) -> BNPDataClass:
+        """Returns the next `count` sequences from the pool for the given key (signal id or 'no_signal') and moves the cursor; if
+        there are fewer sequences left, all remaining ones are returned; if there is no file for the key, returns None"""
+        if not self.has_sequences(key):
+            return None
+
+        if key not in self._streams:
+            self._open(key)
+
+        parts = [self._buffers[key]] if self._buffers[key] is not None else []
+        available = sum(len(part) for part in parts)
+
+        while available < count and self._streams[key] is not None:
+            chunk = next(self._streams[key], None)
+            if chunk is None:
+                self._close_file(key)
+            elif len(chunk) > 0:
+                parts.append(chunk)
+                available += len(chunk)
+
+        data = np.concatenate(parts) if len(parts) > 1 else parts[0] if len(parts) == 1 else self._bnp_data_class.empty()
+        self._buffers[key] = data[count:] if len(data) > count else None
+        self.used_seq_count[key] += min(count, len(data))
+
+        return data[:count]
+
+    def close(self):
+        for key in list(self._files.keys()):
+            self._close_file(key)
+
+    def _open(self, key: str):
+        buff_type = delimited_buffers.get_bufferclass_for_datatype(self._bnp_data_class, delimiter='\t', has_header=True)
+        self._files[key] = bnp.open(self._sequence_paths[key], 'r', buff_type, False)
+        self._streams[key] = iter(self._files[key].read_chunks(min_chunk_size=self._chunk_size))
+        self._buffers[key] = None
+
+    def _close_file(self, key: str):
+        if key in self._files:
+            self._files[key].close()
+            del self._files[key]
+        self._streams[key] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
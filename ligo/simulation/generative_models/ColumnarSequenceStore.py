@@ -0,0 +1,144 @@
+import json
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from ligo.data_model.dataset.SequenceDataset import SequenceDataset
+from ligo.data_model.receptor.RegionType import RegionType
+from ligo.data_model.receptor.receptor_sequence.SequenceMetadata import SequenceMetadata
+from ligo.simulation.generative_models.BackgroundSequences import BackgroundSequences
+from ligo.util.PathBuilder import PathBuilder
+
+
+class ColumnarSequenceStore:
+    """
+    Stores sequences column-wise on disk, in chunks with one .npy file per column, so that the files can be memory-mapped and any subset
+    of sequences can be read without parsing the other records. Sequences are indexed in the order of the chunk indices. Chunks are
+    loaded lazily in each process (they are not pickled when the store is sent to worker processes).
+    """
+
+    COLUMNS = ['sequence_aa', 'sequence', 'v_call', 'j_call', 'region_type', 'frame_type', 'duplicate_count', 'chain']
+    OPTIONAL_COLUMNS = ['p_gen']
+
+    def __init__(self, path: Path, chunk_indices: List[int] = None):
+        self.path = path
+        self.chunk_indices = chunk_indices if chunk_indices is not None else []
+        self._chunks = None
+        self._offsets = None
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self.chunk_indices)
+
+    @classmethod
+    def build_from_dataset(cls, dataset: SequenceDataset, path: Path) -> 'ColumnarSequenceStore':
+        """Converts the dataset file by file, so that only one dataset file is in memory at a time"""
+        store = ColumnarSequenceStore(PathBuilder.build(path))
+        for filename in dataset.get_filenames():
+            store.add_chunk(cls._make_columns_from_records(np.load(filename, allow_pickle=False)))
+        return store
+
+    @classmethod
+    def _make_columns_from_records(cls, records: np.ndarray) -> Dict[str, np.ndarray]:
+        metadata = [SequenceMetadata(**json.loads(value)) if value != '' else None for value in records['metadata'].tolist()]
+        return {'sequence_aa': records['amino_acid_sequence'], 'sequence': records['nucleotide_sequence'],
+                'v_call': np.array([m.v_call if m and m.v_call else '' for m in metadata], dtype=str),
+                'j_call': np.array([m.j_call if m and m.j_call else '' for m in metadata], dtype=str),
+                'region_type': np.array([m.region_type.name if m and m.region_type else '' for m in metadata], dtype=str),
+                'frame_type': np.array([m.frame_type.name if m and m.frame_type else '' for m in metadata], dtype=str),
+                'duplicate_count': np.array([m.duplicate_count if m and m.duplicate_count is not None else -1 for m in metadata], dtype=int),
+                'chain': np.array([m.chain.value if m and m.chain else '' for m in metadata], dtype=str)}
+
+    @classmethod
+    def make_columns(cls, sequences: BackgroundSequences, include_p_gens: bool = False) -> Dict[str, np.ndarray]:
+        columns = {column: np.array(getattr(sequences, column).tolist(), dtype=int if column == 'duplicate_count' else str)
+                   for column in ColumnarSequenceStore.COLUMNS}
+        return {**columns, **({'p_gen': np.asarray(sequences.p_gen, dtype=float)} if include_p_gens else {})}
+
+    def add_chunk(self, columns: Dict[str, np.ndarray], chunk_index: int = None):
+        """Stores the chunk under the given index (by default, the next one) and adds it to the store; column files are written under
+        temporary names first, so that other processes never see partially written chunks"""
+        chunk_index = max(self.chunk_indices, default=-1) + 1 if chunk_index is None else chunk_index
+        self.write_chunk(self.path, columns, chunk_index)
+        self.set_chunk_indices(self.chunk_indices + [chunk_index])
+
+    @classmethod
+    def write_chunk(cls, path: Path, columns: Dict[str, np.ndarray], chunk_index: int):
+        for column in [column for column in ColumnarSequenceStore.COLUMNS + ColumnarSequenceStore.OPTIONAL_COLUMNS if column in columns]:
+            filename = cls._get_filename_in(path, chunk_index, column)
+            tmp_filename = filename.with_name(f"tmp_{filename.name}")
+            np.save(str(tmp_filename), np.asarray(columns[column]), allow_pickle=False)
+            tmp_filename.replace(filename)
+
+    @classmethod
+    def remove_chunk(cls, path: Path, chunk_index: int):
+        for column in ColumnarSequenceStore.COLUMNS + ColumnarSequenceStore.OPTIONAL_COLUMNS:
+            cls._get_filename_in(path, chunk_index, column).unlink(missing_ok=True)
+
+    def set_chunk_indices(self, chunk_indices: List[int]):
+        if chunk_indices != self.chunk_indices:
+            self.chunk_indices = list(chunk_indices)
+            self._chunks, self._offsets = None, None
+
+    def _get_filename(self, chunk_index: int, column: str) -> Path:
+        return self._get_filename_in(self.path, chunk_index, column)
+
+    @classmethod
+    def _get_filename_in(cls, path: Path, chunk_index: int, column: str) -> Path:
+        return path / f"chunk{chunk_index:06d}_{column}.npy"
+
+    def _load_chunks(self) -> List[Dict[str, np.ndarray]]:
+        if self._chunks is None:
+            self._chunks = [{column: np.load(str(self._get_filename(index, column)), mmap_mode='r')
+                             for column in ColumnarSequenceStore.COLUMNS + ColumnarSequenceStore.OPTIONAL_COLUMNS
+                             if self._get_filename(index, column).is_file()}
+                            for index in self.chunk_indices]
+            self._offsets = np.cumsum([0] + [len(chunk['sequence_aa']) for chunk in self._chunks])
+        return self._chunks
+
+    def __len__(self):
+        self._load_chunks()
+        return int(self._offsets[-1])
+
+    def get_column_values(self, column: str) -> np.ndarray:
+        return np.unique(np.concatenate([np.unique(chunk[column]) for chunk in self._load_chunks()] + [np.array([], dtype=str)]))
+
+    def get_region_type(self):
+        region_types = self.get_column_values('region_type')
+        if len(region_types) == 1:
+            return RegionType[region_types[0]] if region_types[0] != '' else None
+        else:
+            raise RuntimeError(f"{ColumnarSequenceStore.__name__}: multiple region types are defined for sequences in {self.path}: "
+                               f"{region_types.tolist()}.")
+
+    def get_sequences(self, indices: np.ndarray) -> BackgroundSequences:
+        """Returns the sequences with the given indices in the given order; values are read chunk by chunk in the order of the indices
+        on disk"""
+        if len(indices) == 0:
+            return BackgroundSequences.empty()
+
+        chunks = self._load_chunks()
+        order = np.argsort(indices, kind='stable')
+        sorted_indices = np.asarray(indices)[order]
+        chunk_positions = np.searchsorted(self._offsets, sorted_indices, side='right') - 1
+
+        columns = {column: [] for column in ColumnarSequenceStore.COLUMNS + ['p_gen']}
+        for chunk_position in np.unique(chunk_positions):
+            chunk = chunks[chunk_position]
+            positions = sorted_indices[chunk_positions == chunk_position] - self._offsets[chunk_position]
+            for column in ColumnarSequenceStore.COLUMNS:
+                columns[column].append(chunk[column][positions])
+            columns['p_gen'].append(chunk['p_gen'][positions] if 'p_gen' in chunk else np.full(len(positions), -1.))
+
+        inverse_order = np.argsort(order)
+        columns = {column: np.concatenate(values)[inverse_order] for column, values in columns.items()}
+        p_gen = columns.pop('p_gen')
+
+        return BackgroundSequences(**{column: values.tolist() for column, values in columns.items()}, p_gen=p_gen,
+                                   from_default_model=np.ones(len(indices), dtype=int))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_chunks=None, _offsets=None)
+        return state
@@ -7,6 +7,7 @@ from ligo.data_model.dataset.SequenceDataset import SequenceDataset
 from ligo.dsl.import_parsers.ImportParser import ImportParser
 from ligo.environment.SequenceType import SequenceType
 from ligo.simulation.generative_models.BackgroundSequences import BackgroundSequences
+from ligo.simulation.generative_models.ColumnarSequenceStore import ColumnarSequenceStore
 from ligo.simulation.generative_models.GenerativeModel import GenerativeModel
 from ligo.simulation.util.util import write_bnp_data
 from ligo.util.ParameterValidator import ParameterValidator
@@ -25,6 +26,13 @@ class ExperimentalImport(GenerativeModel):
 
     - import_params (dict): as defined under the import format selected in the first parameter; for details see :ref:`Supported dataset formats`
 
+    - shuffle (bool): whether to use the imported sequences in random order (without replacement, following one permutation of all sequences
+      drawn with a fixed seed when the model is built, so the order is the same in every run) instead of in the order of the input files;
+      default is False
+
+    The imported sequences are converted once to a columnar format in tmp_import_path and memory-mapped, so that batches of sequences are
+    read directly from the columns.
+
     YAML specification:
 
     .. indent with spaces
@@ -40,20 +48,32 @@ class ExperimentalImport(GenerativeModel):
                     junction: sequence
                     junction_aa: sequence_aa
                     locus: chain
+            shuffle: False
             type: ExperimentalImport
 
     """
 
-    def __init__(self, dataset: SequenceDataset, chain=None, original_input_file: Path = None):
+    SHUFFLE_SEED = 1
+
+    def __init__(self, dataset: SequenceDataset, chain=None, original_input_file: Path = None, shuffle: bool = False,
+                 sequence_store: ColumnarSequenceStore = None):
         super().__init__(chain)
         self._dataset = dataset
         self._counter = 0
         self._original_input_file = original_input_file
-        self.region_type = dataset.get_region_type()
+        self._shuffle = shuffle
+        self._sequence_store = sequence_store if sequence_store is not None \
+            else ColumnarSequenceStore.build_from_dataset(dataset, Path(dataset.get_filenames()[0]).parent / "columns")
+        self._order = np.random.default_rng(ExperimentalImport.SHUFFLE_SEED).permutation(len(self._sequence_store)) if shuffle else None
+        self.region_type = self._sequence_store.get_region_type()
 
     @classmethod
     def build_object(cls, **kwargs):
-        ParameterValidator.assert_keys(kwargs.keys(), ['import_format', 'import_params', "tmp_import_path"], ExperimentalImport.__name__,  'ExperimentalImport')
+        ParameterValidator.assert_keys(kwargs.keys(), ['import_format', 'import_params', "tmp_import_path", "shuffle"], ExperimentalImport.__name__,
+                                       'ExperimentalImport', exclusive=False)
+        ParameterValidator.assert_keys_present(kwargs.keys(), ['import_format', 'import_params', "tmp_import_path"], ExperimentalImport.__name__,
+                                               'ExperimentalImport')
+        ParameterValidator.assert_type_and_value(kwargs.get('shuffle', False), bool, cls.__name__, 'shuffle')
         ParameterValidator.assert_type_and_value(kwargs['tmp_import_path'], str, cls.__name__, 'tmp_import_path')
         tmp_import_path = Path(kwargs['tmp_import_path'])
         assert not tmp_import_path.is_file(), \
@@ -67,16 +87,22 @@ class ExperimentalImport(GenerativeModel):
                                                                       'params': kwargs['import_params']},
                                              tmp_import_path)
         print(f"Imported dataset with {dataset.get_example_count()} sequences.")
-        return ExperimentalImport(dataset, kwargs['import_params']['path'])
+        return ExperimentalImport(dataset, original_input_file=kwargs['import_params']['path'], shuffle=kwargs.get('shuffle', False))
 
     def generate_sequences(self, count: int, seed: int, path: Path, sequence_type: SequenceType, compute_p_gen: bool):
+        write_bnp_data(path, self.generate_sequences_in_memory(count, seed, sequence_type, compute_p_gen))
+        return path
+
+    def generate_sequences_in_memory(self, count: int, seed: int, sequence_type: SequenceType, compute_p_gen: bool) -> BackgroundSequences:
         if compute_p_gen:
             logging.warning(f"{ExperimentalImport.__name__}: generation probabilities cannot be computed for experimental data, skipping...")
 
-        if self._counter < self._dataset.get_example_count():
-            sequences = self._dataset.get_data_from_index_range(self._counter, self._counter + count - 1)
-            self._counter += len(sequences)
-            write_bnp_data(path, BackgroundSequences.build_from_receptor_sequences(sequences))
+        sequence_count = len(self._sequence_store)
+
+        if self._counter < sequence_count:
+            indices = np.arange(self._counter, min(self._counter + count, sequence_count))
+            self._counter += len(indices)
+            return self._sequence_store.get_sequences(self._order[indices] if self._order is not None else indices)
         else:
             raise RuntimeError(f"{ExperimentalImport.__name__}: all sequences provided to the generative model were already used in the simulation, "
                                f"no more new sequences can be imported. Try increasing the number of sequences in the provided files or reduce the "
@@ -98,6 +124,19 @@ class ExperimentalImport(GenerativeModel):
                                          compute_p_gen: bool):
         raise NotImplementedError
 
+    def generate_from_skewed_gene_models_in_memory(self, v_genes: list, j_genes: list, seed: int, sequence_type: SequenceType, batch_size: int,
+                                                   compute_p_gen: bool) -> BackgroundSequences:
+        raise NotImplementedError
+
+    def is_stateful(self) -> bool:
+        return True
+
+    def get_state(self) -> dict:
+        return {'counter': self._counter}
+
+    def set_state(self, state: dict):
+        self._counter = state['counter']
+
     def is_same(self, model) -> bool:
-        return type(self) == type(model) and self._dataset.get_example_count() == model._dataset.get_example_count() \
+        return type(self) == type(model) and len(self._sequence_store) == len(model._sequence_store) \
                and self._original_input_file == model._original_input_file
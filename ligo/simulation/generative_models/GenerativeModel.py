@@ -4,6 +4,7 @@ from pathlib import Path
 import numpy as np
 
 from ligo.environment.SequenceType import SequenceType
+from ligo.simulation.generative_models.BackgroundSequences import BackgroundSequences
 
 
 class GenerativeModel:
@@ -22,6 +23,10 @@ class GenerativeModel:
     def generate_sequences(self, count: int, seed: int, path: Path, sequence_type: SequenceType, compute_p_gen: bool):
         pass
 
+    @abc.abstractmethod
+    def generate_sequences_in_memory(self, count: int, seed: int, sequence_type: SequenceType, compute_p_gen: bool) -> BackgroundSequences:
+        pass
+
     @abc.abstractmethod
     def compute_p_gens(self, sequences, sequence_type: SequenceType, sequence_field: str = None) -> np.ndarray:
         pass
@@ -34,6 +39,34 @@ class GenerativeModel:
     def can_compute_p_gens(self) -> bool:
         pass
 
+    def set_number_of_processes(self, number_of_processes: int):
+        """Lets the model use the given number of processes (e.g., the number of processes of the instruction which uses the model) for
+        the parts of generation it can parallelize, unless the number of processes was set in the model's own parameters"""
+        pass
+
+    def close(self):
+        """Releases the resources the model keeps for the run, such as worker processes; called when the instruction using the model
+        finishes"""
+        pass
+
+    def is_stateful(self) -> bool:
+        """Returns True if the sequences the model generates depend on the sequences it already generated in the same process (e.g., if
+        each sequence is served only once), so that copies of the model in different processes would generate the same sequences"""
+        return False
+
+    def get_state(self) -> dict:
+        """Returns the state of a stateful model (see is_stateful) as a dict of basic types, so that it can be stored in a checkpoint
+        and restored with set_state when the simulation is resumed; returns None for models without state"""
+        return None
+
+    def set_state(self, state: dict):
+        pass
+
+    def get_p_gen_stats(self) -> dict:
+        """Returns the numbers of p_gen cache hits and misses and the time spent computing p_gens in this process so far, if the model
+        keeps track of them"""
+        return {}
+
     @abc.abstractmethod
     def can_generate_from_skewed_gene_models(self) -> bool:
         pass
@@ -42,3 +75,8 @@ class GenerativeModel:
     def generate_from_skewed_gene_models(self, v_genes: list, j_genes: list, seed: int, path: Path, sequence_type: SequenceType, batch_size: int,
                                          compute_p_gen: bool):
         pass
+
+    @abc.abstractmethod
+    def generate_from_skewed_gene_models_in_memory(self, v_genes: list, j_genes: list, seed: int, sequence_type: SequenceType, batch_size: int,
+                                                   compute_p_gen: bool) -> BackgroundSequences:
+        pass
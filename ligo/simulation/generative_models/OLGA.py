@@ -1,12 +1,16 @@
+import hashlib
 import os
-from dataclasses import dataclass
+import pickle
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from importlib.metadata import version
+from multiprocessing import Pool, current_process
 from pathlib import Path
 
+import dill
 import numpy as np
-import pandas as pd
 from bionumpy.bnpdataclass import BNPDataClass
 from olga import load_model
-from olga.generation_probability import GenerationProbabilityVJ, GenerationProbabilityVDJ
 from olga.sequence_generation import SequenceGenerationVJ, SequenceGenerationVDJ
 
 from ligo.IO.dataset_import.DatasetImportParams import DatasetImportParams
@@ -15,11 +19,16 @@ from ligo.data_model.receptor.RegionType import RegionType
 from ligo.data_model.receptor.receptor_sequence.Chain import Chain
 from ligo.data_model.receptor.receptor_sequence.SequenceFrameType import SequenceFrameType
 from ligo.dsl.DefaultParamsLoader import DefaultParamsLoader
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
 from ligo.environment.SequenceType import SequenceType
+from ligo.simulation.generative_models.BackgroundSequences import BackgroundSequences
 from ligo.simulation.generative_models.GenerativeModel import GenerativeModel
 from ligo.simulation.generative_models.InternalOlgaModel import InternalOlgaModel
-from ligo.simulation.util.igor_helper import make_skewed_model_files
+from ligo.simulation.generative_models.OlgaPGenEngine import OlgaPGenEngine
+from ligo.simulation.util.igor_helper import make_skewed_model
+from ligo.simulation.util.util import write_bnp_data
 from ligo.util.ImportHelper import ImportHelper
+from ligo.util.Logger import print_log
 from ligo.util.ParameterValidator import ParameterValidator
 from ligo.util.PathBuilder import PathBuilder
 
@@ -47,6 +56,8 @@ class OLGA(GenerativeModel):
 
     - default_model_name (str): if not using custom models, one of the OLGA default models could be specified here; the value should be the same as it would be passed to command line in OLGA: e.g., humanTRB, human IGH
 
+    - number_of_processes (int): how many processes to use to generate each batch of sequences; if not set, the number of processes of the instruction using the model is used (or 1 otherwise); the batch is split into one chunk per process and each chunk is generated from its own seed derived from the seed of the batch, so the generated sequences depend only on the seed and the number of processes; p_gens of existing sequences (e.g., for p_gen-based filtering or export) are also computed in chunks by that many processes; the worker processes are started once and keep their models (and p_gen models) for the whole run; when the model is already used from a worker process (e.g., when simulation items are simulated in parallel), the chunks are generated one after another in that process
+
     YAML specification:
 
     .. indent with spaces
@@ -56,13 +67,19 @@ class OLGA(GenerativeModel):
             type: OLGA
             model_path: None
             default_model_name: humanTRB
+            number_of_processes: 1
 
     """
     model_path: Path = None
     default_model_name: str = None
     chain: Chain = None
     region_type: RegionType = RegionType.IMGT_JUNCTION
+    number_of_processes: int = None
     _olga_model: InternalOlgaModel = None
+    _p_gen_engine: OlgaPGenEngine = None
+    _skewed_models: dict = field(default_factory=dict)
+    _default_number_of_processes: int = 1
+    _pool: Pool = field(default=None, repr=False, compare=False)
 
     DEFAULT_MODEL_FOLDER_MAP = {
         "humanTRA": "human_T_alpha", "humanTRB": "human_T_beta",
@@ -71,6 +88,8 @@ class OLGA(GenerativeModel):
     }
     MODEL_FILENAMES = {'marginals': 'model_marginals.txt', 'params': 'model_params.txt', 'v_gene_anchor': 'V_gene_CDR3_anchors.csv',
                        'j_gene_anchor': 'J_gene_CDR3_anchors.csv'}
+    MIN_P_GEN_CHUNK_SIZE = 50
+    MODEL_CACHE_FOLDER = "olga_models"
     OUTPUT_COLUMNS = ["sequence", 'sequence_aa', 'v_call', 'j_call', 'region_type', "frame_type", "p_gen", "from_default_model", 'duplicate_count', 'chain']
 
     @classmethod
@@ -78,9 +97,12 @@ class OLGA(GenerativeModel):
 
         location = OLGA.__name__
 
-        ParameterValidator.assert_keys(list(kwargs.keys()), ['model_path', 'default_model_name', 'chain'], location,
+        ParameterValidator.assert_keys(list(kwargs.keys()), ['model_path', 'default_model_name', 'chain', 'number_of_processes'], location,
                                        'OLGA generative model', exclusive=False)
 
+        if kwargs.get('number_of_processes', None) is not None:
+            ParameterValidator.assert_type_and_value(kwargs['number_of_processes'], int, location, 'number_of_processes', 1)
+
         if 'model_path' in kwargs and kwargs['model_path']:
             assert 'chain' in kwargs, f"{OLGA.__name__}: chain not defined."
             assert Path(kwargs['model_path']).is_dir(), \
@@ -100,14 +122,75 @@ class OLGA(GenerativeModel):
             chain = Chain.get_chain(kwargs['default_model_name'][-3:])
             kwargs['model_path'] = Path(load_model.__file__).parent / f"default_models/{OLGA.DEFAULT_MODEL_FOLDER_MAP[kwargs['default_model_name']]}"
 
-        return OLGA(**{**kwargs, **{'chain': chain}})
+        return cls(**{**kwargs, **{'chain': chain}})
 
     @property
     def is_vdj(self):
         return self.chain in [Chain.BETA, Chain.HEAVY]
 
+    def _get_number_of_processes(self) -> int:
+        return self.number_of_processes if self.number_of_processes is not None else self._default_number_of_processes
+
+    def set_number_of_processes(self, number_of_processes: int):
+        if number_of_processes != self._default_number_of_processes:
+            self.close()
+            self._default_number_of_processes = number_of_processes
+
+    def _get_pool(self) -> Pool:
+        """Returns the pool of worker processes for this model, starting it on first use; each worker gets a copy of the loaded model
+        once, and keeps it (along with its p_gen model and skewed models) for all later batches until the model is closed"""
+        if self._pool is None:
+            self._get_model()
+            self._pool = Pool(processes=self._get_number_of_processes(), initializer=_init_olga_worker, initargs=(dill.dumps(self),))
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
     def load_model(self, model_path: Path = None) -> InternalOlgaModel:
+        """Loads the model from the cache of processed models if the model files were already processed (in this or an earlier run),
+        otherwise parses the model files and stores the processed model in the cache; if the cache cannot be written (e.g., it is on
+        a read-only file system), the parsed model is used without caching it"""
         model_path = self.model_path if model_path is None else model_path
+        cache_file = self._get_model_cache_file(model_path)
+
+        if cache_file.is_file():
+            try:
+                with cache_file.open('rb') as file:
+                    return pickle.load(file)
+            except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, OSError) as e:
+                print_log(f"{OLGA.__name__}: could not load the cached model from {cache_file} ({e}), the model files will be parsed "
+                          f"again.", True)
+
+        olga_model = self._parse_model(model_path)
+
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            PathBuilder.build(cache_file.parent)
+            with tmp_file.open('wb') as file:
+                pickle.dump(olga_model, file)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print_log(f"{OLGA.__name__}: could not store the processed model in the cache at {cache_file} ({e}), continuing without "
+                      f"caching it. The location of the cache can be changed with EnvironmentSettings.set_cache_path().", True)
+            if tmp_file.is_file():
+                tmp_file.unlink()
+
+        return olga_model
+
+    def _get_model_cache_file(self, model_path: Path) -> Path:
+        """The processed model is cached under the hash of the model files' contents, the model type and the OLGA version, so changed
+        model files or a new OLGA version never reuse an outdated model"""
+        content_hash = hashlib.sha256(f"{'VDJ' if self.is_vdj else 'VJ'}_{version('olga')}".encode())
+        for filename in OLGA.MODEL_FILENAMES.values():
+            content_hash.update((model_path / filename).read_bytes())
+
+        return EnvironmentSettings.cache_path / OLGA.MODEL_CACHE_FOLDER / f"{content_hash.hexdigest()}.pickle"
+
+    def _parse_model(self, model_path: Path) -> InternalOlgaModel:
         olga_gen_model = load_model.GenerativeModelVDJ() if self.is_vdj else load_model.GenerativeModelVJ()
         olga_gen_model.load_and_process_igor_model(str(model_path / OLGA.MODEL_FILENAMES['marginals']))
 
@@ -126,52 +209,139 @@ class OLGA(GenerativeModel):
                                  genomic_data=genomic_data, olga_gen_model=olga_gen_model)
 
     def generate_sequences(self, count: int, seed: int, path: Path, sequence_type: SequenceType, compute_p_gen: bool) -> Path:
+        sequences = self.generate_sequences_in_memory(count, seed, sequence_type, compute_p_gen)
+        write_bnp_data(path, sequences, append_if_exists=False)
+        return path
+
+    def generate_sequences_in_memory(self, count: int, seed: int, sequence_type: SequenceType, compute_p_gen: bool) -> BackgroundSequences:
 
         if not self._olga_model:
             self._olga_model = self.load_model()
 
-        self._generate_productive_sequences(count, path, seed, self._olga_model, compute_p_gen, sequence_type)
+        return self._generate(count, seed, compute_p_gen, sequence_type)
 
-        return path
+    def _generate(self, count: int, seed: int, compute_p_gen: bool, sequence_type: SequenceType, skewed_model_key: tuple = None) \
+            -> BackgroundSequences:
+        """Generates sequences from the default model or from the cached skewed model with the given key; if the seed is given, numpy's global random
+        state (used by OLGA) is seeded with it, or, with multiple processes, with the child seeds derived from it for each chunk; the global random
+        state of the current process is restored afterwards"""
+        number_of_processes = self._get_number_of_processes()
 
-    def _generate_productive_sequences(self, count: int, path: Path, seed: int, olga_model: InternalOlgaModel, compute_p_gen: bool,
-                                       sequence_type: SequenceType, **kwargs):
-        sequences = pd.DataFrame(index=np.arange(count), columns=OLGA.OUTPUT_COLUMNS)
+        if number_of_processes == 1:
+            with _seeded_global_random_state(seed):
+                return self._generate_productive_sequences(count, seed, self._get_model(skewed_model_key), compute_p_gen, sequence_type)
+        else:
+            child_seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(number_of_processes)]
+            tasks = [(len(chunk), child_seed, compute_p_gen, sequence_type, skewed_model_key)
+                     for chunk, child_seed in zip(np.array_split(np.arange(count), number_of_processes), child_seeds)]
 
-        for i in range(count):
-            seq_row = olga_model.sequence_gen_model.gen_rnd_prod_CDR3()
+            if current_process().daemon:
+                chunks = [self._generate_chunk(*task) for task in tasks]
+            else:
+                chunks = [dill.loads(chunk) for chunk in self._get_pool().map(_generate_chunk_in_worker, tasks)]
 
-            p_gen = self.compute_p_gen({'sequence': seq_row[0], 'sequence_aa': seq_row[1], 'v_call': olga_model.v_gene_mapping[seq_row[2]],
-                                        'j_call': olga_model.j_gene_mapping[seq_row[3]]}, sequence_type) if compute_p_gen else -1.
+            return np.concatenate(chunks)
 
-            sequences.loc[i] = (seq_row[0], seq_row[1], olga_model.v_gene_mapping[seq_row[2]], olga_model.j_gene_mapping[seq_row[3]],
-                                RegionType.IMGT_JUNCTION.name, SequenceFrameType.IN.name, p_gen, int(olga_model == self._olga_model),
-                                -1, self.chain.value)
+    def _generate_chunk(self, count: int, seed: int, compute_p_gen: bool, sequence_type: SequenceType, skewed_model_key: tuple = None) \
+            -> BackgroundSequences:
+        if skewed_model_key is not None and skewed_model_key not in self._skewed_models:
+            self._make_skewed_model(list(skewed_model_key[0]), list(skewed_model_key[1]))
 
-        sequences.to_csv(path, index=False, sep='\t')
-        return path
+        with _seeded_global_random_state(seed):
+            return self._generate_productive_sequences(count, seed, self._get_model(skewed_model_key), compute_p_gen, sequence_type)
 
-    def compute_p_gen(self, sequence: dict, sequence_type: SequenceType, sequence_field: str = None) -> float:
-        cls = GenerationProbabilityVDJ if self.is_vdj else GenerationProbabilityVJ
-        p_gen_model = cls(generative_model=self._olga_model.olga_gen_model, genomic_data=self._olga_model.genomic_data)
-        if sequence_type == SequenceType.NUCLEOTIDE:
-            seq_field_name = 'sequence' if sequence_field is None else sequence_field
-            return p_gen_model.compute_nt_CDR3_pgen(sequence[seq_field_name], sequence['v_call'], sequence['j_call'])
+    def _get_model(self, skewed_model_key: tuple = None) -> InternalOlgaModel:
+        if not self._olga_model:
+            self._olga_model = self.load_model()
+        return self._olga_model if skewed_model_key is None else self._skewed_models[skewed_model_key]
+
+    def _sample_productive_sequences(self, count: int, olga_model: InternalOlgaModel) -> tuple:
+        """Returns nucleotide sequences, amino acid sequences, V gene indices and J gene indices of count productive sequences"""
+        gen_func = olga_model.sequence_gen_model.gen_rnd_prod_CDR3
+        return tuple(zip(*[gen_func() for _ in range(count)]))
+
+    def _make_skewed_model(self, v_genes: list, j_genes: list) -> tuple:
+        """Makes the model where only the given V and J genes are used by reweighting the gene marginals of the loaded model, unless it
+        was already made from this model; the skewed model is kept in memory (and made by each worker process on first use), so it is
+        made only once per run and process; returns the key of the skewed model"""
+        skewed_model_key = (tuple(v_genes), tuple(j_genes))
+
+        if skewed_model_key not in self._skewed_models:
+            olga_model = self._get_model()
+            olga_gen_model = make_skewed_model(olga_model.olga_gen_model, olga_model.v_gene_mapping, olga_model.j_gene_mapping, v_genes,
+                                               j_genes)
+            sequence_gen_model = SequenceGenerationVDJ(olga_gen_model, olga_model.genomic_data) if self.is_vdj \
+                else SequenceGenerationVJ(olga_gen_model, olga_model.genomic_data)
+            self._skewed_models[skewed_model_key] = InternalOlgaModel(sequence_gen_model=sequence_gen_model,
+                                                                      v_gene_mapping=olga_model.v_gene_mapping,
+                                                                      j_gene_mapping=olga_model.j_gene_mapping,
+                                                                      genomic_data=olga_model.genomic_data, olga_gen_model=olga_gen_model)
+
+        return skewed_model_key
+
+    def _generate_productive_sequences(self, count: int, seed: int, olga_model: InternalOlgaModel, compute_p_gen: bool,
+                                       sequence_type: SequenceType, **kwargs) -> BackgroundSequences:
+        """Generates the batch column-wise: sampled rows are collected first, gene indices are mapped to gene names with one lookup per
+        column and p_gens (if needed) are computed for the whole batch with one p_gen model"""
+        if count == 0:
+            return BackgroundSequences.empty()
+
+        sequence, sequence_aa, v_indices, j_indices = self._sample_productive_sequences(count, olga_model)
+
+        v_call = np.array(olga_model.v_gene_mapping)[np.array(v_indices, dtype=int)]
+        j_call = np.array(olga_model.j_gene_mapping)[np.array(j_indices, dtype=int)]
+
+        if compute_p_gen:
+            p_gen = self._compute_p_gens_from_columns(sequence if sequence_type == SequenceType.NUCLEOTIDE else sequence_aa,
+                                                      v_call.tolist(), j_call.tolist(), sequence_type)
         else:
-            seq_field_name = 'sequence_aa' if sequence_field is None else sequence_field
-            return p_gen_model.compute_aa_CDR3_pgen(sequence[seq_field_name], sequence['v_call'], sequence['j_call'])
+            p_gen = np.full(count, -1.)
+
+        return BackgroundSequences(sequence=list(sequence), sequence_aa=list(sequence_aa), v_call=v_call.tolist(), j_call=j_call.tolist(),
+                                   p_gen=p_gen, region_type=[RegionType.IMGT_JUNCTION.name] * count,
+                                   frame_type=[SequenceFrameType.IN.name] * count,
+                                   from_default_model=np.full(count, int(olga_model == self._olga_model)),
+                                   duplicate_count=np.full(count, -1), chain=[self.chain.value] * count)
+
+    def _get_p_gen_engine(self) -> OlgaPGenEngine:
+        """Returns the p_gen engine of the default model; it is created once per model and keeps its cache for all later batches"""
+        if self._p_gen_engine is None:
+            self._p_gen_engine = OlgaPGenEngine(self._get_model(), self.is_vdj)
+        return self._p_gen_engine
+
+    def _compute_p_gens_from_columns(self, sequences: list, v_calls: list, j_calls: list, sequence_type: SequenceType) -> np.ndarray:
+        return self._get_p_gen_engine().compute_many(sequences, v_calls, j_calls, sequence_type,
+                                                     compute_missing=self._compute_p_gens_in_parallel)
+
+    def _compute_p_gens_in_parallel(self, sequences: list, v_calls: list, j_calls: list, sequence_type: SequenceType) -> np.ndarray:
+        """Splits the sequences into one chunk per process and computes their p_gens in the pool of workers, each keeping its own p_gen
+        model and cache between batches; small batches, and batches from worker processes, are computed in the current process"""
+        chunk_count = min(self._get_number_of_processes(), len(sequences) // OLGA.MIN_P_GEN_CHUNK_SIZE)
+
+        if chunk_count <= 1 or current_process().daemon:
+            return self._get_p_gen_engine()._compute(sequences, v_calls, j_calls, sequence_type)
+        else:
+            tasks = [(sequences[chunk[0]:chunk[-1] + 1], v_calls[chunk[0]:chunk[-1] + 1], j_calls[chunk[0]:chunk[-1] + 1], sequence_type)
+                     for chunk in np.array_split(np.arange(len(sequences)), chunk_count)]
+            return np.concatenate(self._get_pool().map(_compute_p_gens_in_worker, tasks))
+
+    def compute_p_gen(self, sequence: dict, sequence_type: SequenceType, sequence_field: str = None) -> float:
+        if sequence_field is None:
+            sequence_field = 'sequence' if sequence_type == SequenceType.NUCLEOTIDE else 'sequence_aa'
+        return self._get_p_gen_engine().compute(sequence[sequence_field], sequence['v_call'], sequence['j_call'], sequence_type)
 
-    def compute_p_gens(self, sequences: BNPDataClass, sequence_type: SequenceType, sequence_field: str = None) -> list:
+    def get_p_gen_stats(self) -> dict:
+        return self._p_gen_engine.get_stats() if self._p_gen_engine is not None else {}
+
+    def compute_p_gens(self, sequences: BNPDataClass, sequence_type: SequenceType, sequence_field: str = None) -> np.ndarray:
 
-        cls = GenerationProbabilityVDJ if self.is_vdj else GenerationProbabilityVJ
-        p_gen_model = cls(generative_model=self._olga_model.olga_gen_model, genomic_data=self._olga_model.genomic_data)
-        p_gen_func = p_gen_model.compute_nt_CDR3_pgen if sequence_type == SequenceType.NUCLEOTIDE else p_gen_model.compute_aa_CDR3_pgen
         if sequence_field is None:
             seq_field = 'sequence' if sequence_type == SequenceType.NUCLEOTIDE else 'sequence_aa'
         else:
             seq_field = sequence_field
 
-        return [p_gen_func(getattr(seq, seq_field).to_string(), seq.v_call.to_string(), seq.j_call.to_string(), False) for seq in sequences]
+        return self._compute_p_gens_from_columns(getattr(sequences, seq_field).tolist(), sequences.v_call.tolist(),
+                                                 sequences.j_call.tolist(), sequence_type)
 
     def can_compute_p_gens(self) -> bool:
         return True
@@ -181,24 +351,23 @@ class OLGA(GenerativeModel):
 
     def generate_from_skewed_gene_models(self, v_genes: list, j_genes: list, seed: int, path: Path, sequence_type: SequenceType, batch_size: int,
                                          compute_p_gen: bool):
+        if len(v_genes) > 0 or len(j_genes) > 0:
+            sequences = self.generate_from_skewed_gene_models_in_memory(v_genes, j_genes, seed, sequence_type, batch_size, compute_p_gen)
+            write_bnp_data(path, sequences)
+
+    def generate_from_skewed_gene_models_in_memory(self, v_genes: list, j_genes: list, seed: int, sequence_type: SequenceType, batch_size: int,
+                                                   compute_p_gen: bool) -> BackgroundSequences:
+        """Generates sequences from the model where only the given V and J genes are used; the skewed model is made in memory only
+        once per combination of genes"""
 
         if not self._olga_model:
             self._olga_model = self.load_model()
 
         if len(v_genes) > 0 or len(j_genes) > 0:
-
-            skewed_model_path = PathBuilder.build(path.parent / "skewed_model/")
-            skewed_seqs_path = PathBuilder.build(path.parent) / f"tmp_skewed_model_seqs_{seed}.tsv"
-            make_skewed_model_files(v_genes, j_genes, self.model_path, skewed_model_path)
-            skewed_model = self.load_model(skewed_model_path)
-
-            self._generate_productive_sequences(count=batch_size, path=skewed_seqs_path, seed=seed, olga_model=skewed_model,
-                                                compute_p_gen=compute_p_gen, sequence_type=sequence_type)
-
-            if skewed_seqs_path.is_file():
-                pd.read_csv(skewed_seqs_path, sep='\t').to_csv(path, mode='a' if path.is_file() else 'w', sep='\t', index=False,
-                                                               header=not path.is_file())
-                os.remove(skewed_seqs_path)
+            return self._generate(count=batch_size, seed=seed, compute_p_gen=compute_p_gen, sequence_type=sequence_type,
+                                  skewed_model_key=self._make_skewed_model(v_genes, j_genes))
+        else:
+            return BackgroundSequences.empty()
 
     def _import_olga_sequences(self, sequence_type: SequenceType, path: Path):
         import_empty_nt_sequences = False if sequence_type == SequenceType.NUCLEOTIDE else True
@@ -210,3 +379,38 @@ class OLGA(GenerativeModel):
     def is_same(self, model) -> bool:
         return type(model) == type(self) and self.chain == model.chain and self.model_path == model.model_path and \
                self.default_model_name == model.default_model_name
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
+
+
+@contextmanager
+def _seeded_global_random_state(seed: int = None):
+    """Seeds numpy's global random state (used by OLGA) with the given seed and restores the previous state afterwards, so that
+    generating sequences does not reseed the random numbers used elsewhere in the process"""
+    if seed is None:
+        yield
+    else:
+        previous_state = np.random.get_state()
+        np.random.seed(seed)
+        try:
+            yield
+        finally:
+            np.random.set_state(previous_state)
+
+
+_olga_worker_context = {}
+
+
+def _init_olga_worker(model: bytes):
+    _olga_worker_context['model'] = dill.loads(model)
+
+
+def _generate_chunk_in_worker(task: tuple) -> bytes:
+    return dill.dumps(_olga_worker_context['model']._generate_chunk(*task))
+
+
+def _compute_p_gens_in_worker(task: tuple) -> np.ndarray:
+    return _olga_worker_context['model']._get_p_gen_engine().compute_many(*task)
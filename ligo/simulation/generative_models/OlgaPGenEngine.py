@@ -0,0 +1,90 @@
+import time
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+from olga.generation_probability import GenerationProbabilityVDJ, GenerationProbabilityVJ
+
+from ligo.environment.SequenceType import SequenceType
+from ligo.simulation.generative_models.InternalOlgaModel import InternalOlgaModel
+
+
+class OlgaPGenEngine:
+    """
+    Computes generation probabilities with one OLGA p_gen model, built when it is first needed in each process, and keeps the computed
+    values in a bounded LRU cache keyed by (sequence, v_call, j_call, sequence type), so that sequences which were already scored (e.g.,
+    when filtering by p_gens or when the same sequence is implanted again) are not recomputed.
+
+    The numbers of cache hits and misses and the time spent computing p_gens are counted per process; when the engine is sent to another
+    process, it starts there with an empty cache and zero counters.
+    """
+
+    DEFAULT_CACHE_SIZE = 100000
+
+    def __init__(self, olga_model: InternalOlgaModel, is_vdj: bool, cache_size: int = DEFAULT_CACHE_SIZE):
+        self._olga_model = olga_model
+        self._is_vdj = is_vdj
+        self._cache_size = cache_size
+        self._reset()
+
+    def _reset(self):
+        self._p_gen_model = None
+        self._cache = OrderedDict()
+        self.hits, self.misses, self.time = 0, 0, 0.
+
+    def compute(self, sequence: str, v_call: str, j_call: str, sequence_type: SequenceType) -> float:
+        return float(self.compute_many([sequence], [v_call], [j_call], sequence_type)[0])
+
+    def compute_many(self, sequences: list, v_calls: list, j_calls: list, sequence_type: SequenceType,
+                     compute_missing: Callable = None) -> np.ndarray:
+        """
+        Returns p_gens in the order of the given sequences; p_gens which are not cached are computed once per distinct sequence by
+        compute_missing (called with the lists of missing sequences, v_calls and j_calls and the sequence type, e.g., to compute them in
+        parallel) or, if it is not given, by the p_gen model of the engine
+        """
+        start = time.perf_counter()
+        keys = [key + (sequence_type,) for key in zip(sequences, v_calls, j_calls)]
+        p_gens = np.empty(len(keys), dtype=float)
+        missing = {}
+
+        for index, key in enumerate(keys):
+            p_gen = self._cache.get(key)
+            if p_gen is None:
+                missing.setdefault(key, []).append(index)
+            else:
+                self._cache.move_to_end(key)
+                p_gens[index] = p_gen
+
+        if len(missing) > 0:
+            compute_missing = self._compute if compute_missing is None else compute_missing
+            missing_p_gens = compute_missing(*[list(column) for column in list(zip(*missing.keys()))[:3]], sequence_type)
+            for key, p_gen in zip(missing.keys(), missing_p_gens):
+                p_gens[missing[key]] = p_gen
+                self._cache[key] = float(p_gen)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        self.time += time.perf_counter() - start
+        return p_gens
+
+    def _compute(self, sequences: list, v_calls: list, j_calls: list, sequence_type: SequenceType) -> np.ndarray:
+        p_gen_func = self._get_p_gen_func(sequence_type)
+        return np.array([p_gen_func(sequence, v_call, j_call, False) for sequence, v_call, j_call in zip(sequences, v_calls, j_calls)],
+                        dtype=float)
+
+    def get_stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'time': self.time}
+
+    def _get_p_gen_func(self, sequence_type: SequenceType):
+        if self._p_gen_model is None:
+            cls = GenerationProbabilityVDJ if self._is_vdj else GenerationProbabilityVJ
+            self._p_gen_model = cls(generative_model=self._olga_model.olga_gen_model, genomic_data=self._olga_model.genomic_data)
+
+        return self._p_gen_model.compute_nt_CDR3_pgen if sequence_type == SequenceType.NUCLEOTIDE else self._p_gen_model.compute_aa_CDR3_pgen
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_p_gen_model=None, _cache=OrderedDict(), hits=0, misses=0, time=0.)
+        return state
@@ -0,0 +1,263 @@
+import fcntl
+import hashlib
+import json
+from contextlib import contextmanager
+from multiprocessing import Process, current_process
+from pathlib import Path
+
+import dill
+import numpy as np
+
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+from ligo.environment.SequenceType import SequenceType
+from ligo.simulation.generative_models.BackgroundSequences import BackgroundSequences
+from ligo.simulation.generative_models.ColumnarSequenceStore import ColumnarSequenceStore
+from ligo.simulation.generative_models.GenerativeModel import GenerativeModel
+from ligo.simulation.util.util import write_bnp_data
+from ligo.util.Logger import print_log
+from ligo.util.ParameterValidator import ParameterValidator
+from ligo.util.PathBuilder import PathBuilder
+from ligo.util.ReflectionHandler import ReflectionHandler
+
+
+class SequenceBank(GenerativeModel):
+    """
+    Serves sequences from a bank of sequences pre-generated by another generative model (e.g., OLGA or VectorisedOLGA) and stored on disk
+    in a columnar format, so that simulations which use the same model read background sequences instead of generating them.
+
+    Each sequence in the bank is used only once: the bank keeps the offset of the first unused sequence on disk, so later runs (and
+    other processes using the same bank) continue where the previous ones stopped, and stored chunks of sequences are deleted once all
+    their sequences have been used. When less than half of bank_size unused sequences
+    remain, a new set of bank_size sequences is generated in a background process; if the bank runs out before that, the sequences are
+    generated on the spot. Since the generated sequences are in random order, using them in order is the same as sampling without
+    replacement, but the sequences used by a simulation depend on the state of the bank, not on the seed of the simulation.
+
+    Generation probabilities and sequences from skewed V/J gene models are computed by the underlying generative model.
+
+    Arguments:
+
+    - generative_model (dict): the generative model that fills the bank, specified as under simulation items (with type and the
+      parameters of the model)
+
+    - path (str): where the bank is stored; if not set, the bank is stored in the cache directory (by default ~/.cache/ligo, or under
+      $XDG_CACHE_HOME if set) under a name derived from the specification of the generative model, so that all simulations with the same
+      model share the bank
+
+    - bank_size (int): how many sequences to generate each time the bank is filled (default is 1000000)
+
+    - p_gen_sequence_type (str): if set to AMINO_ACID or NUCLEOTIDE, generation probabilities for that sequence type are computed when
+      filling the bank and stored with the sequences; otherwise they are computed only when needed
+
+    YAML specification:
+
+    .. indent with spaces
+    .. code-block:: yaml
+
+        generative_model:
+            type: SequenceBank
+            bank_size: 1000000
+            p_gen_sequence_type: AMINO_ACID
+            generative_model:
+                type: VectorisedOLGA
+                default_model_name: humanTRB
+
+    """
+
+    DEFAULT_BANK_SIZE = 1000000
+    MANIFEST_FILENAME = "bank.json"
+    LOCK_FILENAME = "bank.lock"
+
+    def __init__(self, generative_model: GenerativeModel, path: Path, bank_size: int = DEFAULT_BANK_SIZE,
+                 p_gen_sequence_type: SequenceType = None, model_specification: dict = None):
+        super().__init__(generative_model.chain)
+        self.region_type = generative_model.region_type
+        self._generative_model = generative_model
+        self._path = path
+        self._bank_size = bank_size
+        self._p_gen_sequence_type = p_gen_sequence_type
+        self._model_specification = model_specification
+        self._store = ColumnarSequenceStore(path)
+        self._refill_process = None
+
+    @classmethod
+    def build_object(cls, **kwargs):
+        location = SequenceBank.__name__
+        ParameterValidator.assert_keys(list(kwargs.keys()), ['generative_model', 'path', 'bank_size', 'p_gen_sequence_type'], location,
+                                       'SequenceBank generative model', exclusive=False)
+        ParameterValidator.assert_keys_present(list(kwargs.keys()), ['generative_model'], location, 'SequenceBank generative model')
+        ParameterValidator.assert_type_and_value(kwargs['generative_model'], dict, location, 'generative_model')
+        ParameterValidator.assert_keys_present(list(kwargs['generative_model'].keys()), ['type'], location, 'generative_model')
+        ParameterValidator.assert_type_and_value(kwargs.get('bank_size', SequenceBank.DEFAULT_BANK_SIZE), int, location, 'bank_size', 1)
+
+        p_gen_sequence_type = kwargs.get('p_gen_sequence_type', None)
+        if p_gen_sequence_type is not None:
+            ParameterValidator.assert_in_valid_list(p_gen_sequence_type.upper(), [st.name for st in SequenceType], location,
+                                                    'p_gen_sequence_type')
+            p_gen_sequence_type = SequenceType[p_gen_sequence_type.upper()]
+
+        specification = kwargs['generative_model']
+        gen_model_cls = ReflectionHandler.get_class_by_name(specification['type'], "simulation/generative_models/")
+        generative_model = gen_model_cls.build_object(**{key: value for key, value in specification.items() if key != 'type'})
+
+        if kwargs.get('path', None):
+            path = Path(kwargs['path'])
+        else:
+            bank_name = hashlib.sha256(json.dumps([specification, str(p_gen_sequence_type)], sort_keys=True, default=str).encode())
+            path = EnvironmentSettings.cache_path / "sequence_banks" / bank_name.hexdigest()[:20]
+
+        return SequenceBank(generative_model, PathBuilder.build(path), kwargs.get('bank_size', SequenceBank.DEFAULT_BANK_SIZE),
+                            p_gen_sequence_type, specification)
+
+    @contextmanager
+    def _open_manifest(self):
+        """Yields the bank manifest (offset of the first unused sequence, indices and sizes of stored chunks and the next chunk index)
+        while holding the lock of the bank, and stores the changes to the manifest afterwards"""
+        with (self._path / SequenceBank.LOCK_FILENAME).open('a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                manifest_path = self._path / SequenceBank.MANIFEST_FILENAME
+                if manifest_path.is_file():
+                    manifest = json.loads(manifest_path.read_text())
+                    assert manifest['generative_model'] == json.loads(json.dumps(self._model_specification, default=str)) \
+                           and manifest['p_gen_sequence_type'] == str(self._p_gen_sequence_type), \
+                        f"{SequenceBank.__name__}: the sequence bank at {self._path} was made with a different generative model: " \
+                        f"{manifest['generative_model']} (p_gens: {manifest['p_gen_sequence_type']})."
+                else:
+                    manifest = {'generative_model': self._model_specification, 'p_gen_sequence_type': str(self._p_gen_sequence_type),
+                                'offset': 0, 'chunks': [], 'next_chunk': 0}
+
+                yield manifest
+
+                tmp_path = manifest_path.with_name(f"tmp_{manifest_path.name}")
+                tmp_path.write_text(json.dumps(manifest, default=str))
+                tmp_path.replace(manifest_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_unused_count(self) -> int:
+        with self._open_manifest() as manifest:
+            return sum(size for _, size in manifest['chunks']) - manifest['offset']
+
+    def _draw(self, count: int) -> BackgroundSequences:
+        """Takes the next count unused sequences from the bank, filling the bank first if needed; the sequences are read while holding
+        the lock, so that the chunks they come from can be removed as soon as all their sequences are used"""
+        while True:
+            with self._open_manifest() as manifest:
+                unused_count = sum(size for _, size in manifest['chunks']) - manifest['offset']
+                if unused_count >= count:
+                    start = manifest['offset']
+                    manifest['offset'] += count
+                    self._store.set_chunk_indices([index for index, _ in manifest['chunks']])
+                    sequences = self._store.get_sequences(np.arange(start, start + count))
+                    self._remove_used_chunks(manifest)
+                    break
+
+            if not self._wait_for_refill():
+                self._fill(self._reserve_chunk_index())
+
+        if unused_count - count < self._bank_size // 2:
+            self._start_refill()
+
+        return sequences
+
+    def _remove_used_chunks(self, manifest: dict):
+        """Deletes the chunks which lie entirely before the offset from the manifest and from disk and rebases the offset on the first
+        remaining chunk, so that only chunks with unused sequences are kept and memory-mapped; has to be called while holding the lock"""
+        while len(manifest['chunks']) > 0 and manifest['chunks'][0][1] <= manifest['offset']:
+            chunk_index, size = manifest['chunks'].pop(0)
+            manifest['offset'] -= size
+            ColumnarSequenceStore.remove_chunk(self._path, chunk_index)
+
+        self._store.set_chunk_indices([index for index, _ in manifest['chunks']])
+
+    def _reserve_chunk_index(self) -> int:
+        with self._open_manifest() as manifest:
+            manifest['next_chunk'] += 1
+            return manifest['next_chunk'] - 1
+
+    def _fill(self, chunk_index: int):
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+        sequences = self._generative_model.generate_sequences_in_memory(self._bank_size, seed, sequence_type=self._get_bank_sequence_type(),
+                                                                        compute_p_gen=self._p_gen_sequence_type is not None)
+        ColumnarSequenceStore.write_chunk(self._path, ColumnarSequenceStore.make_columns(sequences, self._p_gen_sequence_type is not None),
+                                          chunk_index)
+
+        with self._open_manifest() as manifest:
+            manifest['chunks'].append([chunk_index, len(sequences)])
+
+        print_log(f"{SequenceBank.__name__}: added {len(sequences)} sequences to the sequence bank at {self._path}.", True)
+
+    def _get_bank_sequence_type(self) -> SequenceType:
+        return self._p_gen_sequence_type if self._p_gen_sequence_type is not None else SequenceType.AMINO_ACID
+
+    def _start_refill(self):
+        """Fills the bank in a background process, unless it is already being filled by this bank or the bank is used from a worker
+        process (which cannot start processes of its own)"""
+        if (self._refill_process is None or not self._refill_process.is_alive()) and not current_process().daemon:
+            self._wait_for_refill()
+            self._refill_process = Process(target=_fill_bank_in_background, args=(dill.dumps(self), self._reserve_chunk_index()))
+            self._refill_process.start()
+
+    def _wait_for_refill(self) -> bool:
+        if self._refill_process is not None:
+            self._refill_process.join()
+            self._refill_process = None
+            return True
+        else:
+            return False
+
+    def generate_sequences(self, count: int, seed: int, path: Path, sequence_type: SequenceType, compute_p_gen: bool) -> Path:
+        write_bnp_data(path, self.generate_sequences_in_memory(count, seed, sequence_type, compute_p_gen))
+        return path
+
+    def generate_sequences_in_memory(self, count: int, seed: int, sequence_type: SequenceType, compute_p_gen: bool) -> BackgroundSequences:
+        sequences = self._draw(count)
+        if compute_p_gen and sequence_type != self._p_gen_sequence_type:
+            sequences.p_gen = self._generative_model.compute_p_gens(sequences, sequence_type)
+        return sequences
+
+    def compute_p_gens(self, sequences, sequence_type: SequenceType, sequence_field: str = None) -> np.ndarray:
+        return self._generative_model.compute_p_gens(sequences, sequence_type, sequence_field)
+
+    def compute_p_gen(self, sequence: dict, sequence_type: SequenceType, sequence_field: str = None) -> float:
+        return self._generative_model.compute_p_gen(sequence, sequence_type, sequence_field)
+
+    def can_compute_p_gens(self) -> bool:
+        return self._generative_model.can_compute_p_gens()
+
+    def get_p_gen_stats(self) -> dict:
+        return self._generative_model.get_p_gen_stats()
+
+    def set_number_of_processes(self, number_of_processes: int):
+        self._generative_model.set_number_of_processes(number_of_processes)
+
+    def close(self):
+        self._generative_model.close()
+
+    def can_generate_from_skewed_gene_models(self) -> bool:
+        return self._generative_model.can_generate_from_skewed_gene_models()
+
+    def generate_from_skewed_gene_models(self, v_genes: list, j_genes: list, seed: int, path: Path, sequence_type: SequenceType, batch_size: int,
+                                         compute_p_gen: bool):
+        return self._generative_model.generate_from_skewed_gene_models(v_genes, j_genes, seed, path, sequence_type, batch_size, compute_p_gen)
+
+    def generate_from_skewed_gene_models_in_memory(self, v_genes: list, j_genes: list, seed: int, sequence_type: SequenceType, batch_size: int,
+                                                   compute_p_gen: bool) -> BackgroundSequences:
+        return self._generative_model.generate_from_skewed_gene_models_in_memory(v_genes, j_genes, seed, sequence_type, batch_size,
+                                                                                compute_p_gen)
+
+    def is_same(self, model) -> bool:
+        return type(self) == type(model) and self._path == model._path
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_refill_process'] = None
+        return state
+
+
+def _fill_bank_in_background(bank: bytes, chunk_index: int):
+    bank = dill.loads(bank)
+    try:
+        bank._fill(chunk_index)
+    finally:
+        bank.close()
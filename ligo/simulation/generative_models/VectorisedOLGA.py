@@ -0,0 +1,182 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from ligo.simulation.generative_models.InternalOlgaModel import InternalOlgaModel
+from ligo.simulation.generative_models.OLGA import OLGA
+
+
+@dataclass
+class VectorisedOLGA(OLGA):
+    """
+    Generates sequences from the same V(D)J recombination models as :ref:`OLGA` (default OLGA models or IGoR model files), but samples the
+    recombination events of a whole batch at once with NumPy instead of generating one sequence per call to OLGA: gene choices, deletions
+    and insertion lengths are drawn from the model's distributions for all sequences in the batch, insertions are sampled from the
+    model's Markov chains one position at a time for the whole batch, the junctions are assembled and translated as flat arrays, and
+    sequences which are not productive (out of frame, with a stop codon, or without the conserved C and F/V/W residues) are rejected as in
+    OLGA. The generated sequences follow the same distribution as OLGA's, but are not the same sequences for the same seed.
+
+    Generation probabilities, skewed V/J gene models and parallel generation work as for :ref:`OLGA`.
+
+    Arguments:
+
+    - model_path (str): if not default model, this parameter should point to a folder where the four OLGA/IGOR format files are stored (could also be inferred from some experimental data)
+
+    - default_model_name (str): if not using custom models, one of the OLGA default models could be specified here; the value should be the same as it would be passed to command line in OLGA: e.g., humanTRB, human IGH
+
+    - number_of_processes (int): how many processes to use to generate each batch of sequences (default is 1), as for :ref:`OLGA`
+
+    YAML specification:
+
+    .. indent with spaces
+    .. code-block:: yaml
+
+        generative_model:
+            type: VectorisedOLGA
+            model_path: None
+            default_model_name: humanTRB
+            number_of_processes: 1
+
+    """
+
+    NUCLEOTIDES = np.frombuffer(b"ACGT", dtype=np.uint8)
+    CODON_TABLE = np.frombuffer(b"KQE*TPASRRG*ILVLNHDYTPASSRGCILVFKQE*TPASRRGWMLVLNHDYTPASSRGCILVF", dtype=np.uint8)
+    CONSERVED_J_RESIDUES = np.frombuffer(b"FVW", dtype=np.uint8)
+    MAX_SAMPLE_SIZE = 100000
+
+    def _sample_productive_sequences(self, count: int, olga_model: InternalOlgaModel) -> tuple:
+        """Samples batches of recombination events until count productive sequences are found; the size of each batch is estimated from
+        the fraction of productive sequences in the previous batches"""
+        gen_model = olga_model.sequence_gen_model
+        segments = {name: _make_segment_matrix(getattr(gen_model, f"cut{name}_genomic_CDR3_segs"))
+                    for name in (['V', 'D', 'J'] if self.is_vdj else ['V', 'J'])}
+        sample_func = self._sample_vdj_batch if self.is_vdj else self._sample_vj_batch
+
+        batches, found, sampled = [], 0, 0
+        while found < count:
+            sample_size = min(VectorisedOLGA.MAX_SAMPLE_SIZE, int((count - found) * (sampled + 1) / (found + 1) * 1.1) + 10)
+            batch = sample_func(sample_size, gen_model, segments)
+            batches.append(batch)
+            found += len(batch[0])
+            sampled += sample_size
+
+        sequences, sequences_aa, v_indices, j_indices = [[value for batch in batches for value in batch[index]] for index in range(4)]
+        return sequences[:count], sequences_aa[:count], v_indices[:count], j_indices[:count]
+
+    def _sample_vdj_batch(self, size: int, gen_model, segments: dict) -> tuple:
+        dj_choice = _sample(gen_model.CPDJ, size)
+        events = {'V': _sample(gen_model.CPV, size), 'D': dj_choice // gen_model.num_J_genes, 'J': dj_choice % gen_model.num_J_genes}
+        events['delV'] = _sample_rows(gen_model.given_V_CPdelV, events['V'])
+        events['delJ'] = _sample_rows(gen_model.given_J_CPdelJ, events['J'])
+        del_d_choice = _sample_rows(gen_model.given_D_CPdelDldelDr, events['D'])
+        events['delDl'], events['delDr'] = del_d_choice // gen_model.num_delDr_poss, del_d_choice % gen_model.num_delDr_poss
+        events['insVD'] = _sample(gen_model.CinsVD, size)
+        events['insDJ'] = _sample(gen_model.CinsDJ, size)
+
+        v_length, d_length, j_length = [segments[name][1][events[name]] for name in ['V', 'D', 'J']]
+        keep = (v_length > events['delV']) & (d_length >= events['delDl'] + events['delDr']) & (j_length >= events['delJ'])
+        keep &= (v_length - events['delV'] + d_length - events['delDl'] - events['delDr'] + j_length - events['delJ'] + events['insVD']
+                 + events['insDJ']) % 3 == 0
+        events = {key: value[keep] for key, value in events.items()}
+
+        ins_vd = _sample_insertions(events['insVD'], gen_model.C_Rvd, gen_model.C_first_nt_bias_insVD)
+        ins_dj = _sample_insertions(events['insDJ'], gen_model.C_Rdj, gen_model.C_first_nt_bias_insDJ)
+        indices = np.arange(len(events['V']))
+
+        parts = [(segments['V'][0], events['V'], np.zeros_like(events['V']), segments['V'][1][events['V']] - events['delV'], False),
+                 (ins_vd, indices, np.zeros_like(indices), events['insVD'], False),
+                 (segments['D'][0], events['D'], events['delDl'], segments['D'][1][events['D']] - events['delDl'] - events['delDr'], False),
+                 (ins_dj, indices, np.zeros_like(indices), events['insDJ'], True),
+                 (segments['J'][0], events['J'], events['delJ'], segments['J'][1][events['J']] - events['delJ'], False)]
+
+        return _make_productive_sequences(parts, events['V'], events['J'])
+
+    def _sample_vj_batch(self, size: int, gen_model, segments: dict) -> tuple:
+        vj_choice = _sample(gen_model.CPVJ, size)
+        events = {'V': vj_choice // gen_model.num_J_genes, 'J': vj_choice % gen_model.num_J_genes}
+        events['delV'] = _sample_rows(gen_model.given_V_CPdelV, events['V'])
+        events['delJ'] = _sample_rows(gen_model.given_J_CPdelJ, events['J'])
+        events['insVJ'] = _sample(gen_model.CPinsVJ, size)
+
+        v_length, j_length = [segments[name][1][events[name]] for name in ['V', 'J']]
+        keep = (v_length > events['delV']) & (j_length >= events['delJ'])
+        keep &= (v_length - events['delV'] + j_length - events['delJ'] + events['insVJ']) % 3 == 0
+        events = {key: value[keep] for key, value in events.items()}
+
+        ins_vj = _sample_insertions(events['insVJ'], gen_model.C_Rvj, gen_model.C_first_nt_bias_insVJ)
+        indices = np.arange(len(events['V']))
+
+        parts = [(segments['V'][0], events['V'], np.zeros_like(events['V']), segments['V'][1][events['V']] - events['delV'], False),
+                 (ins_vj, indices, np.zeros_like(indices), events['insVJ'], False),
+                 (segments['J'][0], events['J'], events['delJ'], segments['J'][1][events['J']] - events['delJ'], False)]
+
+        return _make_productive_sequences(parts, events['V'], events['J'])
+
+
+def _make_segment_matrix(segments: list) -> tuple:
+    """Returns the germline segments as a matrix of nucleotide codes (0-3 for A, C, G, T), padded to the longest segment, and their
+    lengths"""
+    lengths = np.array([len(segment) for segment in segments], dtype=int)
+    matrix = np.zeros((len(segments), max(lengths.max(initial=0), 1)), dtype=np.uint8)
+    codes = np.zeros(256, dtype=np.uint8)
+    codes[VectorisedOLGA.NUCLEOTIDES] = np.arange(4)
+    for index, segment in enumerate(segments):
+        matrix[index, :lengths[index]] = codes[np.frombuffer(segment.upper().encode(), dtype=np.uint8)]
+    return matrix, lengths
+
+
+def _sample(cumulative: np.ndarray, size: int) -> np.ndarray:
+    return np.minimum(np.searchsorted(cumulative, np.random.random(size)), len(cumulative) - 1)
+
+
+def _sample_rows(cumulative: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Samples one value per row index from the conditional cumulative distribution in that row of the matrix"""
+    return np.minimum((cumulative[rows] < np.random.random(len(rows))[:, np.newaxis]).sum(axis=1), cumulative.shape[1] - 1)
+
+
+def _sample_insertions(lengths: np.ndarray, cumulative_transitions: np.ndarray, cumulative_first_nt: np.ndarray) -> np.ndarray:
+    """Samples insertions from the Markov model position by position for all sequences: the first nucleotide from the first nucleotide
+    bias and the following ones given the previous one; returns a matrix with one row per sequence, to be cut to the insertion lengths"""
+    insertions = np.zeros((len(lengths), max(lengths.max(initial=0), 1)), dtype=np.uint8)
+    if len(lengths) > 0:
+        insertions[:, 0] = _sample(cumulative_first_nt, len(lengths))
+        for position in range(1, insertions.shape[1]):
+            insertions[:, position] = _sample_rows(cumulative_transitions, insertions[:, position - 1])
+    return insertions
+
+
+def _make_productive_sequences(parts: list, v_indices: np.ndarray, j_indices: np.ndarray) -> tuple:
+    """
+    Assembles the junctions from parts given as (source matrix, source row per sequence, start position in the row per sequence,
+    length per sequence, whether the part is reversed) into one flat array of nucleotide codes, translates them and returns the
+    nucleotide and amino acid sequences and gene indices of the productive ones
+    """
+    part_lengths = np.stack([part[3] for part in parts], axis=1).astype(int)
+    lengths = part_lengths.sum(axis=1)
+    offsets = np.cumsum(lengths) - lengths
+    part_offsets = offsets[:, np.newaxis] + np.cumsum(part_lengths, axis=1) - part_lengths
+    junctions = np.zeros(lengths.sum(), dtype=np.uint8)
+
+    for part_index, (matrix, rows, starts, part_length, reverse) in enumerate(parts):
+        part_length = part_length.astype(int)
+        sequence_ids = np.repeat(np.arange(len(part_length)), part_length)
+        positions = np.arange(part_length.sum()) - np.repeat(np.cumsum(part_length) - part_length, part_length)
+        columns = starts[sequence_ids] + (part_length[sequence_ids] - 1 - positions if reverse else positions)
+        junctions[part_offsets[sequence_ids, part_index] + positions] = matrix[rows[sequence_ids], columns]
+
+    codons = junctions.reshape(-1, 3).astype(int)
+    amino_acids = VectorisedOLGA.CODON_TABLE[codons[:, 0] + 4 * codons[:, 1] + 16 * codons[:, 2]]
+    aa_lengths, aa_offsets = lengths // 3, offsets // 3
+
+    productive = lengths > 0
+    has_stop = np.add.reduceat((amino_acids == ord('*')).astype(int), aa_offsets[productive]) > 0 if productive.any() else np.array([])
+    productive[productive] = ~has_stop
+    productive[productive] = (amino_acids[aa_offsets[productive]] == ord('C')) \
+                             & np.isin(amino_acids[aa_offsets[productive] + aa_lengths[productive] - 1], VectorisedOLGA.CONSERVED_J_RESIDUES)
+
+    nt_text = VectorisedOLGA.NUCLEOTIDES[junctions].tobytes().decode()
+    aa_text = amino_acids.tobytes().decode()
+    sequences = [nt_text[start:start + length] for start, length in zip(offsets[productive].tolist(), lengths[productive].tolist())]
+    sequences_aa = [aa_text[start:start + length] for start, length in zip(aa_offsets[productive].tolist(), aa_lengths[productive].tolist())]
+
+    return sequences, sequences_aa, v_indices[productive].tolist(), j_indices[productive].tolist()
@@ -1,7 +1,7 @@
 import random
 from dataclasses import dataclass
 from itertools import combinations
-from typing import List
+from typing import List, Tuple
 
 import numpy as np
 
@@ -100,6 +100,11 @@ class SeedMotif(Motif):
     def get_alphabet(self) -> List[str]:
         return [letter for letter in list(self.seed) if letter != "/"]
 
+    def get_allowed_substitutions(self, sequence_type: SequenceType) -> Tuple[list, list]:
+        """Returns the positions in the seed which can be substituted and the letters which can be used for substitutions"""
+        alphabet_weights = self.set_default_weights(self.alphabet_weights, EnvironmentSettings.get_sequence_alphabet(sequence_type=sequence_type))
+        return self._get_allowed_positions(self.seed), [letter for letter, weight in alphabet_weights.items() if weight > 0]
+
     def _get_allowed_positions(self, base) -> list:
         allowed_positions = [i for i in range(len(base)) if base[i] != "/"]
         allowed_positions = [key for key, val in self.set_default_weights(self.position_weights, allowed_positions).items() if val > 0]
@@ -35,13 +35,22 @@ class Signal:
 
     - source_file (str): path to the file where the custom signal function is; cannot be combined with the arguments listed above (motifs, v_call, j_call, sequence_position_weights)
 
-    - is_present_func (str): name of the function from the source_file file that will be used to specify the signal; the function's signature must be:
+    - is_present_func (str): name of the function from the source_file file that will be used to specify the signal; the function is either called for each sequence, in which case its signature must be:
 
     .. code-block:: python
 
         def is_present(sequence_aa: str, sequence: str, v_call: str, j_call: str) -> bool:
             # custom implementation where all or some of these arguments can be used
 
+    or it is called once for a batch of sequences if its parameters are annotated as lists (of strings) or as bionumpy encoded arrays; parameters of batched functions are matched to the columns by name (any of sequence_aa, sequence, v_call, j_call), and the function has to return a boolean value for each sequence:
+
+    .. code-block:: python
+
+        def is_present(sequence_aa: List[str], v_call: List[str]) -> np.ndarray:
+            # custom implementation returning an array of booleans, one per sequence
+
+    Per-sequence functions are evaluated in parallel when the simulation uses multiple processes and sequences are annotated outside of worker processes.
+
     - clonal_frequency (dict): clonal frequency in Ligo is simulated through `scipy's zeta distribution function for generating random numbers <https://docs.scipy.org/doc/scipy/reference/generated/scipy.stats.zipf.html>`_, with parameters provided under clonal_frequency parameter. If clonal frequency should not be used, this parameter can be None
 
     .. code-block:: yaml
@@ -83,6 +92,7 @@ class Signal:
     j_call: str = None
     clonal_frequency: dict = None
     is_present_custom_func: typing.Callable = None
+    custom_func_batch_columns: typing.Dict[str, bool] = None
 
     def get_all_motif_instances(self, sequence_type: SequenceType):
         motif_instances = []
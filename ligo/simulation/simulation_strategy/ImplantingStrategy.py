@@ -14,9 +14,10 @@ from ligo.simulation.generative_models.BackgroundSequences import BackgroundSequ
 from ligo.simulation.implants.MotifInstance import MotifInstance
 from ligo.simulation.implants.Signal import Signal, SignalPair
 from ligo.simulation.simulation_strategy.SimulationStrategy import SimulationStrategy
+from ligo.simulation.util.MotifMatcher import MotifMatcher
 from ligo.simulation.util.bnp_util import merge_dataclass_objects
 from ligo.simulation.util.util import choose_implant_position, filter_out_illegal_sequences, \
-    annotate_sequences
+    annotate_sequences, make_packed_signal_positions
 from ligo.util.PositionHelper import PositionHelper
 
 
@@ -56,15 +57,15 @@ class ImplantingStrategy(SimulationStrategy):
 
             if remove_positives_first and len(processed_seqs) > 0:
                 processed_seqs = self._remove_invalid(processed_seqs, sequence_type, sim_item, all_signals,
-                                                      annotated_dc)
+                                                      annotated_dc, kwargs.get('motif_matcher'))
         else:
             processed_seqs = None
 
         return processed_seqs
 
-    def _remove_invalid(self, processed_seqs, sequence_type, sim_item, all_signals, annotated_dc):
+    def _remove_invalid(self, processed_seqs, sequence_type, sim_item, all_signals, annotated_dc, motif_matcher: MotifMatcher = None):
         processed_seqs = annotate_sequences(processed_seqs, sequence_type == SequenceType.AMINO_ACID, all_signals,
-                                            annotated_dc, sim_item.name)
+                                            annotated_dc, sim_item.name, motif_matcher)
         return filter_out_illegal_sequences(processed_seqs, sim_item, all_signals, max_signals_per_sequence=1,
                                             max_motifs_per_sequence=1)
 
@@ -120,15 +121,14 @@ class ImplantingStrategy(SimulationStrategy):
 
         else:
             region_type = RegionType[getattr(sequence_row, 'region_type').to_string()]
-            position_weights = PositionHelper.get_imgt_position_weights_for_implanting(sequence_length, region_type,
-                                                                                       signal.sequence_position_weights,
-                                                                                       limit)
-            if sum(list(position_weights.values())) == 0:
+            position_weights = PositionHelper.get_position_weights_for_implanting(sequence_length, region_type,
+                                                                                  signal.sequence_position_weights, limit)
+            if position_weights.sum() == 0:
                 logging.info(f"Sequence {sequence_row} has no valid positions where the signal could be implanted, "
                              f"skipping the sequence.")
                 return None
 
-            implant_position = choose_implant_position(list(position_weights.keys()), position_weights)
+            implant_position = choose_implant_position(position_weights)
 
         new_sequence = self._make_new_sequence(sequence_row, motif_instance, implant_position, sequence_type)
 
@@ -149,11 +149,9 @@ class ImplantingStrategy(SimulationStrategy):
             new_sequence['p_gen'] = -1.
 
         new_sequence[signal.id] = 1
-        new_sequence[f'{signal.id}_positions'] = ["m"] + ["0" if ind != implant_position else "1" for ind in
-                                                          range(sequence_length)]
-        new_sequence[f'{signal.id}_positions'] = "".join(new_sequence[f'{signal.id}_positions'])
+        new_sequence[f'{signal.id}_positions'] = make_packed_signal_positions(sequence_length, implant_position)
 
-        zero_mask = "m" + "".join(["0" for _ in range(len(new_sequence[sequence_type.value]))])
+        zero_mask = make_packed_signal_positions(len(new_sequence[sequence_type.value]))
         new_sequence = {**{f"{s.id}_positions": zero_mask for s in all_signals},
                         **{s.id: 0 for s in all_signals if s.id != signal.id},
                         **new_sequence,
@@ -0,0 +1,178 @@
+import math
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import numpy as np
+from bionumpy import AminoAcidEncoding, DNAEncoding, get_motif_scores
+from bionumpy.encoded_array import as_encoded_array
+from npstructures import RaggedArray
+
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+from ligo.environment.SequenceType import SequenceType
+from ligo.simulation.implants.LigoPWM import LigoPWM
+from ligo.simulation.implants.SeedMotif import SeedMotif
+from ligo.simulation.implants.Signal import Signal
+from ligo.simulation.util.bnp_util import pad_ragged_array
+
+
+class MotifMatcher:
+    """
+    Matches the motifs of all signals against a batch of sequences at once.
+
+    When the matcher is built, the motif instances of all signals (regexes with letters, sets of letters like [AC], any letter '.' and
+    gaps like .{0,2}) are expanded into fixed-length patterns and indexed by pattern length and positions of the letters which have to
+    match (the mask). Patterns with the same mask share one index, regardless of the signal, where each pattern is stored as an integer
+    key computed from its letters and points to the motifs it belongs to. For a batch of sequences, the keys of all windows of the
+    sequences are computed once per mask and looked up in the index, so the cost of matching grows with the number of distinct masks
+    instead of the number of motif instances. Patterns with too many letters to fit in a key are compared directly. Motifs defined by
+    position weight matrices are scored as before.
+
+    Seed motifs with hamming distance probabilities are not expanded into one regex per combination of substituted positions: each
+    window (for each allowed gap) is compared with the seed once, and it matches if every mismatch is at a position which can be
+    substituted (by position_weights) with a letter which can be used (by alphabet_weights), and the number of substitutions can be one
+    of the hamming distances with non-zero probability (counting positions where the seed letter itself is an allowed substitution as
+    optional substitutions).
+
+    Matches are reported per motif of a signal (and per motif in a group of motifs which have to co-occur) as boolean ragged arrays
+    with the shape of the sequences, where a position is True if a motif instance starts there and ends within the sequence.
+    """
+
+    def __init__(self, signals: List[Signal], sequence_type: SequenceType):
+        self._encoding = AminoAcidEncoding if sequence_type == SequenceType.AMINO_ACID else DNAEncoding
+        alphabet = self._encoding.get_alphabet()
+        self._codes = {letter: code for code, letter in enumerate(alphabet)}
+        self._max_key_length = int(63 * math.log(2) / math.log(len(alphabet)))
+        self._powers = len(alphabet) ** np.arange(self._max_key_length, dtype=np.int64)
+        self._units = {}
+        self._pwms = []
+        self._hamming_motifs = []
+
+        patterns = {}
+        for signal in signals:
+            if signal.motifs is not None:
+                for motif_index, motif_group in enumerate(signal.motifs):
+                    for part_index, motif in enumerate(motif_group if isinstance(motif_group, list) else [motif_group]):
+                        unit = self._units.setdefault((signal.id, motif_index, part_index), len(self._units))
+                        if isinstance(motif, LigoPWM):
+                            self._pwms.append((unit, motif.get_all_possible_instances(sequence_type)))
+                        elif isinstance(motif, SeedMotif) and motif.hamming_distance_probabilities:
+                            self._hamming_motifs.append((unit, self._make_hamming_motif(motif, sequence_type)))
+                        else:
+                            self._add_patterns(patterns, motif.get_all_possible_instances(sequence_type), unit)
+
+        self._tables = [self._make_table(length, positions, pattern_units) for (length, positions), pattern_units in patterns.items()]
+        self._max_length = max([table['length'] for table in self._tables]
+                               + [offsets[-1] + 1 for _, motif in self._hamming_motifs for offsets in motif['offsets']], default=0)
+
+    def _add_patterns(self, patterns: dict, regexes: list, unit: int):
+        for regex in regexes:
+            for pattern in expand_motif_regex(regex):
+                positions = tuple(index for index, letter in enumerate(pattern) if letter != '.')
+                pattern_codes = tuple(self._codes[pattern[index]] for index in positions)
+                patterns.setdefault((len(pattern), positions), {}).setdefault(pattern_codes, set()).add(unit)
+
+    def _make_table(self, length: int, positions: tuple, pattern_units: Dict[tuple, set]) -> dict:
+        table = {'length': length, 'positions': np.array(positions, dtype=int)}
+        pattern_codes = np.array(list(pattern_units.keys()), dtype=np.int64).reshape(len(pattern_units), len(positions))
+        units = [sorted(units) for units in pattern_units.values()]
+
+        if len(positions) <= self._max_key_length:
+            keys = pattern_codes @ self._powers[:len(positions)]
+            order = np.argsort(keys)
+            table['keys'] = keys[order]
+            table['offsets'] = np.cumsum([0] + [len(units[index]) for index in order])
+            table['units'] = np.array([unit for index in order for unit in units[index]], dtype=int)
+        else:
+            table['patterns'] = list(zip(pattern_codes, units))
+
+        return table
+
+    def _make_hamming_motif(self, motif: SeedMotif, sequence_type: SequenceType) -> dict:
+        seed_indices = [index for index, letter in enumerate(motif.seed) if letter != "/"]
+        gap_index = motif.seed.index("/") if "/" in motif.seed else len(motif.seed)
+        gaps = range(motif.min_gap, motif.max_gap + 1) if "/" in motif.seed else [0]
+        positions, letters = motif.get_allowed_substitutions(sequence_type)
+
+        letter_mask = np.zeros(len(self._codes), dtype=bool)
+        if len(letters) == len(EnvironmentSettings.get_sequence_alphabet(sequence_type)):
+            letter_mask[:] = True
+        else:
+            letter_mask[[self._codes[letter] for letter in letters]] = True
+
+        seed = np.array([self._codes[motif.seed[index]] for index in seed_indices], dtype=np.int64)
+        position_mask = np.isin(seed_indices, positions)
+
+        return {'seed': seed, 'positions': position_mask, 'letters': letter_mask,
+                'optional': position_mask & letter_mask[seed],
+                'distances': np.array([distance for distance, probability in motif.hamming_distance_probabilities.items()
+                                       if probability > 0], dtype=int),
+                'offsets': [np.array([index if index < gap_index else index - 1 + gap for index in seed_indices], dtype=int)
+                            for gap in gaps]}
+
+    def match(self, sequence_array) -> Dict[Tuple[str, int, int], RaggedArray]:
+        """
+        Returns matches for each motif as a dictionary with keys (signal id, motif index in the signal, index of the motif in the group
+        of co-occurring motifs or 0 for single motifs)
+        """
+        sequence_array = as_encoded_array(sequence_array, self._encoding)
+        lengths = np.asarray(sequence_array.shape[1], dtype=int)
+        codes = np.concatenate([sequence_array.ravel().raw().astype(np.int64), np.zeros(self._max_length, dtype=np.int64)])
+        remaining_lengths = np.repeat(np.cumsum(lengths), lengths) - np.arange(lengths.sum())
+        windows = np.lib.stride_tricks.as_strided(codes, shape=(lengths.sum(), self._max_length), strides=codes.strides * 2,
+                                                  writeable=False)
+        matches = np.zeros((len(self._units), lengths.sum()), dtype=bool)
+
+        for table in self._tables:
+            window_codes = windows[:, table['positions']]
+            fits = remaining_lengths >= table['length']
+            if 'keys' in table:
+                self._match_keys(table, window_codes @ self._powers[:window_codes.shape[1]], fits, matches)
+            else:
+                for pattern_codes, units in table['patterns']:
+                    matches[np.ix_(units, np.all(window_codes == pattern_codes, axis=1) & fits)] = True
+
+        for unit, motif in self._hamming_motifs:
+            matches[unit] = self._match_hamming_motif(motif, windows, remaining_lengths)
+
+        for unit, pwm in self._pwms:
+            matches[unit] = pad_ragged_array(get_motif_scores(sequence_array, pwm.pwm_matrix) > pwm.threshold, sequence_array.shape,
+                                             False).ravel()
+
+        return {key: RaggedArray(matches[unit], sequence_array.shape) for key, unit in self._units.items()}
+
+    def _match_hamming_motif(self, motif: dict, windows: np.ndarray, remaining_lengths: np.ndarray) -> np.ndarray:
+        matches = np.zeros(windows.shape[0], dtype=bool)
+        for offsets in motif['offsets']:
+            window_codes = windows[:, offsets]
+            mismatches = window_codes != motif['seed']
+            substitutable = np.all(~mismatches | (motif['positions'] & motif['letters'][window_codes]), axis=1)
+            min_distance = mismatches.sum(axis=1)
+            max_distance = min_distance + (~mismatches & motif['optional']).sum(axis=1)
+            allowed_distance = np.any((min_distance[:, np.newaxis] <= motif['distances']) & (motif['distances'] <= max_distance[:, np.newaxis]),
+                                      axis=1)
+            matches |= substitutable & allowed_distance & (remaining_lengths >= offsets[-1] + 1)
+        return matches
+
+    def _match_keys(self, table: dict, window_keys: np.ndarray, fits: np.ndarray, matches: np.ndarray):
+        key_indices = np.minimum(np.searchsorted(table['keys'], window_keys), len(table['keys']) - 1)
+        positions = np.flatnonzero((table['keys'][key_indices] == window_keys) & fits)
+        starts, ends = table['offsets'][key_indices[positions]], table['offsets'][key_indices[positions] + 1]
+        counts = ends - starts
+        unit_indices = np.repeat(starts, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        matches[table['units'][unit_indices], np.repeat(positions, counts)] = True
+
+
+@lru_cache(maxsize=None)
+def expand_motif_regex(regex: str) -> Tuple[str, ...]:
+    """Expands a motif regex into fixed-length patterns where '.' matches any letter, e.g., A[CD].{0,1}E into ACE, ADE, AC.E and AD.E"""
+    patterns = ['']
+    for gap_min, gap_max, letter_set, letter in re.findall(r"\.\{(\d*),(\d+)\}|\[([^\]]+)\]|(.)", regex):
+        if letter:
+            options = [letter]
+        elif letter_set:
+            options = list(letter_set)
+        else:
+            options = ["." * gap for gap in range(int(gap_min) if gap_min else 0, int(gap_max) + 1)]
+        patterns = [pattern + option for pattern in patterns for option in options]
+    return tuple(dict.fromkeys(patterns))
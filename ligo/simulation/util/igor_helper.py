@@ -1,9 +1,61 @@
+import copy
 import re
 import shutil
 from pathlib import Path
+from typing import Union
 
 import numpy as np
 import pandas as pd
+from olga.load_model import GenerativeModelVDJ, GenerativeModelVJ
+
+
+def make_skewed_model(generative_model: Union[GenerativeModelVDJ, GenerativeModelVJ], model_v_genes: list, model_j_genes: list,
+                      v_genes: list, j_genes: list) -> Union[GenerativeModelVDJ, GenerativeModelVJ]:
+    """
+
+    Args:
+        generative_model: loaded OLGA generative model (it is not changed)
+        model_v_genes: names of V genes in the order of the model's V gene marginals
+        model_j_genes: names of J genes in the order of the model's J gene marginals
+        v_genes: a list of v gene patterns to be matched against the original model
+        j_genes: a list of j gene patterns to be matched against the original model
+
+    Returns:
+        a copy of the model where probabilities of genes that do not match the patterns are set to 0 and the V gene (PV) and joint D and
+        J gene (PDJ) marginals or the joint V and J gene marginals (PVJ) are renormalised, keeping P(J|V) for the allowed J genes in VJ
+        models as make_skewed_model_files does
+
+    """
+
+    _check_if_all_genes_present({'v': model_v_genes, 'j': model_j_genes}, v_genes, j_genes)
+
+    v_gene_mask = _make_gene_mask(model_v_genes, v_genes)
+    j_gene_mask = _make_gene_mask(model_j_genes, j_genes)
+
+    skewed_model = copy.deepcopy(generative_model)
+
+    if isinstance(generative_model, GenerativeModelVDJ):
+        skewed_model.PV = _normalise(generative_model.PV * v_gene_mask)
+        skewed_model.PDJ = _normalise(generative_model.PDJ * j_gene_mask[np.newaxis, :])
+    else:
+        p_v = generative_model.PVJ.sum(axis=1, keepdims=True)
+        p_vj = generative_model.PVJ * j_gene_mask[np.newaxis, :]
+        p_vj_sum = p_vj.sum(axis=1, keepdims=True)
+        p_j_given_v = np.divide(p_vj, p_vj_sum, out=np.zeros_like(p_vj), where=p_vj_sum > 0)
+        skewed_model.PVJ = _normalise(p_j_given_v * p_v * v_gene_mask[:, np.newaxis])
+
+    return skewed_model
+
+
+def _make_gene_mask(model_genes: list, genes: list) -> np.ndarray:
+    if len(genes) == 0:
+        return np.ones(len(model_genes))
+    else:
+        return np.array([any(gene in model_gene for gene in genes) for model_gene in model_genes], dtype=float)
+
+
+def _normalise(probabilities: np.ndarray) -> np.ndarray:
+    return probabilities / probabilities.sum()
 
 
 def make_skewed_model_files(v_genes: list, j_genes: list, original_model_path: Path, new_model_path: Path) -> Path:
@@ -1,20 +1,26 @@
+import binascii
 import dataclasses
+import json
 import logging
-import uuid
+import math
+import os
 from dataclasses import make_dataclass, fields as get_fields
+from enum import Enum
 from itertools import chain
+from multiprocessing import Pool, current_process
 from pathlib import Path
-from typing import List, Dict, Union
+from typing import List, Dict
 
 import bionumpy as bnp
 import dill
 import numpy as np
 import yaml
-from bionumpy import AminoAcidEncoding, DNAEncoding, EncodedRaggedArray, get_motif_scores
+from bionumpy import AminoAcidEncoding, DNAEncoding, EncodedRaggedArray
 from bionumpy.bnpdataclass import bnpdataclass, BNPDataClass
+from bionumpy.encoded_array import EncodedArray
 from bionumpy.encodings import BaseEncoding
 from bionumpy.io import delimited_buffers
-from bionumpy.sequence.string_matcher import RegexMatcher, StringMatcher
+from bionumpy.sequence.string_matcher import StringMatcher
 from npstructures import RaggedArray
 from scipy.stats import zipf
 
@@ -22,15 +28,16 @@ from ligo import Constants
 from ligo.data_model.receptor.RegionType import RegionType
 from ligo.data_model.receptor.receptor_sequence.Chain import Chain
 from ligo.data_model.receptor.receptor_sequence.ReceptorSequence import ReceptorSequence
-from ligo.data_model.receptor.receptor_sequence.SequenceMetadata import SequenceMetadata
+from ligo.data_model.receptor.receptor_sequence.SequenceFrameType import SequenceFrameType
 from ligo.data_model.repertoire.Repertoire import Repertoire
 from ligo.environment.SequenceType import SequenceType
+from ligo.simulation.SequencePool import SequencePool
 from ligo.simulation.SimConfigItem import SimConfigItem
 from ligo.simulation.generative_models.BackgroundSequences import BackgroundSequences
-from ligo.simulation.implants.LigoPWM import LigoPWM
-from ligo.simulation.implants.MotifInstance import MotifInstance, MotifInstanceGroup
+from ligo.simulation.implants.MotifInstance import MotifInstance
 from ligo.simulation.implants.Signal import Signal, SignalPair
-from ligo.simulation.util.bnp_util import merge_dataclass_objects, pad_ragged_array
+from ligo.simulation.util.MotifMatcher import MotifMatcher
+from ligo.simulation.util.bnp_util import merge_dataclass_objects
 from ligo.util.PathBuilder import PathBuilder
 from ligo.util.PositionHelper import PositionHelper
 
@@ -67,27 +74,69 @@ def get_bnp_data(sequence_path, bnp_data_class):
         return data
 
 
-def make_receptor_sequence_objects(sequences: BackgroundSequences, metadata, immune_events: dict, custom_params: list,
-                                   chain) -> List[ReceptorSequence]:
-    return [ReceptorSequence(seq.sequence_aa.to_string(), seq.sequence.to_string(), identifier=uuid.uuid4().hex,
-                             metadata=construct_sequence_metadata_object(seq, metadata, custom_params, immune_events,
-                                                                         chain)) for seq in sequences]
+def make_custom_params_columns(sequences: BackgroundSequences, metadata: dict, immune_events: dict, custom_params: list) \
+        -> Dict[str, np.ndarray]:
+    """Returns JSON-encoded values per sequence of each custom parameter of SequenceMetadata, in the order in which they are stored"""
+    count = len(sequences)
+    return {**{key: np.full(count, _to_json(value), dtype=object) for key, value in metadata.items()},
+            **{param[0]: _to_json_column(getattr(sequences, param[0]).tolist()) for param in custom_params},
+            **{key: np.full(count, _to_json(value), dtype=object) for key, value in immune_events.items()}}
 
 
-def construct_sequence_metadata_object(sequence, metadata: dict, custom_params, immune_events: dict,
-                                       chain: Chain) -> SequenceMetadata:
-    custom = {}
+def make_sequence_columns(sequences: BackgroundSequences, custom_params_columns: Dict[str, np.ndarray], chain: Chain) \
+        -> Dict[str, np.ndarray]:
+    count = len(sequences)
+    parts = ['{"v_call": ', _to_json_column(sequences.v_call.tolist()), ', "j_call": ', _to_json_column(sequences.j_call.tolist()),
+             f', "chain": {_to_json(chain)}, "duplicate_count": null, "frame_type": {_to_json(SequenceFrameType.IN)}, "region_type": ',
+             _to_json_column(sequences.region_type.tolist(), lambda region_type: RegionType(region_type) if region_type else None),
+             ', "cell_id": null, "custom_params": ', make_json_object_column(custom_params_columns, count), "}"]
+
+    metadata_column = np.full(count, "", dtype=object)
+    for part in parts:
+        metadata_column = metadata_column + part
+
+    return {'amino_acid_sequence': np.array(sequences.sequence_aa.tolist(), dtype=str),
+            'nucleotide_sequence': np.array(sequences.sequence.tolist(), dtype=str),
+            'identifier': make_identifiers(count), 'metadata': metadata_column.astype(str),
+            'annotation': np.full(count, '', dtype=str), 'version': np.full(count, ReceptorSequence.version, dtype=str)}
+
+
+def make_receptor_columns(receptor_class, chain_columns: Dict[str, Dict[str, np.ndarray]],
+                          custom_params_columns: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """
+    Pairs the sequences with the same index from the sequence columns of two chains (given per chain name of the receptor class, e.g.,
+    alpha and beta) into receptor columns; the metadata of the receptors combines the custom parameters of both chains as when building
+    receptors with ReceptorBuilder.build_objects_from_pairs
+    """
+    count = len(list(chain_columns.values())[0]['identifier'])
+    return {**{f"{chain_name}_{key}": values for chain_name, columns in chain_columns.items() for key, values in columns.items()},
+            'identifier': make_identifiers(count),
+            'metadata': make_json_object_column({key: values for columns in custom_params_columns for key, values in columns.items()},
+                                                count).astype(str),
+            'version': np.full(count, receptor_class.version, dtype=str)}
+
+
+def make_json_object_column(values: Dict[str, np.ndarray], count: int) -> np.ndarray:
+    """Returns a JSON object per row from JSON-encoded values per key"""
+    column = np.full(count, "{", dtype=object)
+    for index, (key, key_values) in enumerate(values.items()):
+        column = column + ((", " if index > 0 else "") + f"{_to_json(key)}: ") + key_values
+    return column + "}"
+
+
+def make_identifiers(count: int) -> np.ndarray:
+    """Returns count random 32-character hex identifiers (as uuid4().hex, but generated at once)"""
+    return np.frombuffer(binascii.hexlify(os.urandom(16 * count)), dtype='S32').astype('U32')
 
-    for param in custom_params:
-        key, key_type = param[0], param[1]
-        if any(str_key in key for str_key in ['position', 'signals_aggregated', 'original_sequence']):
-            custom[key] = getattr(sequence, key).to_string()
-        else:
-            custom[key] = getattr(sequence, key).item()
 
-    return SequenceMetadata(custom_params={**metadata, **custom, **immune_events}, chain=chain,
-                            v_call=sequence.v_call.to_string(), j_call=sequence.j_call.to_string(),
-                            region_type=sequence.region_type.to_string())
+def _to_json(value) -> str:
+    return json.dumps(value, default=lambda x: x.name if isinstance(x, Enum) else str(x))
+
+
+def _to_json_column(values: list, convert=None) -> np.ndarray:
+    unique_values, inverse = np.unique(np.array(values), return_inverse=True)
+    encoded = np.array([_to_json(convert(value.item()) if convert else value.item()) for value in unique_values], dtype=object)
+    return encoded[inverse.reshape(-1)] if len(values) > 0 else np.array([], dtype=object)
 
 
 def write_bnp_data(path: Path, data, append_if_exists: bool = True):
@@ -113,11 +162,9 @@ def make_sequence_paths(path: Path, signals: List[Signal]) -> Dict[str, Path]:
 
 
 def get_allowed_positions(signal: Signal, sequence_array: RaggedArray, region_type: RegionType):
-    sequence_lengths = sequence_array.lengths
     if bool(signal.sequence_position_weights):
-        allowed_positions = RaggedArray(
-            [PositionHelper.get_allowed_positions_for_annotation(seq_len, region_type, signal.sequence_position_weights)
-             for seq_len in sequence_lengths])
+        allowed_positions = PositionHelper.get_allowed_positions_for_lengths(sequence_array.lengths, region_type,
+                                                                             signal.sequence_position_weights)
     else:
         allowed_positions = None
 
@@ -133,16 +180,21 @@ def get_region_type(sequences) -> RegionType:
         raise RuntimeError(f"The region types could not be obtained.")
 
 
-def annotate_sequences(sequences, is_amino_acid: bool, all_signals: list, annotated_dc, sim_item_name: str = None):
+def annotate_sequences(sequences, is_amino_acid: bool, all_signals: list, annotated_dc, sim_item_name: str = None,
+                       motif_matcher: MotifMatcher = None, custom_func_pool: Pool = None, number_of_processes: int = 1):
     encoding = AminoAcidEncoding if is_amino_acid else DNAEncoding
     sequence_array = sequences.sequence_aa if is_amino_acid else sequences.sequence
 
     signal_matrix = np.zeros((len(sequence_array), len(all_signals)))
     signal_positions = {}
 
+    if motif_matcher is None:
+        motif_matcher = MotifMatcher(all_signals, SequenceType.AMINO_ACID if is_amino_acid else SequenceType.NUCLEOTIDE)
+    motif_matches = motif_matcher.match(sequence_array)
+
     for index, signal in enumerate(all_signals):
         _annotate_with_signal(sequences, sequence_array, is_amino_acid, encoding, signal_matrix, signal, index,
-                              signal_positions, sim_item_name)
+                              signal_positions, motif_matches, sim_item_name, custom_func_pool, number_of_processes)
 
     signal_matrix = make_bnp_annotated_sequences(sequences, annotated_dc, all_signals, signal_matrix, signal_positions)
 
@@ -152,38 +204,93 @@ def annotate_sequences(sequences, is_amino_acid: bool, all_signals: list, annota
 
 
 def _annotate_with_signal(sequences, sequence_array, is_amino_acid, encoding, signal_matrix, signal, signal_index,
-                          signal_positions, sim_item_name: str = None):
+                          signal_positions, motif_matches: dict, sim_item_name: str = None, custom_func_pool: Pool = None,
+                          number_of_processes: int = 1):
     if signal.motifs is not None:
-        return _annotate_with_signal_motifs(sequences, sequence_array, is_amino_acid, encoding, signal_matrix, signal,
-                                            signal_index, signal_positions, sim_item_name)
+        return _annotate_with_signal_motifs(sequences, sequence_array, is_amino_acid, signal_matrix, signal, signal_index,
+                                            signal_positions, motif_matches, sim_item_name)
     else:
         return _annotate_with_signal_func(sequences, sequence_array, is_amino_acid, encoding, signal_matrix, signal,
-                                          signal_index, signal_positions)
+                                          signal_index, signal_positions, custom_func_pool, number_of_processes)
 
 
 def _annotate_with_signal_func(sequences, sequence_array, is_amino_acid, encoding, signal_matrix, signal, signal_index,
-                               signal_positions):
-    signal_matrix[:, signal_index] = [signal.is_present_custom_func(seq.sequence_aa.to_string(),
-                                                                    seq.sequence.to_string(),
-                                                                    seq.v_call.to_string(),
-                                                                    seq.j_call.to_string())
-                                      for seq in sequences]
+                               signal_positions, custom_func_pool: Pool = None, number_of_processes: int = 1):
+    if signal.custom_func_batch_columns is not None:
+        columns = {name: getattr(sequences, name).tolist() if as_list else getattr(sequences, name)
+                   for name, as_list in signal.custom_func_batch_columns.items()}
+        is_present = np.asarray(signal.is_present_custom_func(**columns), dtype=bool)
+        assert is_present.shape == (len(sequences),), \
+            f"Signal {signal.id}: the custom function has to return one boolean value per sequence, got shape {is_present.shape} " \
+            f"for {len(sequences)} sequences."
+    else:
+        is_present = apply_custom_func_per_sequence(signal, [getattr(sequences, name).tolist() for name in
+                                                             ['sequence_aa', 'sequence', 'v_call', 'j_call']],
+                                                    custom_func_pool, number_of_processes)
+
+    signal_matrix[:, signal_index] = is_present
     signal_positions[f'{signal.id}_positions'] = ["" for _ in range(len(sequences))]
 
 
-def _annotate_with_signal_motifs(sequences, sequence_array, is_amino_acid, encoding, signal_matrix, signal,
-                                 signal_index, signal_positions, sim_item_name=None):
+CUSTOM_FUNC_MIN_CHUNK_SIZE = 1000
+
+_custom_func_worker_context = {}
+
+
+def make_custom_func_pool(signals: list, number_of_processes: int) -> Pool:
+    """
+    Makes a pool of processes with the custom functions of all signals which are called per sequence loaded in each process, so that
+    the same pool can be used to annotate all batches of sequences; returns None if there are no such signals, if only one process is
+    available or if called from a worker process (which cannot start processes of its own); the caller has to close the pool
+    """
+    funcs = {signal.id: signal.is_present_custom_func for signal in signals
+             if signal.motifs is None and signal.custom_func_batch_columns is None}
+
+    if len(funcs) > 0 and number_of_processes > 1 and not current_process().daemon:
+        return Pool(processes=number_of_processes, initializer=_init_custom_func_worker, initargs=(dill.dumps(funcs),))
+    else:
+        return None
+
+
+def apply_custom_func_per_sequence(signal: Signal, columns: List[list], custom_func_pool: Pool = None,
+                                   number_of_processes: int = 1) -> np.ndarray:
+    """
+    Calls the custom function of the signal for each sequence with the values of the given columns; if a pool made by
+    make_custom_func_pool with number_of_processes processes is given, the sequences are split into chunks which are evaluated by the pool
+    """
+    sequence_count = len(columns[0]) if len(columns) > 0 else 0
+    chunk_size = max(math.ceil(sequence_count / (4 * number_of_processes)), CUSTOM_FUNC_MIN_CHUNK_SIZE)
+
+    if custom_func_pool is not None and sequence_count > chunk_size:
+        chunks = [(signal.id, [column[start:start + chunk_size] for column in columns]) for start in range(0, sequence_count, chunk_size)]
+        return np.concatenate(custom_func_pool.map(_apply_custom_func_to_chunk, chunks)).astype(bool)
+    else:
+        return np.array([signal.is_present_custom_func(*values) for values in zip(*columns)], dtype=bool).reshape(sequence_count)
+
+
+def _init_custom_func_worker(funcs: bytes):
+    _custom_func_worker_context['funcs'] = dill.loads(funcs)
+
+
+def _apply_custom_func_to_chunk(task) -> np.ndarray:
+    signal_id, columns = task
+    return np.array([_custom_func_worker_context['funcs'][signal_id](*values) for values in zip(*columns)], dtype=bool)
+
+
+def _annotate_with_signal_motifs(sequences, sequence_array, is_amino_acid, signal_matrix, signal, signal_index, signal_positions,
+                                 motif_matches: dict, sim_item_name=None):
     signal_pos_col = None
     allowed_positions = get_allowed_positions(signal, sequence_array, get_region_type(sequences))
     matches_gene = match_genes(signal.v_call, sequences.v_call, signal.j_call, sequences.j_call)
 
-    for motifs in signal.get_all_motif_instances(SequenceType.AMINO_ACID if is_amino_acid else SequenceType.NUCLEOTIDE):
+    for motif_index, motifs in enumerate(signal.motifs):
         matches = None
 
-        if isinstance(motifs, MotifInstanceGroup):
-            matches = match_motif_group(motifs, encoding, sequence_array, matches_gene, matches)
+        if isinstance(motifs, list):
+            matches = match_motif_group([motif_matches[(signal.id, motif_index, part_index)] for part_index in range(len(motifs))],
+                                        matches_gene, matches)
         else:
-            matches = match_motif_regexes(motifs, encoding, sequence_array, matches_gene, matches)
+            matches = match_motif_with_genes(motif_matches[(signal.id, motif_index, 0)], matches_gene, matches)
 
         if allowed_positions is not None:
             try:
@@ -205,21 +312,71 @@ def _annotate_with_signal_motifs(sequences, sequence_array, is_amino_acid, encod
                                                        np.logical_or.reduce(matches, axis=1))
         # TODO: we want to remove a receptor if it has multiple matches of the motif -> xor? or somehow removed?
 
-    np_mask = RaggedArray(np.where(signal_pos_col.ravel(), "1", "0"), shape=signal_pos_col.shape)
-    signal_positions[f'{signal.id}_positions'] = ['m' + "".join(np_mask[ind, :]) for ind in range(len(signal_pos_col))]
+    signal_positions[f'{signal.id}_positions'] = pack_signal_positions(signal_pos_col)
 
 
-def match_motif_regexes(motifs, encoding, sequence_array, matches_gene, matches):
-    matches_motif = None
-    if isinstance(motifs, LigoPWM):
-        matches_motif = match_motif(motifs, encoding, sequence_array)
-    else:
-        for motif in motifs:
-            if matches_motif is None:
-                matches_motif = match_motif(motif, encoding, sequence_array)
-            else:
-                matches_motif = np.logical_or(matches_motif, match_motif(motif, encoding, sequence_array))
+HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+HEX_VALUES = np.zeros(256, dtype=int)
+HEX_VALUES[HEX_DIGITS] = np.arange(16)
+HEX_BIT_COUNTS = np.array([bin(value).count("1") for value in HEX_VALUES])
+
+
+def pack_signal_positions(signal_positions: RaggedArray) -> EncodedRaggedArray:
+    """
+    Packs the boolean positions of a signal in each sequence into a string of hexadecimal digits, where each digit holds 4 consecutive
+    positions with the first one in the highest bit; annotated sequences keep the positions in this form and they are converted to the
+    exported form ('m' followed by '1' or '0' for each position) by unpack_signal_positions
+    """
+    lengths = np.asarray(signal_positions.lengths, dtype=int)
+    digit_counts = (lengths + 3) // 4
+    positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    digit_indices = np.repeat(np.cumsum(digit_counts) - digit_counts, lengths) + positions // 4
+    present = np.asarray(signal_positions.ravel(), dtype=bool)
+    values = np.bincount(digit_indices[present], weights=8 >> (positions[present] % 4), minlength=digit_counts.sum()).astype(int)
+    return EncodedRaggedArray(EncodedArray(HEX_DIGITS[values], BaseEncoding), digit_counts)
+
 
+def make_packed_signal_positions(sequence_length: int, position: int = None) -> str:
+    """Returns packed positions (see pack_signal_positions) of a signal present only at the given position or not present at all"""
+    digits = ["0"] * ((sequence_length + 3) // 4)
+    if position is not None:
+        digits[position // 4] = chr(HEX_DIGITS[8 >> (position % 4)])
+    return "".join(digits)
+
+
+def count_signal_positions(packed_positions: EncodedRaggedArray) -> np.ndarray:
+    lengths = np.asarray(packed_positions.lengths, dtype=int)
+    return np.bincount(np.repeat(np.arange(len(lengths)), lengths), weights=HEX_BIT_COUNTS[packed_positions.raw().ravel()],
+                       minlength=len(lengths)).astype(int)
+
+
+def unpack_signal_positions(packed_positions: EncodedRaggedArray, sequence_lengths: np.ndarray) -> EncodedRaggedArray:
+    """Converts packed positions to the exported form for sequences of the given lengths; empty values (for signals defined by custom
+    functions) stay empty"""
+    digit_counts = np.asarray(packed_positions.lengths, dtype=int)
+    lengths = np.where(digit_counts > 0, np.asarray(sequence_lengths, dtype=int), 0)
+    bits = (HEX_VALUES[packed_positions.raw().ravel()][:, np.newaxis] >> np.arange(3, -1, -1)).ravel() & 1
+    exported_lengths = np.where(digit_counts > 0, lengths + 1, 0)
+    exported_starts = np.cumsum(exported_lengths) - exported_lengths
+
+    exported = np.full(exported_lengths.sum(), ord("0"), dtype=np.uint8)
+    exported[exported_starts[digit_counts > 0]] = ord("m")
+    positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    exported[np.repeat(exported_starts + 1, lengths) + positions] += \
+        bits[np.repeat(4 * (np.cumsum(digit_counts) - digit_counts), lengths) + positions].astype(np.uint8)
+
+    return EncodedRaggedArray(EncodedArray(exported, BaseEncoding), exported_lengths)
+
+
+def export_signal_positions(sequences, signals: list, sequence_type: SequenceType):
+    """Returns the annotated sequences with positions of the signals in the exported form"""
+    sequence_lengths = getattr(sequences, sequence_type.value).lengths
+    return dataclasses.replace(sequences, **{f"{signal.id}_positions": unpack_signal_positions(getattr(sequences, f"{signal.id}_positions"),
+                                                                                               sequence_lengths)
+                                             for signal in signals})
+
+
+def match_motif_with_genes(matches_motif, matches_gene, matches):
     if matches is None:
         matches = np.logical_and(matches_motif, matches_gene)
     else:
@@ -228,13 +385,13 @@ def match_motif_regexes(motifs, encoding, sequence_array, matches_gene, matches)
     return matches
 
 
-def match_motif_group(motif_group: list, encoding, sequence_array, matches_gene, matches):
+def match_motif_group(motif_group_matches: list, matches_gene, matches):
     """Match if two motifs co-occur in the same sequence"""
 
-    assert len(motif_group) == 2, len(motif_group)
+    assert len(motif_group_matches) == 2, len(motif_group_matches)
 
-    matches_motif_1 = match_motif_regexes(motif_group[0], encoding, sequence_array, matches_gene, None)
-    matches_motif_2 = match_motif_regexes(motif_group[1], encoding, sequence_array, matches_gene, None)
+    matches_motif_1 = match_motif_with_genes(motif_group_matches[0], matches_gene, None)
+    matches_motif_2 = match_motif_with_genes(motif_group_matches[1], matches_gene, None)
     matches_motif = np.zeros_like(matches_motif_1)
     selection = np.logical_and(matches_motif_1.any(axis=1), matches_motif_2.any(axis=1))
     matches_motif[selection] = np.logical_or(matches_motif_1[selection], matches_motif_2[selection])
@@ -257,22 +414,20 @@ def match_genes(v_call, v_call_array, j_call, j_call_array):
     return matches_gene.astype(bool)
 
 
-def match_motif(motif: Union[str, LigoPWM], encoding, sequence_array):
-    if isinstance(motif, str):
-        matcher = RegexMatcher(motif, encoding=encoding)
-        matches = matcher.rolling_window(sequence_array, mode='same')
-    else:
-        matches = get_motif_scores(sequence_array, motif.pwm_matrix) > motif.threshold
-        matches = pad_ragged_array(matches, sequence_array.shape, False)
-    return matches
-
-
 def filter_out_illegal_sequences(sequences, sim_item: SimConfigItem, all_signals: list, max_signals_per_sequence: int,
                                  max_motifs_per_sequence: int):
     if max_signals_per_sequence > 2 or max_motifs_per_sequence > 1:
         raise NotImplementedError
     elif max_signals_per_sequence == -1 or all_signals is None or len(all_signals) == 0:
         return sequences
+    else:
+        return sequences[get_legal_sequence_mask(sequences, sim_item, all_signals, max_signals_per_sequence, max_motifs_per_sequence)]
+
+
+def get_legal_sequence_mask(sequences, sim_item: SimConfigItem, all_signals: list, max_signals_per_sequence: int,
+                            max_motifs_per_sequence: int) -> np.ndarray:
+    if max_signals_per_sequence == -1 or all_signals is None or len(all_signals) == 0:
+        return np.ones(len(sequences), dtype=bool)
 
     sim_signal_ids = list(
         set(chain.from_iterable([signal.id.split(Constants.SIGNAL_DELIMITER) for signal in sim_item.signals])))
@@ -283,10 +438,10 @@ def filter_out_illegal_sequences(sequences, sim_item: SimConfigItem, all_signals
                                        other_signals) else 1)
 
     legal_indices &= np.array(
-        [(getattr(sequences, f'{s.id}_positions')[:, 1:] == '1').sum(axis=1) <= max_motifs_per_sequence for s in
+        [count_signal_positions(getattr(sequences, f'{s.id}_positions')) <= max_motifs_per_sequence for s in
          all_signals]).all(axis=0)
 
-    return sequences[legal_indices]
+    return legal_indices
 
 
 def make_signal_metadata(sim_item, signals) -> Dict[str, bool]:
@@ -361,10 +516,8 @@ def build_imgt_positions(sequence_length: int, motif_instance: MotifInstance, se
             f"IMGT positions here are defined only for CDR3 and JUNCTION region types, got {sequence_region_type}")
 
 
-def choose_implant_position(imgt_positions, position_weights):
-    imgt_implant_position = np.random.choice(list(position_weights.keys()), size=1, p=list(position_weights.values()))
-    position = np.where(imgt_positions == imgt_implant_position)[0][0]
-    return position
+def choose_implant_position(position_weights: np.ndarray) -> int:
+    return int(np.random.choice(len(position_weights), size=1, p=position_weights)[0])
 
 
 def check_iteration_progress(iteration: int, max_iterations: int):
@@ -400,10 +553,7 @@ def prepare_data_for_repertoire_obj(sequences: BNPDataClass, custom_fields: list
 
 def update_seqs_without_signal(max_count, annotated_sequences, seqs_no_signal_path: Path):
     if max_count > 0:
-        signal_matrix = annotated_sequences.get_signal_matrix()
-        selection = signal_matrix.sum(axis=1) == 0 if signal_matrix is not None else np.ones(len(annotated_sequences),
-                                                                                             dtype=bool)
-        data_to_write = annotated_sequences[selection][:max_count]
+        data_to_write = annotated_sequences[select_seqs_without_signal(max_count, annotated_sequences)]
         if len(data_to_write) > 0:
             write_bnp_data(data=data_to_write, path=seqs_no_signal_path)
         return max_count - len(data_to_write)
@@ -413,8 +563,27 @@ def update_seqs_without_signal(max_count, annotated_sequences, seqs_no_signal_pa
 
 def update_seqs_with_signal(max_counts: dict, annotated_sequences, all_signals, sim_item_signals,
                             seqs_with_signal_path: dict):
+    for signal_id, selection in select_seqs_with_signal(max_counts, annotated_sequences, all_signals, sim_item_signals).items():
+        data_to_write = annotated_sequences[selection]
+        if len(data_to_write) > 0:
+            write_bnp_data(data=data_to_write, path=seqs_with_signal_path[signal_id])
+        max_counts[signal_id] -= len(data_to_write)
+
+    return max_counts
+
+
+def select_seqs_without_signal(max_count: int, annotated_sequences) -> np.ndarray:
+    """Returns a mask of the first max_count sequences without any signal"""
+    signal_matrix = annotated_sequences.get_signal_matrix()
+    selection = signal_matrix.sum(axis=1) == 0 if signal_matrix is not None else np.ones(len(annotated_sequences), dtype=bool)
+    return _keep_first(selection, max_count)
+
+
+def select_seqs_with_signal(max_counts: dict, annotated_sequences, all_signals, sim_item_signals) -> Dict[str, np.ndarray]:
+    """Returns a mask per signal of the sim item selecting the first sequences (up to the count in max_counts) with the given signal"""
     all_signal_ids = [signal.id for signal in all_signals]
     signal_matrix = annotated_sequences.get_signal_matrix()
+    selections = {}
 
     for signal in sim_item_signals:
         if max_counts[signal.id] > 0:
@@ -426,27 +595,25 @@ def update_seqs_with_signal(max_counts: dict, annotated_sequences, all_signals,
             else:
                 selection = signal_matrix[:, all_signal_ids.index(signal.id)].astype(bool)
                 selection = np.logical_and(selection, signal_matrix.sum(axis=1) == 1)
-            data_to_write = annotated_sequences[selection][:max_counts[signal.id]]
-            if len(data_to_write) > 0:
-                write_bnp_data(data=data_to_write, path=seqs_with_signal_path[signal.id])
-            max_counts[signal.id] -= len(data_to_write)
+            selections[signal.id] = _keep_first(selection, max_counts[signal.id])
 
-    return max_counts
+    return selections
 
 
-def get_signal_sequences(bnp_data_class, used_seq_count: dict, sim_item: SimConfigItem,
-                         sequence_paths: Dict[str, Path]):
+def _keep_first(selection: np.ndarray, count: int) -> np.ndarray:
+    selection = np.array(selection, dtype=bool)
+    selection[np.flatnonzero(selection)[count:]] = False
+    return selection
+
+
+def get_signal_sequences(sequence_pool: SequencePool, sim_item: SimConfigItem):
     sequences = None
     for signal in sim_item.signals:
 
-        skip_rows = used_seq_count[signal.id]
         n_rows = round(sim_item.receptors_in_repertoire_count * sim_item.signal_proportions[signal])
 
-        data = get_bnp_data(sequence_paths[signal.id], bnp_data_class)
-        if data is not None:
-            sequences_sig = data[skip_rows:skip_rows + n_rows]
-
-            used_seq_count[signal.id] += n_rows
+        sequences_sig = sequence_pool.take(signal.id, n_rows)
+        if sequences_sig is not None:
 
             sequences_sig = assign_duplicate_counts(sequences_sig, signal.clonal_frequency)
 
@@ -455,7 +622,7 @@ def get_signal_sequences(bnp_data_class, used_seq_count: dict, sim_item: SimConf
             else:
                 sequences = merge_dataclass_objects([sequences, sequences_sig])
 
-    return sequences, used_seq_count
+    return sequences
 
 
 def assign_duplicate_counts(sequences, clonal_frequency_params: dict):
@@ -467,14 +634,9 @@ def assign_duplicate_counts(sequences, clonal_frequency_params: dict):
         return sequences
 
 
-def get_no_signal_sequences(sequences, used_seq_count: dict, seqs_no_signal_count: int, bnp_data_class,
-                            sequence_paths: Dict[str, Path],
-                            sim_item: SimConfigItem):
-    if sequence_paths['no_signal'].is_file() and seqs_no_signal_count > 0:
-        skip_rows = used_seq_count['no_signal']
-        used_seq_count['no_signal'] = used_seq_count['no_signal'] + seqs_no_signal_count
-        sequences_no_sig = get_bnp_data(sequence_paths['no_signal'], bnp_data_class)[
-                           skip_rows:skip_rows + seqs_no_signal_count]
+def get_no_signal_sequences(sequences, sequence_pool: SequencePool, seqs_no_signal_count: int, sim_item: SimConfigItem):
+    if sequence_pool.has_sequences('no_signal') and seqs_no_signal_count > 0:
+        sequences_no_sig = sequence_pool.take('no_signal', seqs_no_signal_count)
         sequences_no_sig = assign_duplicate_counts(sequences_no_sig, sim_item.default_clonal_frequency)
 
         if sequences is None:
@@ -482,9 +644,7 @@ def get_no_signal_sequences(sequences, used_seq_count: dict, seqs_no_signal_coun
         else:
             sequences = merge_dataclass_objects([sequences, sequences_no_sig])
 
-        return sequences, used_seq_count
-    else:
-        return sequences, used_seq_count
+    return sequences
 
 
 def needs_seqs_with_signal(sequence_per_signal_count: dict) -> bool:
@@ -501,8 +661,7 @@ def filter_sequences_by_length(sequences, sim_item: SimConfigItem, sequence_type
                  f"{sim_item.sequence_len_limits['min']} and {sim_item.sequence_len_limits['max']} since IMGT "
                  f"numbering will be used downstream for signal annotation or implanting.")
 
-    sequences = sequences[getattr(sequences, sequence_type.value).lengths <= sim_item.sequence_len_limits['max']]
-    sequences = sequences[getattr(sequences, sequence_type.value).lengths >= sim_item.sequence_len_limits['min']]
+    sequences = sequences[get_sequence_length_mask(sequences, sim_item, sequence_type)]
 
     assert np.all(getattr(sequences, sequence_type.value).lengths <= sim_item.sequence_len_limits['max']), \
         f'An error occurred while filtering sequences by length: some sequences are longer than {sim_item.sequence_len_limits["max"]}'
@@ -512,6 +671,11 @@ def filter_sequences_by_length(sequences, sim_item: SimConfigItem, sequence_type
     return sequences
 
 
+def get_sequence_length_mask(sequences, sim_item: SimConfigItem, sequence_type: SequenceType) -> np.ndarray:
+    lengths = getattr(sequences, sequence_type.value).lengths
+    return np.logical_and(lengths <= sim_item.sequence_len_limits['max'], lengths >= sim_item.sequence_len_limits['min'])
+
+
 def get_min_seq_length(sim_item: SimConfigItem, sequence_type: SequenceType, region_type: RegionType) -> int:
     conversion_constant = 1 if sequence_type == SequenceType.AMINO_ACID else 3
     if region_type == RegionType.IMGT_JUNCTION:
@@ -1,6 +1,7 @@
 import logging
 
 import numpy as np
+from npstructures import RaggedArray
 
 from ligo.data_model.receptor.RegionType import RegionType
 from ligo.data_model.receptor.receptor_sequence.ReceptorSequence import ReceptorSequence
@@ -12,10 +13,43 @@ class PositionHelper:
     MIN_CDR3_LEN = 5
     MIDPOINT_CDR3_LEN = 13
 
+    _position_weight_tables = {}
+    _imgt_positions = {}
+
     @staticmethod
     def get_imgt_position_weights_for_annotation(input_length: int, region_type: RegionType,
                                                  sequence_position_weights: dict):
         imgt_positions = PositionHelper.gen_imgt_positions_from_length(input_length, region_type)
+        weights = PositionHelper.get_position_weights_for_length(input_length, region_type, sequence_position_weights)
+        return dict(zip(imgt_positions, weights.tolist())) if len(imgt_positions) > 0 else {}
+
+    @staticmethod
+    def get_position_weight_table(region_type: RegionType, sequence_position_weights: dict) -> np.ndarray:
+        """
+        Returns the position weights for annotation of all supported sequence lengths of the region type as a matrix computed once per
+        region type and position weights: row i holds the weights of the positions of sequences of length i in its first i columns;
+        rows of unsupported lengths are 0 and the last row stands for all sequences longer than the maximum length
+        """
+        key = (region_type, tuple(sorted((sequence_position_weights or {}).items())))
+        if key not in PositionHelper._position_weight_tables:
+            min_length, max_length = PositionHelper.get_length_limits(region_type)
+            table = np.zeros((max_length + 2, max_length + 1))
+            for length in range(min_length, max_length + 1):
+                table[length, :length] = list(PositionHelper._compute_imgt_position_weights_for_annotation(
+                    length, region_type, sequence_position_weights).values())
+            PositionHelper._position_weight_tables[key] = table
+
+        return PositionHelper._position_weight_tables[key]
+
+    @staticmethod
+    def get_position_weights_for_length(input_length: int, region_type: RegionType, sequence_position_weights: dict) -> np.ndarray:
+        table = PositionHelper.get_position_weight_table(region_type, sequence_position_weights)
+        return table[input_length, :input_length] if input_length < table.shape[0] - 1 else np.zeros(input_length)
+
+    @staticmethod
+    def _compute_imgt_position_weights_for_annotation(input_length: int, region_type: RegionType,
+                                                      sequence_position_weights: dict):
+        imgt_positions = PositionHelper.gen_imgt_positions_from_length(input_length, region_type)
 
         position_weights = {}
         if sequence_position_weights:
@@ -43,29 +77,49 @@ class PositionHelper:
                                                                                    sequence_position_weights)
         return [int(bool(weight)) for weight in position_weights.values()]
 
+    @staticmethod
+    def get_allowed_positions_for_lengths(sequence_lengths: np.ndarray, region_type: RegionType,
+                                          sequence_position_weights: dict) -> RaggedArray:
+        """Returns positions with non-zero weights for a batch of sequences of given lengths, gathered from the position weight table"""
+        table = PositionHelper.get_position_weight_table(region_type, sequence_position_weights) != 0
+        lengths = np.asarray(sequence_lengths, dtype=int)
+        rows = np.repeat(np.minimum(lengths, table.shape[0] - 1), lengths)
+        columns = np.minimum(np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths), table.shape[1] - 1)
+        return RaggedArray(table[rows, columns], lengths)
+
     @staticmethod
     def get_imgt_position_weights_for_implanting(aa_input_length: int, region_type: RegionType,
                                                  sequence_position_weights: dict, limit: int):
-        position_weights = PositionHelper.get_imgt_position_weights_for_annotation(aa_input_length, region_type,
-                                                                                   sequence_position_weights)
-
-        for index, position in enumerate(position_weights.keys()):
-            if index > aa_input_length - limit:
-                position_weights[position] = 0.
+        imgt_positions = PositionHelper.gen_imgt_positions_from_length(aa_input_length, region_type)
+        weights = PositionHelper.get_position_weights_for_implanting(aa_input_length, region_type, sequence_position_weights, limit)
+        return dict(zip(imgt_positions, weights.tolist()))
 
-        weights_sum = sum(list(position_weights.values()))
+    @staticmethod
+    def get_position_weights_for_implanting(aa_input_length: int, region_type: RegionType, sequence_position_weights: dict,
+                                            limit: int) -> np.ndarray:
+        """Returns the probabilities of implanting a motif of length limit at each position of the sequence; if the motif cannot be
+        implanted anywhere, all probabilities are 0"""
+        weights = PositionHelper.get_position_weights_for_length(aa_input_length, region_type, sequence_position_weights).copy()
+        weights[max(aa_input_length - limit + 1, 0):] = 0.
+
+        weights_sum = weights.sum()
         if weights_sum == 0:
             logging.warning(f"Sequence of length {aa_input_length} has no allowed positions for signal with sequence "
                             f"position weights {sequence_position_weights} and motif length {limit}, it will be discarded.")
-            return position_weights
+            return weights
 
-        position_weights = {position: np.array([weight]).astype(np.float64)[0] / weights_sum
-                            for position, weight in position_weights.items()}
+        weights = weights / weights_sum
 
-        assert np.isclose(sum(list(position_weights.values())), 1.), \
-            (aa_input_length, region_type.name, position_weights, sum(list(position_weights.values())), limit)
+        assert np.isclose(weights.sum(), 1.), (aa_input_length, region_type.name, weights, weights.sum(), limit)
 
-        return position_weights
+        return weights
+
+    @staticmethod
+    def get_length_limits(region_type: RegionType) -> tuple:
+        if region_type == RegionType.IMGT_JUNCTION:
+            return PositionHelper.MIN_CDR3_LEN + 2, PositionHelper.MAX_CDR3_LEN + 2
+        else:
+            return PositionHelper.MIN_CDR3_LEN, PositionHelper.MAX_CDR3_LEN
 
     @staticmethod
     def gen_imgt_positions_from_cdr3_length(input_length: int) -> list:
@@ -115,10 +169,15 @@ class PositionHelper:
 
     @staticmethod
     def gen_imgt_positions_from_length(input_length: int, region_type: RegionType):
-        if region_type == RegionType.IMGT_CDR3:
-            return PositionHelper.gen_imgt_positions_from_cdr3_length(input_length)
-        if region_type == RegionType.IMGT_JUNCTION:
-            return PositionHelper.gen_imgt_positions_from_junction_length(input_length)
-        else:
-            raise NotImplementedError(
-                f"PositionHelper: IMGT positions are not implemented for region type {region_type}")
+        """Returns the IMGT positions for the sequence length and region type, generated once per length and region type"""
+        key = (input_length, region_type)
+        if key not in PositionHelper._imgt_positions:
+            if region_type == RegionType.IMGT_CDR3:
+                PositionHelper._imgt_positions[key] = PositionHelper.gen_imgt_positions_from_cdr3_length(input_length)
+            elif region_type == RegionType.IMGT_JUNCTION:
+                PositionHelper._imgt_positions[key] = PositionHelper.gen_imgt_positions_from_junction_length(input_length)
+            else:
+                raise NotImplementedError(
+                    f"PositionHelper: IMGT positions are not implemented for region type {region_type}")
+
+        return list(PositionHelper._imgt_positions[key])
@@ -5,5 +5,5 @@ from pathlib import Path
 class Instruction(metaclass=abc.ABCMeta):
 
     @abc.abstractmethod
-    def run(self, result_path: Path):
+    def run(self, result_path: Path, resume: bool = False):
         pass
@@ -11,7 +11,7 @@ from ligo.simulation.SimConfig import SimConfig
 from ligo.simulation.generative_models.BackgroundSequences import BackgroundSequences
 from ligo.simulation.generative_models.GenerativeModel import GenerativeModel
 from ligo.simulation.implants.Signal import Signal
-from ligo.simulation.util.util import annotate_sequences, make_annotated_dataclass, get_bnp_data
+from ligo.simulation.util.util import annotate_sequences, make_annotated_dataclass, write_bnp_data, make_custom_func_pool
 from ligo.util.Logger import print_log
 from ligo.util.PathBuilder import PathBuilder
 from ligo.util.Reports import ReportResult
@@ -77,6 +77,7 @@ class FeasibilitySummaryInstruction(Instruction):
     def __init__(self, simulation, sequence_count: int, number_of_processes: int, signals: List[Signal], name: str = None):
         self.state = FeasibilitySummaryState(simulation=simulation, sequence_count=sequence_count, signals=signals, name=name)
         self._number_of_processes = number_of_processes
+        self._custom_func_pool = None
 
         self._annotation_fields = sorted([(signal.id, int) for signal in self.state.signals] + [('signals_aggregated', str)] +
                                          [(f"{signal.id}_positions", str) for signal in self.state.signals],
@@ -84,14 +85,25 @@ class FeasibilitySummaryInstruction(Instruction):
 
         self._annotated_dc = make_annotated_dataclass(self._annotation_fields, self.state.signals)
 
-    def run(self, result_path: Path):
+    def run(self, result_path: Path, resume: bool = False):
 
         self.state.result_path = PathBuilder.build(result_path / self.state.name)
 
         unique_models = self._get_unique_gen_models()
-
-        for model_name, model in unique_models.items():
-            self._make_summary(model, PathBuilder.build(self.state.result_path / model_name), model_name)
+        self._custom_func_pool = make_custom_func_pool(self.state.signals, self._number_of_processes)
+
+        try:
+            for model_name, model in unique_models.items():
+                model.set_number_of_processes(self._number_of_processes)
+                try:
+                    self._make_summary(model, PathBuilder.build(self.state.result_path / model_name), model_name)
+                finally:
+                    model.close()
+        finally:
+            if self._custom_func_pool is not None:
+                self._custom_func_pool.close()
+                self._custom_func_pool.join()
+                self._custom_func_pool = None
 
         return self.state
 
@@ -183,12 +195,13 @@ class FeasibilitySummaryInstruction(Instruction):
 
 
     def _make_sequences(self, model, path: Path, model_name: str) -> BackgroundSequences:
-        seq_path = model.generate_sequences(self.state.sequence_count, seed=0, path=path, sequence_type=self.state.simulation.sequence_type,
-                                            compute_p_gen=model.can_compute_p_gens() and self.state.simulation.keep_p_gen_dist and self.state.simulation.p_gen_bin_count > 0)
+        default_seqs = model.generate_sequences_in_memory(self.state.sequence_count, seed=0, sequence_type=self.state.simulation.sequence_type,
+                                                         compute_p_gen=model.can_compute_p_gens() and self.state.simulation.keep_p_gen_dist and self.state.simulation.p_gen_bin_count > 0)
+        write_bnp_data(path, default_seqs)
 
-        default_seqs = get_bnp_data(seq_path, BackgroundSequences)
         default_seqs = annotate_sequences(default_seqs, self.state.simulation.sequence_type == SequenceType.AMINO_ACID, self.state.signals,
-                                          self._annotated_dc, model_name)
+                                          self._annotated_dc, model_name, custom_func_pool=self._custom_func_pool,
+                                          number_of_processes=self._number_of_processes)
 
         print_log(f"Generated and annotated {self.state.sequence_count} sequences for model {model_name}", include_datetime=True)
 
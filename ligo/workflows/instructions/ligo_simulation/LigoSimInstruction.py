@@ -1,11 +1,14 @@
 import copy
 import os
 import random
+import shutil
+import time
 from dataclasses import fields, field
+from collections import deque
 from itertools import chain
 from multiprocessing import Pool
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Union
 
 import dill
 import math
@@ -17,23 +20,32 @@ from ligo.app.LigoApp import SimError
 from ligo.data_model.dataset.ReceptorDataset import ReceptorDataset
 from ligo.data_model.dataset.RepertoireDataset import RepertoireDataset
 from ligo.data_model.dataset.SequenceDataset import SequenceDataset
-from ligo.data_model.receptor.Receptor import Receptor
 from ligo.data_model.receptor.ReceptorBuilder import ReceptorBuilder
+from ligo.data_model.receptor.receptor_sequence.Chain import Chain
 from ligo.data_model.repertoire.Repertoire import Repertoire
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
 from ligo.environment.SequenceType import SequenceType
+from ligo.simulation.BatchSizeController import BatchSizeController
+from ligo.simulation.IterationMetrics import IterationMetrics
+from ligo.simulation.LigoSimCheckpoint import LigoSimCheckpoint
 from ligo.simulation.LigoSimState import LigoSimState
+from ligo.simulation.SequencePool import SequencePool
 from ligo.simulation.SimConfig import SimConfig
 from ligo.simulation.SimConfigItem import SimConfigItem
 from ligo.simulation.generative_models.BackgroundSequences import BackgroundSequences
 from ligo.simulation.implants.Signal import Signal
 from ligo.simulation.simulation_strategy.ImplantingStrategy import ImplantingStrategy
+from ligo.simulation.simulation_strategy.RejectionSamplingStrategy import RejectionSamplingStrategy
+from ligo.simulation.util.MotifMatcher import MotifMatcher
 from ligo.simulation.util.bnp_util import merge_dataclass_objects
-from ligo.simulation.util.util import get_bnp_data, make_receptor_sequence_objects, make_annotated_dataclass, \
+from ligo.simulation.util.util import get_bnp_data, make_annotated_dataclass, make_custom_params_columns, make_sequence_columns, \
+    make_receptor_columns, make_custom_func_pool, \
     get_sequence_per_signal_count, \
     update_seqs_without_signal, update_seqs_with_signal, check_iteration_progress, make_sequence_paths, \
     make_signal_metadata, needs_seqs_with_signal, \
     check_sequence_count, make_repertoire_from_sequences, get_no_signal_sequences, get_signal_sequences, \
-    annotate_sequences, get_signal_sequence_count, filter_sequences_by_length
+    annotate_sequences, get_signal_sequence_count, filter_sequences_by_length, write_bnp_data, get_legal_sequence_mask, \
+    select_seqs_with_signal, select_seqs_without_signal, export_signal_positions
 from ligo.util.ExporterHelper import ExporterHelper
 from ligo.util.Logger import print_log
 from ligo.util.PathBuilder import PathBuilder
@@ -46,17 +58,33 @@ class LigoSimInstruction(Instruction):
     LIgO simulation instruction creates a synthetic dataset from scratch based on the generative model and a set of signals provided by
     the user.
 
+    With rejection sampling (and if p_gen distribution does not need to be preserved), simulation items that use the same generative model
+    and sequence length limits, and no signals with V/J genes, are simulated from one stream of generated sequences: each sequence is
+    stored for the first simulation item that needs it. In that case, the seed of the first of these simulation items is used.
+
+    For each iteration, the time spent in each stage of the simulation (generation, length filtering, annotation, simulation strategy,
+    p_gen filtering and writing), the number of generated, accepted and rejected sequences per signal and the p_gen cache statistics of
+    the generative model (hits, misses and time spent computing p_gens) are stored in
+    simulation_metrics.jsonl in the result directory of the instruction; they are summarised in simulation_metrics_stages.csv and
+    simulation_metrics_signals.csv and in the HTML report.
+
     Arguments:
 
     - simulation (str): a name of a simulation object containing a list of SimConfigItem as specified under definitions key; defines how to combine signals with simulated data; specified under definitions
 
-    - sequence_batch_size (int): how many sequences to generate at once using the generative model before checking for signals and filtering
+    - sequence_batch_size (int): how many sequences to generate at once using the generative model before checking for signals and filtering; if adaptive_batch_size is True, this is the size of the first batch
+
+    - adaptive_batch_size (bool): whether to adapt the number of sequences generated in each iteration to the observed proportion of sequences kept per signal, so that the remaining sequences per signal are expected to be generated by the end of target_iterations
+
+    - target_iterations (int): in how many iterations the simulation should finish when adaptive_batch_size is True
+
+    - max_sequence_batch_size (int): the maximum number of sequences generated at once when adaptive_batch_size is True, including the first batch if sequence_batch_size is larger; limits the memory used per batch
 
     - max_iterations (int): how many iterations are allowed when creating sequences
 
     - export_p_gens (bool): whether to compute generation probabilities (if supported by the generative model) for sequences and include them as part of output
 
-    - number_of_processes (int): determines how many simulation items can be simulated in parallel
+    - number_of_processes (int): determines how many simulation items can be simulated in parallel; if there are more processes than simulation items, the simulation items are simulated one after another and the processes are used to generate and annotate batches of sequences and to write the repertoires for each simulation item in parallel
 
     YAML specification:
 
@@ -67,6 +95,9 @@ class LigoSimInstruction(Instruction):
             type: LIgOSim # which instruction to execute
             simulation: sim1
             sequence_batch_size: 1000
+            adaptive_batch_size: False
+            target_iterations: 10
+            max_sequence_batch_size: 1000000
             max_iterations: 1000
             export_p_gens: False
             number_of_processes: 4
@@ -74,13 +105,21 @@ class LigoSimInstruction(Instruction):
     """
 
     def __init__(self, simulation: SimConfig, signals: List[Signal], name: str,
-                 sequence_batch_size: int, max_iterations: int, number_of_processes: int, export_p_gens: bool = None):
+                 sequence_batch_size: int, max_iterations: int, number_of_processes: int, export_p_gens: bool = None,
+                 adaptive_batch_size: bool = False, target_iterations: int = None, max_sequence_batch_size: int = None):
 
         self.state = LigoSimState(simulation=simulation, signals=signals, name=name)
         self._number_of_processes = number_of_processes
         self._sequence_batch_size = sequence_batch_size
+        self._adaptive_batch_size = adaptive_batch_size
+        self._target_iterations = target_iterations
+        self._max_sequence_batch_size = max_sequence_batch_size
         self._max_iterations = max_iterations
         self._export_p_gens = export_p_gens
+        self._resume = False
+        self._shared_sequence_paths = {}
+        self._motif_matcher = None
+        self._custom_func_pool = None
 
         self._use_p_gens = self.state.simulation.keep_p_gen_dist and \
                            all(sim_item.generative_model.can_compute_p_gens() for sim_item in
@@ -118,10 +157,25 @@ class LigoSimInstruction(Instruction):
 
     MIN_RANGE_PROBABILITY = 1e-5
 
-    def run(self, result_path: Path):
+    def run(self, result_path: Path, resume: bool = False):
         self.state.result_path = PathBuilder.build(result_path / self.state.name)
-
-        self._simulate_dataset()
+        self._resume = resume
+
+        for sim_item in self.state.simulation.sim_items:
+            sim_item.generative_model.set_number_of_processes(self._number_of_processes)
+        self._custom_func_pool = make_custom_func_pool(self.state.signals, self._number_of_processes)
+
+        try:
+            self._simulate_dataset()
+        finally:
+            for sim_item in self.state.simulation.sim_items:
+                sim_item.generative_model.close()
+            if self._custom_func_pool is not None:
+                self._custom_func_pool.close()
+                self._custom_func_pool.join()
+                self._custom_func_pool = None
+
+        self.state.metrics_paths = IterationMetrics.summarise(self.state.result_path)
         self._export_dataset()
 
         return self.state
@@ -137,7 +191,11 @@ class LigoSimInstruction(Instruction):
     def _simulate_dataset(self):
 
         examples = self._create_examples_wrapper()
-        random.shuffle(examples)
+        if isinstance(examples, dict):
+            order = np.random.permutation(len(examples['identifier']))
+            examples = {key: values[order] for key, values in examples.items()}
+        else:
+            random.shuffle(examples)
 
         labels = {**{signal.id: [True, False] for signal in self.state.signals},
                   **{'species': self.state.simulation.species}}
@@ -147,18 +205,20 @@ class LigoSimInstruction(Instruction):
                                                                                 name='simulated_dataset',
                                                                                 metadata_path=self.state.result_path / 'metadata.csv')
         elif self.state.simulation.paired:
-            self.state.resulting_dataset = ReceptorDataset.build_from_objects(examples, path=self.state.result_path,
-                                                                              name='simulated_dataset',
+            self.state.resulting_dataset = ReceptorDataset.build_from_columns(examples, receptor_class=self._get_receptor_class(),
+                                                                              path=self.state.result_path, name='simulated_dataset',
                                                                               file_size=SequenceDataset.DEFAULT_FILE_SIZE,
                                                                               labels=labels)
         else:
-            self.state.resulting_dataset = SequenceDataset.build_from_objects(examples, path=self.state.result_path,
+            self.state.resulting_dataset = SequenceDataset.build_from_columns(examples, path=self.state.result_path,
                                                                               name='simulated_dataset',
                                                                               file_size=SequenceDataset.DEFAULT_FILE_SIZE,
                                                                               labels=labels)
 
-    def _create_examples_wrapper(self) -> list:
-        if self._number_of_processes > 1:
+    def _create_examples_wrapper(self) -> Union[list, Dict[str, np.ndarray]]:
+        self._gen_shared_sequences()
+
+        if self._number_of_processes > 1 and not self._use_batch_workers:
             chunk_size = math.ceil(len(self.state.simulation.sim_items) / self._number_of_processes)
 
             with Pool(processes=max(self._number_of_processes, len(self.state.simulation.sim_items))) as pool:
@@ -172,17 +232,29 @@ class LigoSimInstruction(Instruction):
 
         if self.state.simulation.paired:
             examples = self._pair_examples(examples, self.state.result_path / 'paired')
+        elif not self.state.simulation.is_repertoire:
+            examples = {key: np.concatenate([columns[key] for columns in examples.values()]) for key in
+                        list(examples.values())[0].keys()}
         else:
             examples = list(chain.from_iterable(examples.values()))
 
         return examples
 
-    def _pair_examples(self, examples: Dict[str, list], path: Path) -> list:
-        paired_examples = []
-        pair_func = self._pair_repertoires if self.state.simulation.is_repertoire else self._pair_sequences
-        for paired_item1, paired_item2 in self.state.simulation.paired:
-            paired_examples.extend(pair_func(examples[paired_item1], examples[paired_item2], path))
-        return paired_examples
+    def _pair_examples(self, examples: dict, path: Path) -> Union[List[Repertoire], Dict[str, np.ndarray]]:
+        if self.state.simulation.is_repertoire:
+            return list(chain.from_iterable(self._pair_repertoires(examples[paired_item1], examples[paired_item2], path)
+                                            for paired_item1, paired_item2 in self.state.simulation.paired))
+        else:
+            receptors = [self._pair_sequences(examples[paired_item1], examples[paired_item2], self._get_chains(paired_item1, paired_item2))
+                         for paired_item1, paired_item2 in self.state.simulation.paired]
+            return {key: np.concatenate([columns[key] for columns in receptors]) for key in receptors[0].keys()}
+
+    def _get_chains(self, sim_item_name1: str, sim_item_name2: str) -> List[Chain]:
+        sim_items = {sim_item.name: sim_item for sim_item in self.state.simulation.sim_items}
+        return [sim_items[sim_item_name1].generative_model.chain, sim_items[sim_item_name2].generative_model.chain]
+
+    def _get_receptor_class(self):
+        return ReceptorBuilder.get_receptor_class(self._get_chains(*self.state.simulation.paired[0]))
 
     def _pair_repertoires(self, repertoires1: list, repertoires2: list, path: Path) -> List[Repertoire]:
         assert len(repertoires1) == len(
@@ -195,28 +267,43 @@ class LigoSimInstruction(Instruction):
         return paired_repertoires
 
     def _pair_two_repertories(self, repertoire1: Repertoire, repertoire2: Repertoire, path: Path) -> Repertoire:
+        """The sequences with the same index in two repertoires form a cell: they are stored one after another with the index as cell_id
+        and the chain appended to their identifiers"""
         assert repertoire1.get_element_count() == repertoire2.get_element_count(), f"{LigoSimInstruction.__name__}: cannot pair repertoires {repertoire1.identifier} and {repertoire2.identifier}, they have different number of sequences: {repertoire1.get_element_count()} and {repertoire2.get_element_count()}."
 
-        sequences = []
-        sequences1, sequences2 = repertoire1.sequences, repertoire2.sequences
-        for index, seq1, seq2 in zip(list(range(len(sequences1))), sequences1, sequences2):
-            seq1.metadata.cell_id = index
-            seq2.metadata.cell_id = index
-            seq1.identifier = f"{seq1.identifier}_{seq1.metadata.chain.value}"
-            seq2.identifier = f"{seq2.identifier}_{seq2.metadata.chain.value}"
-            sequences.extend([seq1, seq2])
+        data = [repertoire1.load_data(), repertoire2.load_data()]
+        count = repertoire1.get_element_count()
+        columns = {}
+
+        for name in dict.fromkeys(data[0].dtype.names + data[1].dtype.names):
+            columns[name] = np.stack([chain_data[name] if name in chain_data.dtype.names else np.full(count, '') for chain_data in data],
+                                     axis=1).reshape(-1)
 
-        return Repertoire.build_from_sequence_objects(sequences, path,
-                                                      metadata={**repertoire1.metadata, **repertoire2.metadata})
+        chain_names, chain_indices = np.unique(columns['chain'], return_inverse=True)
+        chains = [Chain.get_chain(chain_name) for chain_name in chain_names]
+        columns['chain'] = np.array([chain.name for chain in chains])[chain_indices.reshape(-1)]
+        columns['sequence_id'] = np.char.add(columns['sequence_id'].astype(str),
+                                             np.array([f"_{chain.value}" for chain in chains])[chain_indices.reshape(-1)])
+        columns['cell_id'] = np.repeat(np.arange(count), 2)
 
-    def _pair_sequences(self, sequences1: list, sequences2: list, path: Path = None) -> List[Receptor]:
-        assert len(sequences1) == len(
-            sequences2), f"{LigoSimInstruction.__name__}: could not create paired dataset, the number of sequences in two simulation items did not match."
+        return Repertoire.build_from_array(np.core.records.fromarrays(list(columns.values()), names=list(columns.keys())), path,
+                                           metadata={**repertoire1.metadata, **repertoire2.metadata})
 
-        random.shuffle(sequences1)
-        random.shuffle(sequences2)
+    def _pair_sequences(self, sequences1: tuple, sequences2: tuple, chains: List[Chain]) -> Dict[str, np.ndarray]:
+        """Pairs randomly shuffled sequence columns of two simulation items (each given together with their custom parameter columns)
+        into receptor columns"""
+        (columns1, custom_params1), (columns2, custom_params2) = sequences1, sequences2
+        count = len(columns1['identifier'])
+        assert count == len(columns2['identifier']), \
+            f"{LigoSimInstruction.__name__}: could not create paired dataset, the number of sequences in two simulation items did not match."
 
-        return ReceptorBuilder.build_objects_from_pairs(sequences1, sequences2)
+        orders = [np.random.permutation(count), np.random.permutation(count)]
+
+        return make_receptor_columns(ReceptorBuilder.get_receptor_class(chains),
+                                     chain_columns={chains[index].name.lower(): {key: values[orders[index]] for key, values in columns.items()}
+                                                    for index, columns in enumerate([columns1, columns2])},
+                                     custom_params_columns=[{key: values[orders[index]] for key, values in custom_params.items()}
+                                                            for index, custom_params in enumerate([custom_params1, custom_params2])])
 
     def _create_examples(self, item_in) -> Dict[str, list]:
 
@@ -229,7 +316,9 @@ class LigoSimInstruction(Instruction):
 
         return {item.name: res}
 
-    def _create_receptors(self, sim_item: SimConfigItem) -> list:
+    def _create_receptors(self, sim_item: SimConfigItem) -> Union[Dict[str, np.ndarray], tuple]:
+        """Returns the sequence columns of the simulation item; for paired simulations, returns them together with the custom
+        parameter columns which are needed for receptor metadata"""
 
         assert len(sim_item.signals) in [0,
                                          1], f"{LigoSimInstruction.__name__}: for sequence datasets, only 0 or 1 signal or a signal pair per " \
@@ -246,15 +335,18 @@ class LigoSimInstruction(Instruction):
                 sequences = signal_sequences if sequences is None else merge_dataclass_objects(
                     [sequences, signal_sequences])
 
-        sequences = self._compute_p_gens_for_export(sequences, sim_item)
+        sequences = self._prepare_for_export(sequences, sim_item)
 
-        sequences = make_receptor_sequence_objects(sequences,
-                                                   metadata=make_signal_metadata(sim_item, self.state.signals),
-                                                   immune_events=sim_item.immune_events,
-                                                   custom_params=self._custom_fields,
-                                                   chain=sim_item.generative_model.chain)
+        custom_params = make_custom_params_columns(sequences, metadata=make_signal_metadata(sim_item, self.state.signals),
+                                                   immune_events=sim_item.immune_events, custom_params=self._custom_fields)
+        columns = make_sequence_columns(sequences, custom_params, chain=sim_item.generative_model.chain)
 
-        return sequences
+        return (columns, custom_params) if self.state.simulation.paired else columns
+
+    def _prepare_for_export(self, sequences, sim_item: SimConfigItem):
+        """Computes p_gens if they should be exported and converts signal positions from the packed form to the exported one"""
+        sequences = self._compute_p_gens_for_export(sequences, sim_item)
+        return export_signal_positions(sequences, self.state.signals, self.sequence_type)
 
     def _compute_p_gens_for_export(self, sequences, sim_item: SimConfigItem):
         if self._export_p_gens:
@@ -269,92 +361,356 @@ class LigoSimInstruction(Instruction):
         path = PathBuilder.build(self.state.result_path / item.name)
         sequence_paths = self._gen_necessary_sequences(path, sim_item=item)
 
-        repertoires = []
-        used_seq_count = {**{'no_signal': 0}, **{signal.id: 0 for signal in item.signals}}
-        repertoires_path = PathBuilder.build(path / "repertoires")
+        repertoires_path = PathBuilder.remove_old_and_build(path / "repertoires")
+
+        with SequencePool(sequence_paths, self._annotated_dataclass) as sequence_pool:
+            repertoire_sequences = (self._take_repertoire_sequences(sequence_pool, item) for _ in range(item.number_of_examples))
+
+            if self._use_batch_workers:
+                repertoires = self._make_repertoires_in_parallel(repertoire_sequences, item, repertoires_path)
+            else:
+                repertoires = [self._make_repertoire(sequences, item, repertoires_path) for sequences in repertoire_sequences]
+
+        return repertoires
+
+    def _take_repertoire_sequences(self, sequence_pool: SequencePool, item: SimConfigItem):
+        seqs_no_signal_count = item.receptors_in_repertoire_count - sum(
+            get_signal_sequence_count(1, proportion, item.receptors_in_repertoire_count)
+            for _, proportion in item.signal_proportions.items())
 
-        for i in range(item.number_of_examples):
-            seqs_no_signal_count = item.receptors_in_repertoire_count - sum(
-                get_signal_sequence_count(1, proportion, item.receptors_in_repertoire_count)
-                for _, proportion in item.signal_proportions.items())
+        sequences = get_signal_sequences(sequence_pool, item)
 
-            sequences, used_seq_count = get_signal_sequences(self._annotated_dataclass, used_seq_count, item,
-                                                             sequence_paths)
+        sequences = get_no_signal_sequences(sequences=sequences, sequence_pool=sequence_pool,
+                                            seqs_no_signal_count=seqs_no_signal_count, sim_item=item)
 
-            sequences, used_seq_count = get_no_signal_sequences(sequences=sequences, used_seq_count=used_seq_count,
-                                                                seqs_no_signal_count=seqs_no_signal_count,
-                                                                bnp_data_class=self._annotated_dataclass,
-                                                                sequence_paths=sequence_paths,
-                                                                sim_item=item)
+        check_sequence_count(item, sequences)
 
-            check_sequence_count(item, sequences)
+        return sequences
+
+    def _make_repertoire(self, sequences, item: SimConfigItem, repertoires_path: Path) -> Repertoire:
+        sequences = self._prepare_for_export(sequences, item)
+
+        return make_repertoire_from_sequences(sequences, repertoires_path, item, self.state.signals, self._custom_fields)
+
+    def _make_repertoires_in_parallel(self, repertoire_sequences, item: SimConfigItem, repertoires_path: Path) -> List[Repertoire]:
+        """
+        Sequences for each repertoire are taken from the sequence pool in the main process (in the same order as when running in one
+        process) and sent to the workers which compute p_gens if needed and write the repertoire files; at most two repertoires per
+        worker are waiting to be processed at any time, so that the memory usage does not depend on the number of repertoires
+        """
+        repertoires, pending = [], deque()
 
-            sequences = self._compute_p_gens_for_export(sequences, item)
+        with Pool(processes=self._number_of_processes, initializer=_init_repertoire_worker,
+                  initargs=(dill.dumps(self), dill.dumps(item), repertoires_path)) as pool:
+            for sequences in repertoire_sequences:
+                if len(pending) >= 2 * self._number_of_processes:
+                    repertoires.append(pending.popleft().get())
+                pending.append(pool.apply_async(_make_repertoire_in_worker, (dill.dumps(sequences),)))
 
-            repertoire = make_repertoire_from_sequences(sequences, repertoires_path, item, self.state.signals,
-                                                        self._custom_fields)
-            repertoires.append(repertoire)
+            repertoires.extend(result.get() for result in pending)
 
         return repertoires
 
     def _gen_necessary_sequences(self, base_path: Path, sim_item: SimConfigItem) -> Dict[str, Path]:
+        if sim_item.name in self._shared_sequence_paths:
+            return self._shared_sequence_paths[sim_item.name]
+        else:
+            return self._gen_sequences([sim_item], {sim_item.name: base_path})[sim_item.name]
+
+    def _gen_shared_sequences(self):
+        """Generates the sequences for groups of simulation items that share the generative model in one stream of batches per group"""
+        for sim_items in self._get_sim_item_groups():
+            if len(sim_items) > 1:
+                print_log(f"Simulation items {', '.join(item.name for item in sim_items)} use the same generative model, generating "
+                          f"their sequences together.", True)
+                self._shared_sequence_paths.update(
+                    self._gen_sequences(sim_items, {item.name: self._get_base_path(item) for item in sim_items}))
+
+    def _get_sim_item_groups(self) -> List[List[SimConfigItem]]:
+        groups = []
+        for sim_item in self.state.simulation.sim_items:
+            group = next((group for group in groups if self._can_share_background_sequences(group[0], sim_item)), None)
+            if group is None:
+                groups.append([sim_item])
+            else:
+                group.append(sim_item)
+        return groups
+
+    def _can_share_background_sequences(self, sim_item1: SimConfigItem, sim_item2: SimConfigItem) -> bool:
+        """Sequences are shared only with rejection sampling without p_gen-based filtering, where they are not modified or rejected
+        depending on the simulation item, and only if no signal requires a V/J-skewed generative model"""
+        return isinstance(self.state.simulation.simulation_strategy, RejectionSamplingStrategy) \
+            and not self.state.simulation.keep_p_gen_dist \
+            and not any(signal.v_call is not None or signal.j_call is not None for signal in sim_item1.signals + sim_item2.signals) \
+            and sim_item1.generative_model.is_same(sim_item2.generative_model) \
+            and sim_item1.sequence_len_limits == sim_item2.sequence_len_limits
+
+    def _get_base_path(self, sim_item: SimConfigItem) -> Path:
+        return PathBuilder.build(self.state.result_path / sim_item.name) if self.state.simulation.is_repertoire \
+            else self.state.result_path
+
+    def _gen_sequences(self, sim_items: List[SimConfigItem], base_paths: Dict[str, Path]) -> Dict[str, Dict[str, Path]]:
+        """
+        Generates batches of sequences with the generative model (and seed) of the first simulation item until the sequences for all
+        simulation items are generated; if there are multiple simulation items, each sequence is stored for the first item that needs it
+        """
+        paths = {item.name: PathBuilder.build(base_paths[item.name] / item.name) for item in sim_items}
+        seq_paths = {item.name: make_sequence_paths(paths[item.name], item.signals) for item in sim_items}
+        main_item, path = sim_items[0], paths[sim_items[0].name]
+        checkpoints = {item.name: LigoSimCheckpoint.load(paths[item.name]) for item in sim_items} if self._resume else {}
+
+        if len(checkpoints) > 0 and all(checkpoint is not None for checkpoint in checkpoints.values()):
+            seqs_per_signal_count = {}
+            for item in sim_items:
+                seqs_per_signal_count[item.name], iteration = self._restore_from_checkpoint(checkpoints[item.name], item,
+                                                                                           seq_paths[item.name])
+            if all(checkpoint.finished for checkpoint in checkpoints.values()):
+                return seq_paths
+            IterationMetrics.remove_from_iteration(self.state.result_path, [item.name for item in sim_items], iteration)
+            batch_size_controller_state = checkpoints[main_item.name].batch_size_controller_state
+        else:
+            if main_item.seed is not None:
+                np.random.seed(main_item.seed)
+            seqs_per_signal_count = {item.name: get_sequence_per_signal_count(item) for item in sim_items}
+            iteration = 1
+            batch_size_controller_state = None
+            self._store_checkpoints(paths, iteration, seqs_per_signal_count, seq_paths, sim_items)
+
+        batch_pool = self._make_batch_pool(main_item, path) if self._use_batch_workers else None
+        batch_size_controller = BatchSizeController(self._sequence_batch_size, self._target_iterations,
+                                                    self._max_sequence_batch_size) if self._adaptive_batch_size else None
+        if batch_size_controller is not None and batch_size_controller_state is not None:
+            batch_size_controller.set_state(batch_size_controller_state)
+
+        try:
+            while _get_remaining_count(seqs_per_signal_count) > 0 and iteration < self._max_iterations:
+                batch_size = self._get_batch_size(batch_size_controller, _flatten_counts(seqs_per_signal_count), iteration)
+                batch_start = time.perf_counter()
+
+                for sequences, metrics in self._make_annotated_batches(path, iteration, main_item, seqs_per_signal_count[main_item.name],
+                                                                       batch_size, batch_pool):
+
+                    if _get_remaining_count(seqs_per_signal_count) == 0:
+                        break
+
+                    counts_before_batch = _flatten_counts(seqs_per_signal_count)
+                    size_before_batch = _get_file_size(seq_paths)
+                    metrics.sim_items = [item.name for item in sim_items]
+                    for item in sim_items:
+                        metrics.add_found(item.name, sequences, seqs_per_signal_count[item.name])
+
+                    with metrics.track_p_gens(main_item.generative_model):
+                        if len(sim_items) == 1:
+                            seqs_per_signal_count[main_item.name] = self._store_batch(sequences, main_item,
+                                                                                      seqs_per_signal_count[main_item.name],
+                                                                                      seq_paths[main_item.name], metrics)
+                        else:
+                            seqs_per_signal_count = self._route_batch(sequences, sim_items, seqs_per_signal_count, seq_paths, metrics)
+
+                    for item in sim_items:
+                        metrics.add_accepted(item.name, {key: counts_before_batch[(item.name, key)] for key in seqs_per_signal_count[item.name]},
+                                             seqs_per_signal_count[item.name])
+                    metrics.bytes_written = _get_file_size(seq_paths) - size_before_batch
+                    metrics.wall_time = time.perf_counter() - batch_start
+                    metrics.store(self.state.result_path)
+                    batch_start = time.perf_counter()
+
+                    if batch_size_controller is not None:
+                        batch_size_controller.update(batch_size, counts_before_batch, _flatten_counts(seqs_per_signal_count))
+
+                    self._store_checkpoints(paths, iteration + 1, seqs_per_signal_count, seq_paths, sim_items, batch_size_controller)
+
+                    names = ", ".join(seqs_per_signal_count.keys())
+                    remaining = seqs_per_signal_count[main_item.name] if len(sim_items) == 1 else seqs_per_signal_count
+                    print_log(
+                        f"Finished iteration {iteration} in {names}: remaining sequence count per signal for {names}: "
+                        f"{remaining}" if _get_remaining_count(seqs_per_signal_count) > 0 else f"{names} simulation finished", True)
+
+                    check_iteration_progress(iteration, self._max_iterations)
+                    iteration += 1
+        finally:
+            if batch_pool is not None:
+                batch_pool.terminate()
+                batch_pool.join()
+                if not EnvironmentSettings.store_background_batches:
+                    shutil.rmtree(self._get_batch_workers_path(path), ignore_errors=True)
+
+        if iteration == self._max_iterations and _get_remaining_count(seqs_per_signal_count) != 0:
+            raise SimError(
+                f"{LigoSimInstruction.__name__}: maximum iterations were reached, but the simulation could not finish "
+                f"with parameters: {vars(self.state.simulation)}.\n")
 
-        if sim_item.seed is not None:
-            np.random.seed(sim_item.seed)
+        self._store_checkpoints(paths, iteration, seqs_per_signal_count, seq_paths, sim_items, batch_size_controller, finished=True)
 
-        path = PathBuilder.build(base_path / sim_item.name)
-        seqs_per_signal_count = get_sequence_per_signal_count(sim_item)
-        seq_paths = make_sequence_paths(path, sim_item.signals)
-        iteration = 1
+        return seq_paths
 
-        while sum(seqs_per_signal_count.values()) > 0 and iteration < self._max_iterations:
-            sequences = self._make_background_sequences(path, iteration, sim_item, seqs_per_signal_count,
+    def _route_batch(self, sequences, sim_items: List[SimConfigItem], seqs_per_signal_count: Dict[str, dict],
+                     seq_paths: Dict[str, dict], metrics: IterationMetrics) -> Dict[str, dict]:
+        """Stores each sequence for the first simulation item that still needs it; sequences rejected by one simulation item remain
+        available to the others"""
+        available = np.ones(len(sequences), dtype=bool)
+
+        for sim_item in sim_items:
+            counts = seqs_per_signal_count[sim_item.name]
+
+            if sum(counts.values()) > 0 and available.any():
+                with metrics.time('strategy'):
+                    indices = np.flatnonzero(available)
+                    indices = indices[get_legal_sequence_mask(sequences[indices], sim_item, self.state.signals,
+                                                              RejectionSamplingStrategy.MAX_SIGNALS_PER_SEQUENCE,
+                                                              RejectionSamplingStrategy.MAX_MOTIFS_PER_SEQUENCE)]
+                    candidates = sequences[indices]
+
+                    selections = {**select_seqs_with_signal(counts, candidates, self.state.signals, sim_item.signals),
+                                  'no_signal': select_seqs_without_signal(counts['no_signal'], candidates)}
+
+                for key, selection in selections.items():
+                    if selection.any():
+                        with metrics.time('writing'):
+                            write_bnp_data(seq_paths[sim_item.name][key], candidates[selection])
+                        counts[key] -= int(selection.sum())
+                        available[indices[selection]] = False
+
+        return seqs_per_signal_count
+
+    def _get_batch_size(self, batch_size_controller: BatchSizeController, seqs_per_signal_count: dict, iteration: int) -> int:
+        if batch_size_controller is None:
+            return self._sequence_batch_size
+        elif iteration == 1:
+            return batch_size_controller.batch_size
+        else:
+            batch_size = batch_size_controller.next_batch_size(seqs_per_signal_count, iteration)
+            print_log(f"Next batch size is {batch_size} sequences, predicted remaining iterations: "
+                      f"{batch_size_controller.predict_remaining_iterations(seqs_per_signal_count)}.", True)
+            return batch_size
+
+    def _store_checkpoints(self, paths: Dict[str, Path], iteration: int, seqs_per_signal_count: Dict[str, dict],
+                           seq_paths: Dict[str, dict], sim_items: List[SimConfigItem], batch_size_controller: BatchSizeController = None,
+                           finished: bool = False):
+        for sim_item in sim_items:
+            LigoSimCheckpoint.make(iteration, seqs_per_signal_count[sim_item.name], seq_paths[sim_item.name], finished,
+                                   target_p_gen_histogram=self.state.target_p_gen_histogram.get(sim_item.name),
+                                   p_gen_bins=self.state.p_gen_bins.get(sim_item.name),
+                                   generative_model_state=sim_item.generative_model.get_state(),
+                                   batch_size_controller_state=batch_size_controller.get_state() if batch_size_controller is not None
+                                   else None).store(paths[sim_item.name])
+
+    def _restore_from_checkpoint(self, checkpoint: LigoSimCheckpoint, sim_item: SimConfigItem, seq_paths: dict) -> Tuple[dict, int]:
+        checkpoint.restore_files(seq_paths)
+        checkpoint.restore_random_state()
+
+        if checkpoint.generative_model_state is not None:
+            sim_item.generative_model.set_state(checkpoint.generative_model_state)
+
+        if checkpoint.target_p_gen_histogram is not None:
+            self.state.target_p_gen_histogram[sim_item.name] = np.array(checkpoint.target_p_gen_histogram)
+            self.state.p_gen_bins[sim_item.name] = np.array(checkpoint.p_gen_bins)
+
+        print_log(f"Resuming {sim_item.name} from iteration {checkpoint.iteration}, remaining sequence count per signal: "
+                  f"{checkpoint.seqs_per_signal_count}" if not checkpoint.finished
+                  else f"Sequences for {sim_item.name} were already simulated, skipping to the next step.", True)
+
+        return checkpoint.seqs_per_signal_count, checkpoint.iteration
+
+    @property
+    def _use_batch_workers(self) -> bool:
+        """Batches are made in parallel by workers with their own copies of the generative model, which is possible only if the model
+        does not keep track of the sequences it already generated"""
+        return self._number_of_processes > len(self.state.simulation.sim_items) \
+            and not any(sim_item.generative_model.is_stateful() for sim_item in self.state.simulation.sim_items)
+
+    def _make_batch_pool(self, sim_item: SimConfigItem, path: Path) -> Pool:
+        return Pool(processes=self._number_of_processes, initializer=_init_batch_worker,
+                    initargs=(dill.dumps(self), dill.dumps(sim_item), self._get_batch_workers_path(path)))
+
+    def _get_batch_workers_path(self, path: Path) -> Path:
+        """Scratch folder of the batch workers (one subfolder per worker), removed when the workers are stopped"""
+        return path / "tmp_batch_workers"
+
+    def _make_annotated_batches(self, path: Path, iteration: int, sim_item: SimConfigItem, seqs_per_signal_count: dict,
+                                batch_size: int, batch_pool: Pool = None):
+        """
+        Returns one annotated batch if running in a single process or when the first batch is used to estimate the p_gen histogram;
+        otherwise, returns an iterator over annotated batches generated by batch workers, as many as there are workers, in
+        order of iterations; the quotas are checked only when the batches are stored, so the last few batches might not be used;
+        each batch comes with the metrics of its iteration
+        """
+        if batch_pool is None or iteration == 1:
+            metrics = IterationMetrics(sim_items=[sim_item.name], iteration=iteration, batch_size=batch_size)
+            with metrics.track_p_gens(sim_item.generative_model):
+                sequences = self._make_annotated_batch(path, iteration, sim_item, seqs_per_signal_count, batch_size, metrics)
+            return [(sequences, metrics)]
+        else:
+            batch_count = min(self._number_of_processes, self._max_iterations - iteration)
+            tasks = [(iteration + i, copy.deepcopy(seqs_per_signal_count), batch_size, self._make_batch_seed(sim_item, iteration + i))
+                     for i in range(batch_count)]
+            return (dill.loads(batch) for batch in batch_pool.imap(_make_annotated_batch_in_worker, tasks))
+
+    def _make_batch_seed(self, sim_item: SimConfigItem, iteration: int, stream: int = 0) -> int:
+        """Derives the seed for the given iteration from the seed of the simulation item; streams distinguish the seeds of different
+        generators used in the same iteration"""
+        entropy = [sim_item.seed, iteration, stream] if sim_item.seed is not None else None
+        return int(np.random.SeedSequence(entropy).generate_state(1)[0])
+
+    def _make_annotated_batch(self, path: Path, iteration: int, sim_item: SimConfigItem, seqs_per_signal_count: dict,
+                              batch_size: int, metrics: IterationMetrics):
+        with metrics.time('generation'):
+            sequences = self._make_background_sequences(path, iteration, sim_item, seqs_per_signal_count, batch_size,
                                                         need_background_seqs=iteration == 1 and self.state.simulation.keep_p_gen_dist)
+        metrics.generated = len(sequences)
 
-            if self.state.simulation.keep_p_gen_dist and sim_item.generative_model.can_compute_p_gens() and iteration == 1:
-                self._make_p_gen_histogram(sequences, sim_item.name, path)
-                print_log(
-                    f"Computed a histogram from the first batch of background sequences for {sim_item.name}, available at: {str(path)}",
-                    include_datetime=True)
+        if self.state.simulation.keep_p_gen_dist and sim_item.generative_model.can_compute_p_gens() and iteration == 1:
+            self._make_p_gen_histogram(sequences, sim_item.name, path)
+            print_log(
+                f"Computed a histogram from the first batch of background sequences for {sim_item.name}, available at: {str(path)}",
+                include_datetime=True)
 
+        with metrics.time('length_filtering'):
             sequences = filter_sequences_by_length(sequences, sim_item, self.sequence_type)
 
-            sequences = annotate_sequences(sequences, self.sequence_type == SequenceType.AMINO_ACID, self.state.signals,
-                                           self._annotated_dataclass, sim_item.name)
-
+        with metrics.time('annotation'):
+            return annotate_sequences(sequences, self.sequence_type == SequenceType.AMINO_ACID, self.state.signals,
+                                      self._annotated_dataclass, sim_item.name, self._get_motif_matcher(), self._custom_func_pool,
+                                      self._number_of_processes)
+
+    def _get_motif_matcher(self) -> MotifMatcher:
+        if self._motif_matcher is None:
+            self._motif_matcher = MotifMatcher(self.state.signals, self.sequence_type)
+        return self._motif_matcher
+
+    def __getstate__(self):
+        """The pool for custom signal functions stays in the main process; copies of the instruction in worker processes call the
+        functions directly"""
+        state = self.__dict__.copy()
+        state['_custom_func_pool'] = None
+        return state
+
+    def _store_batch(self, sequences, sim_item: SimConfigItem, seqs_per_signal_count: dict, seq_paths: dict,
+                     metrics: IterationMetrics) -> dict:
+        with metrics.time('strategy'):
             sequences = self.state.simulation.simulation_strategy.process_sequences(sequences, copy.deepcopy(
-                seqs_per_signal_count), self._use_p_gens,  self.sequence_type, sim_item, self.state.signals,
+                seqs_per_signal_count), self._use_p_gens, self.sequence_type, sim_item, self.state.signals,
                 self.state.simulation.remove_seqs_with_signals,
-                implanting_scaling_factor=self.state.simulation.implanting_scaling_factor)
+                implanting_scaling_factor=self.state.simulation.implanting_scaling_factor, motif_matcher=self._get_motif_matcher())
 
-            if sequences is not None and len(sequences) > 0:
+        if sequences is not None and len(sequences) > 0:
 
-                if self.state.simulation.keep_p_gen_dist and sim_item.generative_model.can_compute_p_gens():
+            if self.state.simulation.keep_p_gen_dist and sim_item.generative_model.can_compute_p_gens():
+                with metrics.time('p_gen'):
                     sequences = self._filter_using_p_gens(sequences, sim_item)
 
+            with metrics.time('writing'):
                 seqs_per_signal_count['no_signal'] = update_seqs_without_signal(seqs_per_signal_count['no_signal'],
                                                                                 sequences, seq_paths['no_signal'])
                 seqs_per_signal_count = update_seqs_with_signal(copy.deepcopy(seqs_per_signal_count), sequences,
                                                                 self.state.signals, sim_item.signals,
                                                                 seq_paths)
 
-            print_log(
-                f"Finished iteration {iteration} in {sim_item.name}: remaining sequence count per signal for {sim_item.name}: "
-                f"{seqs_per_signal_count}" if sum(
-                    seqs_per_signal_count.values()) > 0 else f"{sim_item.name} simulation finished", True)
-            check_iteration_progress(iteration, self._max_iterations)
-            iteration += 1
-
-        if iteration == self._max_iterations and sum(seqs_per_signal_count.values()) != 0:
-            raise SimError(
-                f"{LigoSimInstruction.__name__}: maximum iterations were reached, but the simulation could not finish "
-                f"with parameters: {vars(self.state.simulation)}.\n")
-
-        return seq_paths
+        return seqs_per_signal_count
 
     def _make_background_sequences(self, path, iteration: int, sim_item: SimConfigItem, sequence_per_signal_count: dict,
-                                   need_background_seqs: bool) -> BackgroundSequences:
-        sequence_path = PathBuilder.build(path / f"gen_model/") / f"tmp_{iteration}.tsv"
+                                   batch_size: int, need_background_seqs: bool) -> BackgroundSequences:
+        sequences = []
 
         v_genes = sorted(list(set(chain(signal.v_call for signal in sim_item.signals if signal.v_call is not None))))
         j_genes = sorted(list(set(chain(signal.j_call for signal in sim_item.signals if signal.j_call is not None))))
@@ -362,31 +718,29 @@ class LigoSimInstruction(Instruction):
         if sequence_per_signal_count['no_signal'] > 0 or need_background_seqs or (
                 len(v_genes) == 0 and len(j_genes) == 0) \
                 or not sim_item.generative_model.can_generate_from_skewed_gene_models():
-            sim_item.generative_model.generate_sequences(self._sequence_batch_size, seed=sim_item.seed,
-                                                         path=sequence_path,
-                                                         sequence_type=self.sequence_type,
-                                                         compute_p_gen=self._use_p_gens)
+            sequences.append(sim_item.generative_model.generate_sequences_in_memory(batch_size,
+                                                                                    seed=self._make_batch_seed(sim_item, iteration),
+                                                                                    sequence_type=self.sequence_type,
+                                                                                    compute_p_gen=self._use_p_gens))
 
-            print_log(f"Generated {self._sequence_batch_size} background sequences, stored at {sequence_path}.", True)
+            print_log(f"Generated {batch_size} background sequences for {sim_item.name}.", True)
 
         skew_model_for_signal = needs_seqs_with_signal(sequence_per_signal_count)
 
         if sim_item.generative_model.can_generate_from_skewed_gene_models() and skew_model_for_signal and (
                 len(v_genes) > 0 or len(j_genes) > 0):
-            sim_item.generative_model.generate_from_skewed_gene_models(v_genes=v_genes, j_genes=j_genes,
-                                                                       seed=sim_item.seed, path=sequence_path,
-                                                                       sequence_type=self.sequence_type,
-                                                                       batch_size=self._sequence_batch_size,
-                                                                       compute_p_gen=self._use_p_gens)
+            sequences.append(sim_item.generative_model.generate_from_skewed_gene_models_in_memory(
+                v_genes=v_genes, j_genes=j_genes, seed=self._make_batch_seed(sim_item, iteration, stream=1),
+                sequence_type=self.sequence_type, batch_size=batch_size, compute_p_gen=self._use_p_gens))
 
-            print_log(
-                f"Generated {self._sequence_batch_size} sequences from skewed model for given V/J genes at {sequence_path}.",
-                True)
+            print_log(f"Generated {batch_size} sequences from skewed model for given V/J genes for {sim_item.name}.", True)
 
-        data = get_bnp_data(sequence_path, BackgroundSequences)
+        data = np.concatenate(sequences) if len(sequences) > 1 else sequences[0]
 
-        os.remove(sequence_path)
-        print_log(f"Prepared sequences for processing and removed temporary file {sequence_path}.", True)
+        if EnvironmentSettings.store_background_batches:
+            sequence_path = PathBuilder.build(path / "gen_model") / f"tmp_{iteration}.tsv"
+            write_bnp_data(sequence_path, data)
+            print_log(f"Stored generated sequences at {sequence_path}.", True)
 
         return data
 
@@ -436,3 +790,47 @@ class LigoSimInstruction(Instruction):
             True)
 
         return sequences[keep_sequences]
+
+
+def _get_remaining_count(seqs_per_signal_count: Dict[str, dict]) -> int:
+    return sum(sum(counts.values()) for counts in seqs_per_signal_count.values())
+
+
+def _flatten_counts(seqs_per_signal_count: Dict[str, dict]) -> dict:
+    return {(name, key): count for name, counts in seqs_per_signal_count.items() for key, count in counts.items()}
+
+
+def _get_file_size(seq_paths: Dict[str, dict]) -> int:
+    return sum(path.stat().st_size for paths in seq_paths.values() for path in paths.values() if path.is_file())
+
+
+_batch_worker_context = {}
+_repertoire_worker_context = {}
+
+
+def _init_batch_worker(instruction: bytes, sim_item: bytes, path: Path):
+    _batch_worker_context['instruction'] = dill.loads(instruction)
+    _batch_worker_context['sim_item'] = dill.loads(sim_item)
+    _batch_worker_context['path'] = PathBuilder.build(path / f"batch_worker_{os.getpid()}")
+
+
+def _make_annotated_batch_in_worker(task: tuple) -> bytes:
+    iteration, seqs_per_signal_count, batch_size, seed = task
+    np.random.seed(seed)
+    metrics = IterationMetrics(sim_items=[_batch_worker_context['sim_item'].name], iteration=iteration, batch_size=batch_size)
+    with metrics.track_p_gens(_batch_worker_context['sim_item'].generative_model):
+        sequences = _batch_worker_context['instruction']._make_annotated_batch(_batch_worker_context['path'], iteration,
+                                                                              _batch_worker_context['sim_item'],
+                                                                              seqs_per_signal_count, batch_size, metrics)
+    return dill.dumps((sequences, metrics))
+
+
+def _init_repertoire_worker(instruction: bytes, sim_item: bytes, repertoires_path: Path):
+    _repertoire_worker_context['instruction'] = dill.loads(instruction)
+    _repertoire_worker_context['sim_item'] = dill.loads(sim_item)
+    _repertoire_worker_context['path'] = repertoires_path
+
+
+def _make_repertoire_in_worker(sequences: bytes) -> Repertoire:
+    return _repertoire_worker_context['instruction']._make_repertoire(dill.loads(sequences), _repertoire_worker_context['sim_item'],
+                                                                      _repertoire_worker_context['path'])
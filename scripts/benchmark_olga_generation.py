@@ -0,0 +1,34 @@
+import argparse
+import time
+
+from ligo.environment.SequenceType import SequenceType
+from ligo.simulation.generative_models.OLGA import OLGA
+from ligo.simulation.generative_models.VectorisedOLGA import VectorisedOLGA
+
+
+def benchmark(default_model_name: str, count: int, compute_p_gen: bool, sequence_type: SequenceType, number_of_processes: int,
+              vectorised: bool = False) -> float:
+    """Returns the number of sequences generated per second by the OLGA or VectorisedOLGA generative model (after the model is loaded)"""
+    model = (VectorisedOLGA if vectorised else OLGA).build_object(default_model_name=default_model_name, number_of_processes=number_of_processes)
+    model.generate_sequences_in_memory(1, seed=1, sequence_type=sequence_type, compute_p_gen=False)
+
+    start = time.perf_counter()
+    model.generate_sequences_in_memory(count, seed=1, sequence_type=sequence_type, compute_p_gen=compute_p_gen)
+
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures how many sequences per second the OLGA generative model produces.")
+    parser.add_argument("--default_model_name", default="humanTRB")
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--compute_p_gen", action="store_true")
+    parser.add_argument("--number_of_processes", type=int, default=1)
+    parser.add_argument("--vectorised", action="store_true", help="use VectorisedOLGA instead of OLGA")
+    parser.add_argument("--sequence_type", default=SequenceType.AMINO_ACID.name, choices=[s.name for s in SequenceType])
+    args = parser.parse_args()
+
+    speed = benchmark(args.default_model_name, args.count, args.compute_p_gen, SequenceType[args.sequence_type],
+                      args.number_of_processes, args.vectorised)
+    print(f"{'VectorisedOLGA' if args.vectorised else 'OLGA'} {args.default_model_name}: {speed:.0f} sequences per second (compute_p_gen={args.compute_p_gen}, "
+          f"number_of_processes={args.number_of_processes}).")
@@ -0,0 +1,11 @@
+import pytest
+
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+
+
+@pytest.fixture(autouse=True, scope="session")
+def use_tmp_cache_path():
+    """Keeps the caches written by the tests (e.g., processed OLGA models and sequence banks) in the test tmp folder"""
+    EnvironmentSettings.set_cache_path(EnvironmentSettings.tmp_cache_path)
+    yield
+    EnvironmentSettings.reset_cache_path()
@@ -0,0 +1,30 @@
+import shutil
+
+from ligo.dsl.definition_parsers.SignalParser import SignalParser
+from ligo.dsl.symbol_table.SymbolTable import SymbolTable
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+from ligo.util.PathBuilder import PathBuilder
+
+
+def test_parse_custom_func_signals():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / "signal_parser_custom_func")
+
+    with (path / "signal_parser_funcs.py").open("w") as file:
+        file.write("from typing import List\n\nfrom bionumpy import EncodedRaggedArray\n\n\n"
+                   "def per_sequence(sequence_aa: str, sequence: str, v_call: str, j_call: str) -> bool:\n"
+                   "    return 'AS' in sequence_aa\n\n\n"
+                   "def unannotated(sequence_aa, sequence, v_call, j_call):\n"
+                   "    return 'AS' in sequence_aa\n\n\n"
+                   "def batched(sequence_aa: EncodedRaggedArray, v_call: List[str]):\n"
+                   "    return [True for _ in v_call]\n")
+
+    specs = {name: {'source_file': str(path / "signal_parser_funcs.py"), 'is_present_func': name}
+             for name in ['per_sequence', 'unannotated', 'batched']}
+
+    symbol_table, _ = SignalParser.parse(specs, SymbolTable())
+
+    assert symbol_table.get('per_sequence').custom_func_batch_columns is None
+    assert symbol_table.get('unannotated').custom_func_batch_columns is None
+    assert symbol_table.get('batched').custom_func_batch_columns == {'sequence_aa': False, 'v_call': True}
+
+    shutil.rmtree(path)
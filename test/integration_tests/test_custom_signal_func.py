@@ -16,7 +16,9 @@ class TestLIgOSimulation(TestCase):
 
         with (path / 'sample_source.py').open("w") as file:
             file.write("def is_present(sequence_aa: str, sequence: str, v_call: str, j_call: str) -> bool:\n\t"
-                       "return any(aa in sequence_aa for aa in ['A', 'T']) and len(sequence_aa) > 12")
+                       "return any(aa in sequence_aa for aa in ['A', 'T']) and len(sequence_aa) > 12\n\n"
+                       "def is_present_batched(sequence_aa: list, j_call: list):\n\t"
+                       "return [len(seq) < 12 and j.startswith('TRBJ2') for seq, j in zip(sequence_aa, j_call)]")
 
         specs = {
             "definitions": {
@@ -24,6 +26,10 @@ class TestLIgOSimulation(TestCase):
                     "signal1": {
                         "source_file": str(path / "sample_source.py"),
                         "is_present_func": "is_present"
+                    },
+                    "signal2": {
+                        "source_file": str(path / "sample_source.py"),
+                        "is_present_func": "is_present_batched"
                     }
                 },
                 "simulations": {
@@ -34,7 +40,7 @@ class TestLIgOSimulation(TestCase):
                         "simulation_strategy": "RejectionSampling",
                         "sim_items": {
                             "sim_item1": {
-                                "signals": {"signal1": 0.5},
+                                "signals": {"signal1": 0.5, "signal2": 0.2},
                                 "number_of_examples": 10,
                                 "is_noise": False,
                                 "seed": 100,
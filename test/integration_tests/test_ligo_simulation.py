@@ -111,5 +111,6 @@ def test_simulation():
 
     metadata_df = pd.read_csv(path / "result/inst1/metadata.csv", comment=Constants.COMMENT_SIGN)
     assert all(el in metadata_df.columns for el in ["signal1", "ievent1", "ievent2", "signal2"])
+    assert not any(folder.name == "gen_model" for folder in (path / "result").rglob("*") if folder.is_dir())
 
     shutil.rmtree(path)
@@ -1,9 +1,12 @@
 import shutil
 from pathlib import Path
 
+import numpy as np
 import yaml
 
 from ligo.app.LigoApp import LigoApp
+from ligo.data_model.dataset.ReceptorDataset import ReceptorDataset
+from ligo.data_model.receptor.TCABReceptor import TCABReceptor
 from ligo.environment.EnvironmentSettings import EnvironmentSettings
 from ligo.util.PathBuilder import PathBuilder
 
@@ -103,4 +106,16 @@ def test_paired_simulation():
         app = LigoApp(specification_path=specs_path, result_path=path / "result/")
         app.run()
 
+        if receptor_sim:
+            receptors = list(ReceptorDataset.build(filenames=[path / "result/inst1/batch1.npy"], file_size=10,
+                                                   element_class_name=TCABReceptor.__name__).get_data())
+            assert len(receptors) == 10
+            assert all(receptor.alpha.metadata.custom_params['signal2'] == 1 and receptor.beta.metadata.custom_params['signal1'] == 1
+                       for receptor in receptors)
+        else:
+            data = np.load(sorted((path / "result/inst1/paired").glob("*.npy"))[0])
+            assert np.array_equal(data['cell_id'], np.repeat(np.arange(10), 2))
+            assert list(data['chain'][:2]) == ['ALPHA', 'BETA']
+            assert all(sequence_id.endswith('_TRA') for sequence_id in data['sequence_id'][::2])
+
         shutil.rmtree(path)
@@ -0,0 +1,119 @@
+import itertools
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+from ligo.app.LigoApp import LigoApp
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+from ligo.util.PathBuilder import PathBuilder
+
+
+def prepare_specs(path, generative_model: dict = None) -> Path:
+    specs = {
+        "definitions": {
+            "motifs": {
+                "motif1": {
+                    "seed": "AS"
+                }
+            },
+            "signals": {
+                "signal1": {
+                    "motifs": ["motif1"]
+                }
+            },
+            "simulations": {
+                "sim1": {
+                    "is_repertoire": False,
+                    "paired": False,
+                    "sequence_type": "amino_acid",
+                    "simulation_strategy": "RejectionSampling",
+                    "sim_items": {
+                        "var1": {
+                            "signals": {"signal1": 1.},
+                            "number_of_examples": 200,
+                            "seed": 1,
+                            "generative_model": generative_model if generative_model is not None else {
+                                "type": "OLGA",
+                                "default_model_name": "humanTRB"
+                            }
+                        }
+                    }
+                }
+            },
+        },
+        "instructions": {
+            "inst1": {
+                "type": "LigoSim",
+                "simulation": "sim1",
+                "sequence_batch_size": 50,
+                "adaptive_batch_size": True,
+                "target_iterations": 4,
+                "max_sequence_batch_size": 500,
+                'max_iterations': 100,
+                "export_p_gens": False,
+                "number_of_processes": 3
+            }
+        },
+        "output": {
+            "format": "HTML"
+        }
+    }
+
+    with open(path / "specs.yaml", "w") as file:
+        yaml.dump(specs, file)
+
+    return path / "specs.yaml"
+
+
+def test_parallel_batch_simulation():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / "integration_parallel_batch_simulation/")
+
+    specs_path = prepare_specs(path)
+
+    PathBuilder.build(path / "result/")
+
+    app = LigoApp(specification_path=specs_path, result_path=path / "result/")
+    app.run()
+
+    df = pd.read_csv(path / "result/inst1/exported_dataset/airr/batch1.tsv", sep="\t")
+    assert df.shape[0] == 200
+    assert df['signal1'].all()
+
+    signal_metrics = pd.read_csv(path / "result/inst1/simulation_metrics_signals.csv")
+    assert signal_metrics.loc[signal_metrics.signal == 'signal1', 'accepted'].sum() == 200
+    assert (path / "result/inst1/simulation_metrics.jsonl").is_file()
+    assert not any("batch_worker" in folder.name for folder in (path / "result").rglob("*") if folder.is_dir())
+
+    shutil.rmtree(path)
+
+
+def _write_airr_file(path: Path) -> Path:
+    suffixes = ["".join(letters) for letters in itertools.product("DEGKLNPQRTY", repeat=3)]
+    sequences = [f"C{prefix}{suffix}F" for suffix in suffixes[:1000] for prefix in ["AS", "TT"]]
+    with (path / "sequences.tsv").open("w") as file:
+        file.writelines(["sequence_id\tjunction_aa\tv_call\tj_call\tlocus\tproductive\n"] +
+                        [f"seq{index}\t{sequence}\tTRBV7-2\tTRBJ2-7\tTRB\tT\n" for index, sequence in enumerate(sequences)])
+    return path / "sequences.tsv"
+
+
+def test_parallel_batch_simulation_with_experimental_import():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / "integration_parallel_batch_simulation_import/")
+
+    specs_path = prepare_specs(path, {"type": "ExperimentalImport", "import_format": "AIRR", "tmp_import_path": str(path / "tmp_import"),
+                                      "shuffle": True,
+                                      "import_params": {"path": str(_write_airr_file(path)), "region_type": "IMGT_JUNCTION"}})
+
+    PathBuilder.build(path / "result/")
+
+    app = LigoApp(specification_path=specs_path, result_path=path / "result/")
+    app.run()
+
+    df = pd.read_csv(path / "result/inst1/exported_dataset/airr/batch1.tsv", sep="\t")
+    assert df.shape[0] == 200
+    assert df['signal1'].all()
+    assert not df['junction_aa'].duplicated().any()
+    assert not df['sequence_id'].duplicated().any()
+
+    shutil.rmtree(path)
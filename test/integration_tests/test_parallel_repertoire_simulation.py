@@ -0,0 +1,86 @@
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+from ligo.app.LigoApp import LigoApp
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+from ligo.util.PathBuilder import PathBuilder
+
+
+def prepare_specs(path) -> Path:
+    specs = {
+        "definitions": {
+            "motifs": {
+                "motif1": {
+                    "seed": "AS"
+                }
+            },
+            "signals": {
+                "signal1": {
+                    "motifs": ["motif1"]
+                }
+            },
+            "simulations": {
+                "sim1": {
+                    "is_repertoire": True,
+                    "paired": False,
+                    "sequence_type": "amino_acid",
+                    "simulation_strategy": "RejectionSampling",
+                    "sim_items": {
+                        "var1": {
+                            "signals": {"signal1": 0.3},
+                            "number_of_examples": 6,
+                            "receptors_in_repertoire_count": 10,
+                            "seed": 1,
+                            "generative_model": {
+                                "type": "OLGA",
+                                "default_model_name": "humanTRB"
+                            }
+                        }
+                    }
+                }
+            },
+        },
+        "instructions": {
+            "inst1": {
+                "type": "LigoSim",
+                "simulation": "sim1",
+                "sequence_batch_size": 50,
+                'max_iterations': 100,
+                "export_p_gens": True,
+                "number_of_processes": 3
+            }
+        },
+        "output": {
+            "format": "HTML"
+        }
+    }
+
+    with open(path / "specs.yaml", "w") as file:
+        yaml.dump(specs, file)
+
+    return path / "specs.yaml"
+
+
+def test_parallel_repertoire_simulation():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / "integration_parallel_repertoire_simulation/")
+
+    specs_path = prepare_specs(path)
+
+    PathBuilder.build(path / "result/")
+
+    app = LigoApp(specification_path=specs_path, result_path=path / "result/")
+    app.run()
+
+    metadata = pd.read_csv(path / "result/inst1/metadata.csv")
+    assert metadata.shape[0] == 6
+
+    for filename in metadata['filename']:
+        repertoire = pd.read_csv(path / f"result/inst1/exported_dataset/airr/repertoires/{Path(filename).stem}.tsv", sep="\t")
+        assert repertoire.shape[0] == 10
+        assert repertoire['signal1'].sum() == 3
+        assert (repertoire['p_gen'] > 0).all()
+
+    shutil.rmtree(path)
@@ -0,0 +1,137 @@
+import itertools
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+from ligo.app.LigoApp import LigoApp
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+from ligo.simulation.IterationMetrics import IterationMetrics
+from ligo.simulation.LigoSimCheckpoint import LigoSimCheckpoint
+from ligo.util.PathBuilder import PathBuilder
+
+
+def prepare_specs(path, max_iterations: int, generative_model: dict = None, instruction_params: dict = None) -> Path:
+    specs = {
+        "definitions": {
+            "motifs": {
+                "motif1": {
+                    "seed": "AS"
+                }
+            },
+            "signals": {
+                "signal1": {
+                    "motifs": ["motif1"]
+                }
+            },
+            "simulations": {
+                "sim1": {
+                    "is_repertoire": False,
+                    "paired": False,
+                    "sequence_type": "amino_acid",
+                    "simulation_strategy": "RejectionSampling",
+                    "sim_items": {
+                        "var1": {
+                            "signals": {"signal1": 1.},
+                            "number_of_examples": 100,
+                            "seed": 1,
+                            "generative_model": generative_model if generative_model is not None else {
+                                "type": "OLGA",
+                                "default_model_name": "humanTRB"
+                            }
+                        }
+                    }
+                }
+            },
+        },
+        "instructions": {
+            "inst1": {
+                "type": "LigoSim",
+                "simulation": "sim1",
+                "sequence_batch_size": 50,
+                'max_iterations': max_iterations,
+                "export_p_gens": False,
+                "number_of_processes": 1,
+                **(instruction_params if instruction_params is not None else {})
+            }
+        },
+        "output": {
+            "format": "HTML"
+        }
+    }
+
+    with open(path / f"specs_{max_iterations}.yaml", "w") as file:
+        yaml.dump(specs, file)
+
+    return path / f"specs_{max_iterations}.yaml"
+
+
+def test_resume_simulation():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / "integration_resume_simulation/")
+    result_path = PathBuilder.build(path / "result/")
+
+    LigoApp(specification_path=prepare_specs(path, 2), result_path=result_path).run()
+
+    checkpoint = LigoSimCheckpoint.load(result_path / "inst1/var1")
+    assert checkpoint.iteration == 2 and not checkpoint.finished
+    assert 0 < checkpoint.seqs_per_signal_count['signal1'] < 100
+
+    LigoApp(specification_path=prepare_specs(path, 100), result_path=result_path, resume=True).run()
+
+    assert LigoSimCheckpoint.load(result_path / "inst1/var1").finished
+
+    df = pd.read_csv(result_path / "inst1/exported_dataset/airr/batch1.tsv", sep="\t")
+    assert df.shape[0] == 100
+    assert df['signal1'].all()
+
+    iterations = [record.iteration for record in IterationMetrics.load(result_path / "inst1")]
+    assert iterations == list(range(1, len(iterations) + 1))
+
+    shutil.rmtree(path)
+
+
+def test_resume_simulation_with_experimental_import():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / "integration_resume_simulation_import/")
+    result_path = PathBuilder.build(path / "result/")
+
+    sequences = [f"C{prefix}{''.join(letters)}F" for letters in itertools.product("DEGKLNPQRTY", repeat=3) for prefix in ["AS", "TT"]]
+    with (path / "sequences.tsv").open("w") as file:
+        file.writelines(["sequence_id\tjunction_aa\tv_call\tj_call\tlocus\tproductive\n"] +
+                        [f"seq{index}\t{sequence}\tTRBV7-2\tTRBJ2-7\tTRB\tT\n" for index, sequence in enumerate(sequences)])
+
+    generative_model = {"type": "ExperimentalImport", "import_format": "AIRR", "tmp_import_path": str(path / "tmp_import"),
+                        "import_params": {"path": str(path / "sequences.tsv"), "region_type": "IMGT_JUNCTION"}}
+
+    LigoApp(specification_path=prepare_specs(path, 2, generative_model), result_path=result_path).run()
+    assert LigoSimCheckpoint.load(result_path / "inst1/var1").generative_model_state == {'counter': 50}
+
+    LigoApp(specification_path=prepare_specs(path, 100, generative_model), result_path=result_path, resume=True).run()
+
+    df = pd.read_csv(result_path / "inst1/exported_dataset/airr/batch1.tsv", sep="\t")
+    assert df.shape[0] == 100
+    assert not df['junction_aa'].duplicated().any()
+
+    shutil.rmtree(path)
+
+
+def test_resume_simulation_with_adaptive_batch_size():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / "integration_resume_simulation_adaptive/")
+    result_path = PathBuilder.build(path / "result/")
+    instruction_params = {"adaptive_batch_size": True, "target_iterations": 5, "max_sequence_batch_size": 1000}
+
+    LigoApp(specification_path=prepare_specs(path, 3, instruction_params=instruction_params), result_path=result_path).run()
+
+    state = LigoSimCheckpoint.load(result_path / "inst1/var1").batch_size_controller_state
+    assert state['generated_count'] == sum(record.batch_size for record in IterationMetrics.load(result_path / "inst1"))
+    assert state['batch_size'] == IterationMetrics.load(result_path / "inst1")[-1].batch_size
+
+    LigoApp(specification_path=prepare_specs(path, 100, instruction_params=instruction_params), result_path=result_path, resume=True).run()
+
+    # the resumed simulation continues with the acceptance rates estimated before, so it does not start again from sequence_batch_size
+    assert IterationMetrics.load(result_path / "inst1")[2].batch_size != 50
+
+    df = pd.read_csv(result_path / "inst1/exported_dataset/airr/batch1.tsv", sep="\t")
+    assert df.shape[0] == 100
+
+    shutil.rmtree(path)
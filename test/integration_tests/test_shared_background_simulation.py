@@ -0,0 +1,105 @@
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+from ligo.app.LigoApp import LigoApp
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+from ligo.simulation.LigoSimCheckpoint import LigoSimCheckpoint
+from ligo.util.PathBuilder import PathBuilder
+
+
+def prepare_specs(path) -> Path:
+    specs = {
+        "definitions": {
+            "motifs": {
+                "motif1": {
+                    "seed": "AS"
+                }
+            },
+            "signals": {
+                "signal1": {
+                    "motifs": ["motif1"]
+                }
+            },
+            "simulations": {
+                "sim1": {
+                    "is_repertoire": False,
+                    "paired": False,
+                    "sequence_type": "amino_acid",
+                    "simulation_strategy": "RejectionSampling",
+                    "sim_items": {
+                        "var1": {
+                            "signals": {"signal1": 1.},
+                            "number_of_examples": 100,
+                            "seed": 1,
+                            "generative_model": {
+                                "type": "OLGA",
+                                "default_model_name": "humanTRB"
+                            }
+                        },
+                        "var2": {
+                            "signals": {},
+                            "number_of_examples": 100,
+                            "seed": 2,
+                            "generative_model": {
+                                "type": "OLGA",
+                                "default_model_name": "humanTRB"
+                            }
+                        }
+                    }
+                }
+            },
+        },
+        "instructions": {
+            "inst1": {
+                "type": "LigoSim",
+                "simulation": "sim1",
+                "sequence_batch_size": 50,
+                'max_iterations': 100,
+                "export_p_gens": False,
+                "number_of_processes": 1
+            }
+        },
+        "output": {
+            "format": "HTML"
+        }
+    }
+
+    with open(path / "specs.yaml", "w") as file:
+        yaml.dump(specs, file)
+
+    return path / "specs.yaml"
+
+
+def test_shared_background_simulation():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / "integration_shared_background_simulation/")
+
+    specs_path = prepare_specs(path)
+
+    PathBuilder.build(path / "result/")
+
+    app = LigoApp(specification_path=specs_path, result_path=path / "result/")
+    app.run()
+
+    df = pd.read_csv(path / "result/inst1/exported_dataset/airr/batch1.tsv", sep="\t")
+    assert df.shape[0] == 200
+    assert df['signal1'].sum() == 100
+
+    # sequences are generated in one stream for both simulation items, so they finish in the same iteration
+    checkpoints = [LigoSimCheckpoint.load(path / f"result/inst1/{name}") for name in ['var1', 'var2']]
+    assert all(checkpoint.finished for checkpoint in checkpoints)
+    assert checkpoints[0].iteration == checkpoints[1].iteration
+
+    # each generated sequence is stored for at most one simulation item; var2 without signals gets only the sequences without signal1,
+    # which var1 cannot use
+    stored = {name: pd.read_csv(path / f"result/inst1/{name}/processed_sequences/{key}.tsv", sep="\t")
+              for name, key in [('var1', 'signal1'), ('var2', 'no_signal')]}
+    assert not (path / "result/inst1/var1/processed_sequences/no_signal.tsv").is_file()
+    assert not (path / "result/inst1/var2/processed_sequences/signal1.tsv").is_file()
+    assert stored['var1'].shape[0] == 100 and stored['var2'].shape[0] == 100
+    assert stored['var1']['signal1'].all() and not stored['var2']['signal1'].any()
+    assert len(set(stored['var1']['sequence']) & set(stored['var2']['sequence'])) == 0
+
+    shutil.rmtree(path)
@@ -0,0 +1,60 @@
+import shutil
+
+import dill
+import numpy as np
+
+from ligo.data_model.receptor.RegionType import RegionType
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+from ligo.environment.SequenceType import SequenceType
+from ligo.simulation.generative_models.ExperimentalImport import ExperimentalImport
+from ligo.util.PathBuilder import PathBuilder
+
+
+def _write_airr_file(path):
+    sequences = ["CASSLSPGLAYEQYF", "CASKVRIAATNEKLFF", "CSADSKNRGAGGEASSYEQYF", "CASIGGGTSLSYNEQFF", "CASICGCTSTDTQYF",
+                 "CASGKNRDSSAGQETQYF", "CASSLGQAYEQYF"]
+    with (path / "sequences.tsv").open("w") as file:
+        file.writelines(["sequence_id\tjunction_aa\tv_call\tj_call\tlocus\tproductive\n"] +
+                        [f"seq{index}\t{sequence}\tTRBV{index + 1}\tTRBJ2-7\tTRB\tT\n" for index, sequence in enumerate(sequences)])
+    return sequences
+
+
+def test_generate_sequences_in_memory():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / 'experimental_import')
+    sequences = _write_airr_file(path)
+
+    import_params = {'path': str(path / "sequences.tsv"), 'paired': False, 'region_type': 'IMGT_JUNCTION', 'sequence_file_size': 3}
+    model = ExperimentalImport.build_object(import_format='AIRR', import_params=import_params, tmp_import_path=str(path / "tmp"))
+
+    assert model.region_type == RegionType.IMGT_JUNCTION
+    assert model._sequence_store.chunk_count == 3
+
+    batch = model.generate_sequences_in_memory(5, seed=1, sequence_type=SequenceType.AMINO_ACID, compute_p_gen=False)
+    assert batch.sequence_aa.tolist() == sequences[:5]
+    assert batch.v_call.tolist() == [f"TRBV{index + 1}" for index in range(5)]
+    assert np.all(batch.p_gen == -1)
+    assert batch.chain.tolist() == ['TRB'] * 5
+
+    assert model.generate_sequences_in_memory(5, seed=1, sequence_type=SequenceType.AMINO_ACID, compute_p_gen=False).sequence_aa.tolist() \
+           == sequences[5:]
+
+    shuffled_model = ExperimentalImport.build_object(import_format='AIRR', import_params=import_params, tmp_import_path=str(path / "tmp2"),
+                                                     shuffle=True)
+    shuffled = [shuffled_model.generate_sequences_in_memory(3, seed=2, sequence_type=SequenceType.AMINO_ACID, compute_p_gen=False)
+                for _ in range(3)]
+    shuffled_sequences = [sequence for batch in shuffled for sequence in batch.sequence_aa.tolist()]
+
+    assert sorted(shuffled_sequences) == sorted(sequences)
+    assert shuffled_sequences == np.array(sequences)[np.random.default_rng(ExperimentalImport.SHUFFLE_SEED).permutation(len(sequences))].tolist()
+
+    shuffled_model = ExperimentalImport.build_object(import_format='AIRR', import_params=import_params, tmp_import_path=str(path / "tmp3"),
+                                                     shuffle=True)
+    first_copy, second_copy = dill.loads(dill.dumps(shuffled_model)), dill.loads(dill.dumps(shuffled_model))
+    second_copy._counter = 4
+    first_batch = first_copy.generate_sequences_in_memory(4, seed=3, sequence_type=SequenceType.AMINO_ACID, compute_p_gen=False)
+    second_batch = second_copy.generate_sequences_in_memory(4, seed=4, sequence_type=SequenceType.AMINO_ACID, compute_p_gen=False)
+
+    assert first_batch.sequence_aa.tolist() == shuffled_sequences[:4]
+    assert sorted(first_batch.sequence_aa.tolist() + second_batch.sequence_aa.tolist()) == sorted(sequences)
+
+    shutil.rmtree(path)
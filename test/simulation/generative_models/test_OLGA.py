@@ -0,0 +1,187 @@
+import shutil
+
+import dill
+import numpy as np
+
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+from ligo.environment.SequenceType import SequenceType
+from ligo.simulation.generative_models.BackgroundSequences import BackgroundSequences
+from ligo.simulation.generative_models.OLGA import OLGA
+from ligo.simulation.generative_models.OlgaPGenEngine import OlgaPGenEngine
+from ligo.simulation.util.util import get_bnp_data
+from ligo.util.PathBuilder import PathBuilder
+
+
+def test_generate_sequences_in_memory():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / 'olga_in_memory')
+    model = OLGA.build_object(default_model_name='humanTRB')
+
+    sequences = model.generate_sequences_in_memory(10, seed=1, sequence_type=SequenceType.AMINO_ACID, compute_p_gen=True)
+
+    assert isinstance(sequences, BackgroundSequences)
+    assert len(sequences) == 10
+    assert np.all(sequences.p_gen > 0)
+    assert np.all(sequences.from_default_model == 1)
+    assert all(seq.to_string() == 'TRB' for seq in sequences.chain)
+
+    skewed = model.generate_from_skewed_gene_models_in_memory(['TRBV20-1'], [], seed=1,
+                                                              sequence_type=SequenceType.AMINO_ACID, batch_size=5,
+                                                              compute_p_gen=False)
+
+    assert len(skewed) == 5
+    assert all(v_call.to_string().startswith('TRBV20-1') for v_call in skewed.v_call)
+    assert np.all(skewed.from_default_model == 0)
+    assert np.all(skewed.p_gen == -1)
+
+    skewed = model.generate_from_skewed_gene_models_in_memory(['TRBV20-1'], [], seed=2,
+                                                              sequence_type=SequenceType.AMINO_ACID, batch_size=5,
+                                                              compute_p_gen=False)
+    assert all(v_call.to_string().startswith('TRBV20-1') for v_call in skewed.v_call)
+    assert not (path / 'skewed_model').exists()
+    assert list(model._skewed_models.keys()) == [(('TRBV20-1',), ())]
+
+    model.generate_sequences(5, seed=1, path=path / 'sequences.tsv', sequence_type=SequenceType.AMINO_ACID, compute_p_gen=False)
+    assert len(get_bnp_data(path / 'sequences.tsv', BackgroundSequences)) == 5
+
+    shutil.rmtree(path)
+
+
+def test_compute_p_gens():
+    model = OLGA.build_object(default_model_name='humanTRA')
+
+    np.random.seed(3)
+    sequences = model.generate_sequences_in_memory(5, seed=3, sequence_type=SequenceType.NUCLEOTIDE, compute_p_gen=True)
+    np.random.seed(3)
+    same_sequences = model.generate_sequences_in_memory(5, seed=3, sequence_type=SequenceType.NUCLEOTIDE, compute_p_gen=False)
+
+    assert sequences.sequence.tolist() == same_sequences.sequence.tolist()
+    assert sequences.v_call.tolist() == same_sequences.v_call.tolist()
+
+    p_gens = model.compute_p_gens(sequences, SequenceType.NUCLEOTIDE)
+    assert isinstance(p_gens, np.ndarray)
+    assert np.allclose(p_gens, sequences.p_gen)
+    assert np.isclose(model.compute_p_gen({'sequence': sequences.sequence[0].to_string(), 'v_call': sequences.v_call[0].to_string(),
+                                           'j_call': sequences.j_call[0].to_string()}, SequenceType.NUCLEOTIDE), p_gens[0])
+
+    assert len(model.generate_sequences_in_memory(0, seed=3, sequence_type=SequenceType.NUCLEOTIDE, compute_p_gen=True)) == 0
+
+    np.random.seed(7)
+    state = np.random.get_state()
+    model.generate_sequences_in_memory(5, seed=3, sequence_type=SequenceType.NUCLEOTIDE, compute_p_gen=False)
+    assert np.array_equal(np.random.get_state()[1], state[1]) and np.random.get_state()[2] == state[2]
+
+
+def test_p_gen_cache():
+    model = OLGA.build_object(default_model_name='humanTRB')
+    assert model.get_p_gen_stats() == {}
+
+    sequences = model.generate_sequences_in_memory(5, seed=2, sequence_type=SequenceType.AMINO_ACID, compute_p_gen=True)
+    assert model.get_p_gen_stats()['misses'] == 5 and model.get_p_gen_stats()['hits'] == 0
+
+    p_gens = model.compute_p_gens(sequences, SequenceType.AMINO_ACID)
+    assert np.array_equal(p_gens, sequences.p_gen)
+    assert model.get_p_gen_stats()['misses'] == 5 and model.get_p_gen_stats()['hits'] == 5
+
+    model.compute_p_gens(sequences, SequenceType.NUCLEOTIDE)
+    assert model.get_p_gen_stats()['misses'] == 10
+
+    engine = OlgaPGenEngine(model._olga_model, model.is_vdj, cache_size=2)
+    engine.compute_many(sequences.sequence_aa.tolist(), sequences.v_call.tolist(), sequences.j_call.tolist(), SequenceType.AMINO_ACID)
+    engine.compute(sequences.sequence_aa[0].to_string(), sequences.v_call[0].to_string(), sequences.j_call[0].to_string(),
+                   SequenceType.AMINO_ACID)
+    assert engine.get_stats()['hits'] == 0 and engine.get_stats()['misses'] == 6 and len(engine._cache) == 2
+
+    copied_model = dill.loads(dill.dumps(model))
+    assert copied_model.get_p_gen_stats() == {'hits': 0, 'misses': 0, 'time': 0.}
+    assert np.array_equal(copied_model.compute_p_gens(sequences, SequenceType.AMINO_ACID), p_gens)
+
+
+def test_generate_sequences_in_parallel():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / 'olga_parallel')
+    model = OLGA.build_object(default_model_name='humanTRB', number_of_processes=2)
+
+    sequences = model.generate_sequences_in_memory(11, seed=5, sequence_type=SequenceType.AMINO_ACID, compute_p_gen=True)
+    same_sequences = model.generate_sequences_in_memory(11, seed=5, sequence_type=SequenceType.AMINO_ACID, compute_p_gen=False)
+    other_sequences = model.generate_sequences_in_memory(11, seed=6, sequence_type=SequenceType.AMINO_ACID, compute_p_gen=False)
+
+    assert len(sequences) == 11
+    assert np.all(sequences.p_gen > 0)
+    assert sequences.sequence_aa.tolist() == same_sequences.sequence_aa.tolist()
+    assert sequences.sequence_aa.tolist() != other_sequences.sequence_aa.tolist()
+
+    first_chunk_seed = int(np.random.SeedSequence(5).spawn(2)[0].generate_state(1)[0])
+    first_chunk = model._generate_chunk(6, first_chunk_seed, False, SequenceType.AMINO_ACID)
+    assert first_chunk.sequence_aa.tolist() == sequences.sequence_aa.tolist()[:6]
+
+    skewed = model.generate_from_skewed_gene_models_in_memory(['TRBV20-1'], [], seed=1,
+                                                              sequence_type=SequenceType.AMINO_ACID, batch_size=5,
+                                                              compute_p_gen=False)
+    assert all(v_call.startswith('TRBV20-1') for v_call in skewed.v_call.tolist())
+    assert np.all(skewed.from_default_model == 0)
+
+    pool = model._pool
+    assert pool is not None
+    model.generate_sequences_in_memory(4, seed=7, sequence_type=SequenceType.AMINO_ACID, compute_p_gen=False)
+    assert model._pool is pool and dill.loads(dill.dumps(model))._pool is None
+
+    model.close()
+    assert model._pool is None
+
+    shutil.rmtree(path)
+
+
+def test_compute_p_gens_in_parallel():
+    model = OLGA.build_object(default_model_name='humanTRB', number_of_processes=2)
+    sequences = model.generate_sequences_in_memory(120, seed=4, sequence_type=SequenceType.NUCLEOTIDE, compute_p_gen=False)
+
+    p_gens = model.compute_p_gens(sequences, SequenceType.NUCLEOTIDE)
+    expected = OLGA.build_object(default_model_name='humanTRB').compute_p_gens(sequences, SequenceType.NUCLEOTIDE)
+
+    assert isinstance(p_gens, np.ndarray) and len(p_gens) == 120
+    assert np.allclose(p_gens, expected)
+    assert model.get_p_gen_stats()['misses'] == len(set(zip(sequences.sequence.tolist(), sequences.v_call.tolist(),
+                                                            sequences.j_call.tolist())))
+    model.close()
+
+
+def test_set_number_of_processes():
+    model = OLGA.build_object(default_model_name='humanTRB')
+    model.set_number_of_processes(2)
+    assert model._get_number_of_processes() == 2
+
+    sequences = model.generate_sequences_in_memory(120, seed=4, sequence_type=SequenceType.NUCLEOTIDE, compute_p_gen=False)
+    nt_p_gens = model.compute_p_gens(sequences, SequenceType.NUCLEOTIDE)
+    pool = model._pool
+    aa_p_gens = model.compute_p_gens(sequences, SequenceType.AMINO_ACID)
+    assert pool is not None and model._pool is pool
+    assert np.all(nt_p_gens > 0) and np.all(aa_p_gens >= nt_p_gens)
+    model.close()
+
+    model = OLGA.build_object(default_model_name='humanTRB', number_of_processes=1)
+    model.set_number_of_processes(2)
+    assert model._get_number_of_processes() == 1
+
+
+def test_load_model_from_cache():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / 'olga_model_cache')
+    previous_cache_path = EnvironmentSettings.cache_path
+    EnvironmentSettings.set_cache_path(path / "cache")
+
+    model = OLGA.build_object(default_model_name='humanTRA')
+    parsed_model = model.load_model()
+    assert len(list((path / "cache" / OLGA.MODEL_CACHE_FOLDER).glob("*.pickle"))) == 1
+
+    cached_model = model.load_model()
+    assert cached_model.v_gene_mapping == parsed_model.v_gene_mapping
+    assert np.array_equal(cached_model.olga_gen_model.PVJ, parsed_model.olga_gen_model.PVJ)
+
+    OLGA.build_object(default_model_name='humanTRB').load_model()
+    assert len(list((path / "cache" / OLGA.MODEL_CACHE_FOLDER).glob("*.pickle"))) == 2
+
+    (path / "not_a_directory").write_text("")
+    EnvironmentSettings.set_cache_path(path / "not_a_directory")
+    uncached_model = OLGA.build_object(default_model_name='humanTRA').load_model()
+    assert uncached_model.v_gene_mapping == parsed_model.v_gene_mapping
+
+    EnvironmentSettings.set_cache_path(previous_cache_path)
+    shutil.rmtree(path)
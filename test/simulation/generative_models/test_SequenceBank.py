@@ -0,0 +1,43 @@
+import shutil
+
+import numpy as np
+
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+from ligo.environment.SequenceType import SequenceType
+from ligo.simulation.generative_models.SequenceBank import SequenceBank
+from ligo.util.PathBuilder import PathBuilder
+
+
+def _build_bank(path):
+    return SequenceBank.build_object(generative_model={'type': 'VectorisedOLGA', 'default_model_name': 'humanTRB'}, path=str(path),
+                                     bank_size=40, p_gen_sequence_type='AMINO_ACID')
+
+
+def test_generate_sequences_in_memory():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / 'sequence_bank')
+
+    bank = _build_bank(path / "bank")
+    sequences = bank.generate_sequences_in_memory(30, 1, SequenceType.AMINO_ACID, compute_p_gen=True)
+    bank._wait_for_refill()
+
+    assert len(sequences) == 30
+    assert np.all(np.asarray(sequences.p_gen) > 0)
+    assert bank.get_unused_count() == 50
+
+    other_bank = _build_bank(path / "bank")
+    other_sequences = other_bank.generate_sequences_in_memory(50, 1, SequenceType.NUCLEOTIDE, compute_p_gen=False)
+
+    assert len(other_sequences) == 50
+    assert len(set(sequences.sequence.tolist() + other_sequences.sequence.tolist())) == 80
+    assert bank.is_same(other_bank)
+
+    other_bank._wait_for_refill()
+    with other_bank._open_manifest() as manifest:
+        assert manifest['offset'] == 0 and [index for index, _ in manifest['chunks']] == [2]
+    assert sorted(file.name for file in (path / "bank").glob("chunk*_sequence_aa.npy")) == ["chunk000002_sequence_aa.npy"]
+
+    other_bank._wait_for_refill()
+    nt_sequences = other_bank.generate_sequences_in_memory(5, 1, SequenceType.NUCLEOTIDE, compute_p_gen=True)
+    assert np.allclose(nt_sequences.p_gen, other_bank.compute_p_gens(nt_sequences, SequenceType.NUCLEOTIDE))
+
+    shutil.rmtree(path)
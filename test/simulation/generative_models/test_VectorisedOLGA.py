@@ -0,0 +1,56 @@
+import shutil
+from collections import Counter
+
+import numpy as np
+from olga.utils import nt2aa
+
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+from ligo.environment.SequenceType import SequenceType
+from ligo.simulation.generative_models.OLGA import OLGA
+from ligo.simulation.generative_models.VectorisedOLGA import VectorisedOLGA
+from ligo.util.PathBuilder import PathBuilder
+
+
+def _total_variation_distance(values1: list, values2: list) -> float:
+    counts1, counts2 = Counter(values1), Counter(values2)
+    return 0.5 * sum(abs(counts1[key] / len(values1) - counts2[key] / len(values2)) for key in set(counts1) | set(counts2))
+
+
+def test_distribution_equivalence():
+    for default_model_name in ['humanTRB', 'humanTRA']:
+        sequences = VectorisedOLGA.build_object(default_model_name=default_model_name)\
+            .generate_sequences_in_memory(20000, seed=1, sequence_type=SequenceType.AMINO_ACID, compute_p_gen=False)
+        olga_sequences = OLGA.build_object(default_model_name=default_model_name)\
+            .generate_sequences_in_memory(5000, seed=1, sequence_type=SequenceType.AMINO_ACID, compute_p_gen=False)
+
+        assert len(sequences) == 20000
+        assert _total_variation_distance([len(seq) for seq in sequences.sequence_aa.tolist()],
+                                         [len(seq) for seq in olga_sequences.sequence_aa.tolist()]) < 0.05
+        assert _total_variation_distance(sequences.v_call.tolist(), olga_sequences.v_call.tolist()) < 0.07
+        assert _total_variation_distance(sequences.j_call.tolist(), olga_sequences.j_call.tolist()) < 0.05
+
+        for sequence, sequence_aa in zip(sequences.sequence.tolist()[:1000], sequences.sequence_aa.tolist()[:1000]):
+            assert nt2aa(sequence) == sequence_aa
+            assert sequence_aa[0] == 'C' and sequence_aa[-1] in 'FVW' and '*' not in sequence_aa
+
+
+def test_generate_sequences():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / 'vectorised_olga')
+    model = VectorisedOLGA.build_object(default_model_name='humanTRB')
+
+    sequences = model.generate_sequences_in_memory(10, seed=2, sequence_type=SequenceType.AMINO_ACID, compute_p_gen=True)
+    assert np.all(sequences.p_gen > 0)
+    assert sequences.sequence_aa.tolist() == \
+           model.generate_sequences_in_memory(10, seed=2, sequence_type=SequenceType.AMINO_ACID, compute_p_gen=False).sequence_aa.tolist()
+
+    skewed = model.generate_from_skewed_gene_models_in_memory(['TRBV20-1'], ['TRBJ2-7'], seed=1,
+                                                              sequence_type=SequenceType.AMINO_ACID, batch_size=20, compute_p_gen=False)
+    assert len(skewed) == 20
+    assert all(v_call.startswith('TRBV20-1') for v_call in skewed.v_call.tolist())
+    assert all(j_call.startswith('TRBJ2-7') for j_call in skewed.j_call.tolist())
+    assert np.all(skewed.from_default_model == 0)
+
+    model.generate_sequences(5, seed=1, path=path / 'sequences.tsv', sequence_type=SequenceType.AMINO_ACID, compute_p_gen=False)
+    assert (path / 'sequences.tsv').is_file()
+
+    shutil.rmtree(path)
@@ -4,6 +4,8 @@ from ligo.simulation.generative_models.BackgroundSequences import BackgroundSequ
 from ligo.simulation.implants.SeedMotif import SeedMotif
 from ligo.simulation.implants.Signal import Signal
 from ligo.simulation.simulation_strategy.ImplantingStrategy import ImplantingStrategy
+from ligo.simulation.util.MotifMatcher import MotifMatcher
+from ligo.simulation.util.util import annotate_sequences, make_annotated_dataclass
 
 
 def test_implanting():
@@ -16,3 +18,29 @@ def test_implanting():
                                                             SimConfigItem({s1: 1.}), [s1], False)
 
     print(processed_seqs)
+
+
+class _CountingMotifMatcher(MotifMatcher):
+    def __init__(self, signals, sequence_type):
+        super().__init__(signals, sequence_type)
+        self.calls = 0
+
+    def match(self, sequence_array):
+        self.calls += 1
+        return super().match(sequence_array)
+
+
+def test_implanting_with_motif_matcher():
+    s1 = Signal('s1', [SeedMotif('m1', 'AAA')], {'104': 0, '105': 0})
+    seqs = BackgroundSequences(sequence=["CCCCC", "CCCCCCCCC"], sequence_aa=["A", "AA"], v_call=["", ""], j_call=["", ""],
+                               region_type=["IMGT_JUNCTION", "IMGT_JUNCTION"], frame_type=["", ""], p_gen=[-1., -1.], from_default_model=[1, 1],
+                               duplicate_count=[1, 1], chain=["TRB", "TRB"])
+    motif_matcher = _CountingMotifMatcher([s1], SequenceType.NUCLEOTIDE)
+    seqs = annotate_sequences(seqs, False, [s1], make_annotated_dataclass([('s1', int), ('s1_positions', str), ('signals_aggregated', str)],
+                                                                           [s1]), motif_matcher=motif_matcher)
+
+    processed_seqs = ImplantingStrategy().process_sequences(seqs, {'s1': 2}, False, SequenceType.NUCLEOTIDE,
+                                                            SimConfigItem({s1: 1.}), [s1], True, motif_matcher=motif_matcher)
+
+    assert motif_matcher.calls == 2
+    assert processed_seqs.s1.tolist() == [1, 1]
@@ -0,0 +1,63 @@
+import math
+import shutil
+
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+from ligo.simulation.BatchSizeController import BatchSizeController
+from ligo.simulation.LigoSimCheckpoint import LigoSimCheckpoint
+from ligo.util.PathBuilder import PathBuilder
+
+
+def test_batch_size_controller():
+    controller = BatchSizeController(initial_batch_size=100, target_iterations=5, max_batch_size=1000)
+
+    assert controller.next_batch_size({'signal1': 50, 'no_signal': 50}, 1) == 100
+
+    controller.update(100, {'signal1': 50, 'no_signal': 50}, {'signal1': 48, 'no_signal': 0})
+
+    assert controller.acceptance_rates() == {'signal1': 0.02, 'no_signal': 0.5}
+    assert controller.predict_remaining_iterations({'signal1': 48, 'no_signal': 0}) == 24
+
+    # 48 sequences with acceptance rate 0.02 in the remaining 4 iterations, increased by the safety factor
+    assert controller.next_batch_size({'signal1': 48, 'no_signal': 0}, 2) == math.ceil(48 / 0.02 / 4 * 1.2)
+
+    controller.update(720, {'signal1': 48, 'no_signal': 0}, {'signal1': 30, 'no_signal': 0})
+
+    assert controller.next_batch_size({'signal1': 30, 'no_signal': 0}, 10) == 1000
+    assert controller.next_batch_size({'signal1': 1, 'no_signal': 0}, 10) == math.ceil(1 / (20 / 820) * 1.2)
+
+
+def test_batch_size_controller_without_accepted_sequences():
+    controller = BatchSizeController(initial_batch_size=100, target_iterations=5, max_batch_size=300)
+
+    controller.update(100, {'signal1': 10}, {'signal1': 10})
+
+    assert controller.predict_remaining_iterations({'signal1': 10}) == math.inf
+    assert controller.next_batch_size({'signal1': 10}, 2) == 200
+    assert controller.next_batch_size({'signal1': 10}, 3) == 300
+
+
+def test_batch_size_controller_caps_initial_batch_size():
+    controller = BatchSizeController(initial_batch_size=5000, target_iterations=5, max_batch_size=1000)
+
+    assert controller.batch_size == 1000
+    assert controller.next_batch_size({'signal1': 10}, 1) == 1000
+
+
+def test_batch_size_controller_state():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / 'batch_size_controller_state')
+    controller = BatchSizeController(initial_batch_size=100, target_iterations=5, max_batch_size=1000)
+    controller.update(100, {('sim_item1', 'signal1'): 50, ('sim_item1', 'no_signal'): 50},
+                      {('sim_item1', 'signal1'): 48, ('sim_item1', 'no_signal'): 0})
+    controller.next_batch_size({('sim_item1', 'signal1'): 48, ('sim_item1', 'no_signal'): 0}, 2)
+
+    LigoSimCheckpoint.make(3, {'signal1': 48}, {}, batch_size_controller_state=controller.get_state()).store(path)
+
+    restored = BatchSizeController(initial_batch_size=100, target_iterations=5, max_batch_size=1000)
+    restored.set_state(LigoSimCheckpoint.load(path).batch_size_controller_state)
+
+    assert restored.batch_size == controller.batch_size
+    assert restored.acceptance_rates() == controller.acceptance_rates()
+    assert restored.next_batch_size({('sim_item1', 'signal1'): 30, ('sim_item1', 'no_signal'): 0}, 3) \
+           == controller.next_batch_size({('sim_item1', 'signal1'): 30, ('sim_item1', 'no_signal'): 0}, 3)
+
+    shutil.rmtree(path)
@@ -0,0 +1,55 @@
+import shutil
+
+import pandas as pd
+
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+from ligo.simulation.IterationMetrics import IterationMetrics
+from ligo.util.PathBuilder import PathBuilder
+
+
+class _PGenCountingModel:
+    def __init__(self, hits: int):
+        self.calls = 0
+        self.hits = hits
+
+    def get_p_gen_stats(self):
+        self.calls += 1
+        return {'hits': self.hits * (self.calls - 1), 'misses': self.calls - 1, 'time': 0.}
+
+
+def test_iteration_metrics():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / 'iteration_metrics')
+
+    assert IterationMetrics.summarise(path) == {}
+
+    for iteration in [1, 2]:
+        metrics = IterationMetrics(sim_items=['sim_item1'], iteration=iteration, batch_size=100, generated=100, bytes_written=50)
+        with metrics.time('generation'), metrics.track_p_gens(_PGenCountingModel(iteration)):
+            pass
+        metrics.found = {'sim_item1': {'signal1': 10, 'no_signal': 90}}
+        metrics.add_accepted('sim_item1', {'signal1': 15, 'no_signal': 30}, {'signal1': 10 - iteration, 'no_signal': 0})
+        metrics.store(path)
+
+    records = IterationMetrics.load(path)
+    assert [record.iteration for record in records] == [1, 2]
+    assert records[0].accepted == {'sim_item1': {'signal1': 6, 'no_signal': 30}}
+    assert records[0].rejected == {'sim_item1': {'signal1': 4, 'no_signal': 60}}
+    assert records[0].stage_times['generation'] >= 0
+
+    paths = IterationMetrics.summarise(path)
+
+    stages = pd.read_csv(paths['stages'])
+    assert stages.shape[0] == 1
+    assert stages['iterations'][0] == 2 and stages['generated'][0] == 200 and stages['bytes_written'][0] == 100
+    assert all(stage in stages.columns for stage in IterationMetrics.STAGES)
+    assert stages['p_gen_cache_hits'][0] == 3 and stages['p_gen_cache_misses'][0] == 2
+
+    signals = pd.read_csv(paths['signals'])
+    assert signals.set_index('signal')['accepted'].to_dict() == {'signal1': 13, 'no_signal': 60}
+    assert signals.set_index('signal')['rejected'].to_dict() == {'signal1': 7, 'no_signal': 120}
+
+    IterationMetrics(sim_items=['sim_item2'], iteration=2, batch_size=100).store(path)
+    IterationMetrics.remove_from_iteration(path, ['sim_item1'], 2)
+    assert [(record.sim_items, record.iteration) for record in IterationMetrics.load(path)] == [(['sim_item1'], 1), (['sim_item2'], 2)]
+
+    shutil.rmtree(path)
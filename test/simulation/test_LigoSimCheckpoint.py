@@ -0,0 +1,42 @@
+import shutil
+
+import numpy as np
+
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+from ligo.simulation.LigoSimCheckpoint import LigoSimCheckpoint
+from ligo.util.PathBuilder import PathBuilder
+
+
+def test_checkpoint():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / 'ligo_sim_checkpoint')
+    seq_paths = {'signal1': path / 'signal1.tsv', 'no_signal': path / 'no_signal.tsv'}
+    seq_paths['signal1'].write_text("sequence_aa\nCASSF\n")
+
+    assert LigoSimCheckpoint.load(path) is None
+
+    np.random.seed(5)
+    LigoSimCheckpoint.make(3, {'signal1': np.int64(10), 'no_signal': 20}, seq_paths,
+                           target_p_gen_histogram=np.array([0.5, 0.5]), p_gen_bins=np.array([-20., -10., 0.]),
+                           generative_model_state={'counter': 150}).store(path)
+    expected_numbers = np.random.rand(3)
+
+    with seq_paths['signal1'].open('a') as file:
+        file.write("CASSG\n")
+    seq_paths['no_signal'].write_text("sequence_aa\nCASSL\n")
+
+    checkpoint = LigoSimCheckpoint.load(path)
+
+    assert checkpoint.iteration == 3
+    assert checkpoint.seqs_per_signal_count == {'signal1': 10, 'no_signal': 20}
+    assert checkpoint.target_p_gen_histogram == [0.5, 0.5]
+    assert checkpoint.generative_model_state == {'counter': 150}
+    assert not checkpoint.finished
+
+    checkpoint.restore_files(seq_paths)
+    checkpoint.restore_random_state()
+
+    assert seq_paths['signal1'].read_text() == "sequence_aa\nCASSF\n"
+    assert not seq_paths['no_signal'].is_file()
+    assert np.array_equal(np.random.rand(3), expected_numbers)
+
+    shutil.rmtree(path)
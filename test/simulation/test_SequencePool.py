@@ -0,0 +1,30 @@
+import shutil
+
+from ligo.environment.EnvironmentSettings import EnvironmentSettings
+from ligo.simulation.SequencePool import SequencePool
+from ligo.simulation.generative_models.BackgroundSequences import BackgroundSequences
+from ligo.util.PathBuilder import PathBuilder
+from test.simulation.util.test_util import get_sequences
+
+
+def test_sequence_pool():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / 'sequence_pool')
+    all_sequences = get_sequences(path / 'no_signal.tsv')
+
+    with SequencePool({'no_signal': path / 'no_signal.tsv', 'signal1': path / 'signal1.tsv'}, BackgroundSequences,
+                      chunk_size=100) as pool:
+
+        assert pool.take('signal1', 3) is None
+
+        first = pool.take('no_signal', 5)
+        second = pool.take('no_signal', 4)
+        rest = pool.take('no_signal', 10)
+
+        assert [len(first), len(second), len(rest)] == [5, 4, 3]
+        assert first.sequence_aa.tolist() == all_sequences[:5].sequence_aa.tolist()
+        assert second.sequence_aa.tolist() == all_sequences[5:9].sequence_aa.tolist()
+        assert rest.sequence_aa.tolist() == all_sequences[9:].sequence_aa.tolist()
+        assert len(pool.take('no_signal', 2)) == 0
+        assert pool.used_seq_count['no_signal'] == 12
+
+    shutil.rmtree(path)
@@ -0,0 +1,50 @@
+import random
+import re
+
+import bionumpy as bnp
+
+from ligo.environment.SequenceType import SequenceType
+from ligo.simulation.implants.SeedMotif import SeedMotif
+from ligo.simulation.implants.Signal import Signal
+from ligo.simulation.util.MotifMatcher import MotifMatcher, expand_motif_regex
+
+
+def test_expand_motif_regex():
+    assert expand_motif_regex("A[CD].{0,1}E") == ("ACE", "AC.E", "ADE", "AD.E")
+    assert expand_motif_regex("A.C") == ("A.C",)
+
+
+def test_match():
+    signals = [Signal('signal1', motifs=[SeedMotif('motif1', seed='AC/D', min_gap=0, max_gap=1)]),
+               Signal('signal2', motifs=[SeedMotif('motif2', seed='CD', hamming_distance_probabilities={0: 0.5, 1: 0.5},
+                                                   position_weights={0: 1, 1: 0}),
+                                         [SeedMotif('motif3', seed='AC'), SeedMotif('motif4', seed='EE')]])]
+    sequences = bnp.as_encoded_array(["ACDEE", "AACED", "CAC", "DAC"], bnp.AminoAcidEncoding)
+
+    matches = MotifMatcher(signals, SequenceType.AMINO_ACID).match(sequences)
+
+    assert matches[('signal1', 0, 0)].tolist() == [[True, False, False, False, False], [False, True, False, False, False],
+                                                   [False, False, False], [False, False, False]]
+    assert matches[('signal2', 0, 0)].tolist() == [[False, True, False, False, False], [False, False, False, True, False],
+                                                   [False, False, False], [False, False, False]]
+    assert matches[('signal2', 1, 0)].tolist() == [[True, False, False, False, False], [False, True, False, False, False],
+                                                   [False, True, False], [False, True, False]]
+    assert matches[('signal2', 1, 1)].tolist() == [[False, False, False, True, False], [False] * 5, [False] * 3, [False] * 3]
+
+
+def test_match_hamming_distance():
+    motifs = [SeedMotif('motif1', seed='CAS/L', min_gap=1, max_gap=2, hamming_distance_probabilities={0: 0.5, 2: 0.5}),
+              SeedMotif('motif2', seed='GAS', hamming_distance_probabilities={1: 1.}, position_weights={0: 0.5, 1: 0., 2: 0.5},
+                        alphabet_weights={'A': 0.5, 'L': 0.5}),
+              SeedMotif('motif3', seed='ASSL', hamming_distance_probabilities={1: 0.7, 3: 0.3}, alphabet_weights={'S': 0.4, 'G': 0.6})]
+    random.seed(1)
+    sequences = ["".join(random.choices("ACGLS", k=random.randint(3, 15))) for _ in range(500)]
+
+    matches = MotifMatcher([Signal(f'signal{index}', motifs=[motif]) for index, motif in enumerate(motifs)],
+                           SequenceType.AMINO_ACID).match(bnp.as_encoded_array(sequences, bnp.AminoAcidEncoding))
+
+    for index, motif in enumerate(motifs):
+        regexes = [re.compile(regex) for regex in motif.get_all_possible_instances(SequenceType.AMINO_ACID)]
+        expected = [[any(regex.match(sequence, position) for regex in regexes) for position in range(len(sequence))]
+                    for sequence in sequences]
+        assert matches[(f'signal{index}', 0, 0)].tolist() == expected
@@ -1,8 +1,11 @@
 import shutil
 from unittest import TestCase
 
+import numpy as np
+
 from ligo.environment.EnvironmentSettings import EnvironmentSettings
-from ligo.simulation.util.igor_helper import _import_genes_from_model_params
+from ligo.simulation.generative_models.OLGA import OLGA
+from ligo.simulation.util.igor_helper import _import_genes_from_model_params, make_skewed_model, make_skewed_model_files
 from ligo.util.PathBuilder import PathBuilder
 
 
@@ -459,3 +462,34 @@ class IGoRHelperTest(TestCase):
 
         shutil.rmtree(path)
 
+    def test_make_skewed_model(self):
+        path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / "igor_helper_skewed_model")
+
+        model = OLGA.build_object(default_model_name='humanTRB')
+        olga_model = model.load_model()
+        original_pv = olga_model.olga_gen_model.PV.copy()
+
+        skewed = make_skewed_model(olga_model.olga_gen_model, olga_model.v_gene_mapping, olga_model.j_gene_mapping,
+                                   ['TRBV20-1', 'TRBV7-9'], ['TRBJ2-7'])
+        expected = model.load_model(make_skewed_model_files(['TRBV20-1', 'TRBV7-9'], ['TRBJ2-7'], model.model_path, path)).olga_gen_model
+
+        self.assertTrue(np.allclose(skewed.PV, expected.PV))
+        self.assertTrue(np.allclose(skewed.PDJ, expected.PDJ))
+        self.assertTrue(np.array_equal(olga_model.olga_gen_model.PV, original_pv))
+
+        model = OLGA.build_object(default_model_name='humanTRA')
+        olga_model = model.load_model()
+        p_vj = olga_model.olga_gen_model.PVJ
+
+        skewed = make_skewed_model(olga_model.olga_gen_model, olga_model.v_gene_mapping, olga_model.j_gene_mapping, ['TRAV12-2'],
+                                   ['TRAJ33', 'TRAJ42'])
+        v_mask = np.array(['TRAV12-2' in gene for gene in olga_model.v_gene_mapping])
+        j_mask = np.array(['TRAJ33' in gene or 'TRAJ42' in gene for gene in olga_model.j_gene_mapping])
+
+        self.assertTrue(np.isclose(skewed.PVJ.sum(), 1))
+        self.assertEqual(skewed.PVJ[~v_mask].sum(), 0)
+        self.assertEqual(skewed.PVJ[:, ~j_mask].sum(), 0)
+        p_j_given_v = p_vj[v_mask][:, j_mask] / p_vj[v_mask][:, j_mask].sum(axis=1, keepdims=True)
+        self.assertTrue(np.allclose(skewed.PVJ[v_mask][:, j_mask] / skewed.PVJ[v_mask][:, j_mask].sum(axis=1, keepdims=True), p_j_given_v))
+
+        shutil.rmtree(path)
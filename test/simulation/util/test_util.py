@@ -1,11 +1,22 @@
 import shutil
 from pathlib import Path
 
+import numpy as np
+from npstructures import RaggedArray
+
+from ligo.data_model.receptor.ReceptorBuilder import ReceptorBuilder
+from ligo.data_model.receptor.TCABReceptor import TCABReceptor
+from ligo.data_model.receptor.receptor_sequence.Chain import Chain
+from ligo.data_model.receptor.receptor_sequence.ReceptorSequence import ReceptorSequence
+from ligo.data_model.receptor.receptor_sequence.SequenceMetadata import SequenceMetadata
 from ligo.environment.EnvironmentSettings import EnvironmentSettings
 from ligo.simulation.generative_models.BackgroundSequences import BackgroundSequences
 from ligo.simulation.implants.LigoPWM import LigoPWM
+from ligo.simulation.implants.SeedMotif import SeedMotif
 from ligo.simulation.implants.Signal import Signal
-from ligo.simulation.util.util import annotate_sequences, get_bnp_data, make_annotated_dataclass
+from ligo.simulation.util.util import annotate_sequences, pack_signal_positions, unpack_signal_positions, count_signal_positions, \
+    make_packed_signal_positions, get_bnp_data, make_annotated_dataclass, make_custom_params_columns, make_sequence_columns, \
+    make_receptor_columns, apply_custom_func_per_sequence, make_custom_func_pool
 from ligo.util.PathBuilder import PathBuilder
 
 
@@ -73,3 +84,119 @@ def test_annotate_sequences():
     annotate_sequences(sequences, is_amino_acid=True, all_signals=signals, annotated_dc=dc, sim_item_name='sim_item')
 
     shutil.rmtree(path)
+
+
+def test_annotate_sequences_with_custom_functions():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / 'annotate_sequences_custom_func')
+    sequences = get_sequences(path / 'sequences.tsv')
+
+    def is_present(sequence_aa, sequence, v_call, j_call):
+        return 'AS' in sequence_aa and v_call.startswith('TRBV2')
+
+    def is_present_batched(sequence_aa, v_call):
+        return np.array(['AS' in seq and v.startswith('TRBV2') for seq, v in zip(sequence_aa, v_call)])
+
+    signals = [Signal(id='signal1', is_present_custom_func=is_present),
+               Signal(id='signal2', is_present_custom_func=is_present_batched,
+                      custom_func_batch_columns={'sequence_aa': True, 'v_call': True})]
+
+    dc = make_annotated_dataclass(annotation_fields=sorted(
+        [('signal1', int), ('signal2', int), ('signals_aggregated', str), ('signal1_positions', str), ('signal2_positions', str)]),
+        signals=signals)
+
+    annotated = annotate_sequences(sequences, is_amino_acid=True, all_signals=signals, annotated_dc=dc, sim_item_name='sim_item')
+
+    assert annotated.signal1.tolist() == [0, 1, 0, 1, 0, 1, 0, 0, 0, 0, 0, 0]
+    assert annotated.signal2.tolist() == annotated.signal1.tolist()
+
+    shutil.rmtree(path)
+
+
+def test_apply_custom_func_per_sequence():
+    values = [str(value) for value in range(5000)]
+
+    signals = [Signal(id='signal1', is_present_custom_func=lambda value, other: value.endswith('7') and other == value),
+               Signal(id='signal2', is_present_custom_func=lambda value, other: value.startswith('1'))]
+
+    pool = make_custom_func_pool(signals, number_of_processes=2)
+    try:
+        for signal in signals:
+            is_present = apply_custom_func_per_sequence(signal, [values, values], pool, number_of_processes=2)
+            assert is_present.tolist() == [signal.is_present_custom_func(value, value) for value in values]
+    finally:
+        pool.close()
+        pool.join()
+
+    assert make_custom_func_pool(signals, number_of_processes=1) is None
+
+
+def make_expected_sequences(sequences, metadata: dict, immune_events: dict, custom_params: list, chain: Chain):
+    """Builds the receptor sequence objects with the metadata the columns are expected to encode"""
+    expected = []
+    for seq in sequences:
+        custom = {key: getattr(seq, key).to_string() if key_type == str else getattr(seq, key).item() for key, key_type in custom_params}
+        expected.append(ReceptorSequence(seq.sequence_aa.to_string(), seq.sequence.to_string(),
+                                         metadata=SequenceMetadata(custom_params={**metadata, **custom, **immune_events}, chain=chain,
+                                                                   v_call=seq.v_call.to_string(), j_call=seq.j_call.to_string(),
+                                                                   region_type=seq.region_type.to_string())))
+    return expected
+
+
+def test_make_sequence_columns():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / 'receptor_sequence_columns')
+    signals = [Signal(id='signal1', motifs=[SeedMotif(identifier='motif1', seed='AS')], sequence_position_weights={})]
+    fields = [('signal1', int), ('signal1_positions', str), ('signals_aggregated', str)]
+    sequences = annotate_sequences(get_sequences(path / 'sequences.tsv'), is_amino_acid=True, all_signals=signals,
+                                   annotated_dc=make_annotated_dataclass(annotation_fields=fields, signals=signals))
+
+    params = dict(metadata={'signal1': True}, immune_events={'event1': 'a'},
+                  custom_params=fields + [('p_gen', float), ('from_default_model', int)])
+
+    expected = make_expected_sequences(sequences, chain=Chain.BETA, **params)
+    columns = make_sequence_columns(sequences, make_custom_params_columns(sequences, **params), Chain.BETA)
+
+    assert len(set(columns['identifier'])) == len(expected)
+    for index, sequence in enumerate(expected):
+        record = dict(zip(ReceptorSequence.get_record_names(), sequence.get_record()))
+        assert all(record[key] == columns[key][index] for key in record if key != 'identifier')
+
+    shutil.rmtree(path)
+
+
+def test_make_receptor_columns():
+    path = PathBuilder.remove_old_and_build(EnvironmentSettings.tmp_test_path / 'receptor_columns')
+    signals = [Signal(id='signal1', motifs=[SeedMotif(identifier='motif1', seed='AS')], sequence_position_weights={})]
+    fields = [('signal1', int), ('signal1_positions', str), ('signals_aggregated', str)]
+    sequences = annotate_sequences(get_sequences(path / 'sequences.tsv'), is_amino_acid=True, all_signals=signals,
+                                   annotated_dc=make_annotated_dataclass(annotation_fields=fields, signals=signals))
+
+    params = [dict(metadata={'signal1': True}, immune_events={'event1': 'a'}, custom_params=fields),
+              dict(metadata={'signal1': False}, immune_events={'event2': 'b'}, custom_params=fields)]
+
+    objects = [make_expected_sequences(sequences, chain=chain, **chain_params)
+               for chain, chain_params in zip([Chain.ALPHA, Chain.BETA], params)]
+    receptors = ReceptorBuilder.build_objects_from_pairs(*objects)
+
+    receptor_class = ReceptorBuilder.get_receptor_class([Chain.BETA, Chain.ALPHA])
+    assert receptor_class == TCABReceptor
+
+    custom_params = [make_custom_params_columns(sequences, **chain_params) for chain_params in params]
+    columns = make_receptor_columns(receptor_class, {'alpha': make_sequence_columns(sequences, custom_params[0], Chain.ALPHA),
+                                                     'beta': make_sequence_columns(sequences, custom_params[1], Chain.BETA)},
+                                    custom_params)
+
+    for index, receptor in enumerate(receptors):
+        record = dict(zip(receptor_class.get_record_names(), receptor.get_record()))
+        assert all(record[key] == columns[key][index] for key in record if 'identifier' not in key)
+
+    shutil.rmtree(path)
+
+
+def test_pack_signal_positions():
+    positions = [[False, True, False, False, False, True], [], [True]]
+    packed = pack_signal_positions(RaggedArray(positions, dtype=bool))
+
+    assert packed.tolist() == ['44', '', '8']
+    assert count_signal_positions(packed).tolist() == [2, 0, 1]
+    assert make_packed_signal_positions(6, 5) == '04' and make_packed_signal_positions(6) == '00'
+    assert unpack_signal_positions(packed, np.array([6, 3, 1])).tolist() == ['m010001', '', 'm1']
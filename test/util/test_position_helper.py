@@ -43,3 +43,17 @@ def test_get_imgt_position_weights_for_implanting():
 def test_get_allowed_positions_for_annotation():
     allowed_positions = PositionHelper.get_allowed_positions_for_annotation(34, RegionType.IMGT_JUNCTION, {})
     assert len(allowed_positions) == 34
+
+
+def test_get_allowed_positions_for_lengths():
+    weights = {'104': 0, '105': 0, '118': 0}
+    lengths = [7, 14, 34, 3, 100]
+    allowed_positions = PositionHelper.get_allowed_positions_for_lengths(np.array(lengths), RegionType.IMGT_JUNCTION, weights)
+
+    assert allowed_positions.tolist()[:3] == [PositionHelper.get_allowed_positions_for_annotation(length, RegionType.IMGT_JUNCTION, weights)
+                                              for length in lengths[:3]]
+    assert [len(row) for row in allowed_positions.tolist()] == lengths
+    assert not any(allowed_positions.tolist()[3]) and not any(allowed_positions.tolist()[4])
+
+    implanting_weights = PositionHelper.get_position_weights_for_implanting(7, RegionType.IMGT_JUNCTION, {'104': 0, '105': 0}, 2)
+    assert np.allclose(implanting_weights, [0, 0, 0.25, 0.25, 0.25, 0.25, 0])